@@ -0,0 +1,262 @@
+"""
+Benchmarks for the backend
+
+Usage:
+    python benchmark.py streaming [--tokens 20000] [--token-delay-ms 0.5]
+    python benchmark.py speculative CORPUS [CORPUS ...] [--methods off,ngram] [--max-chunks 32]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+
+def fake_token_stream(token_count: int, token_delay: float):
+    """Yield 1-3 character deltas the way vLLM streams them"""
+    rng = random.Random(0)
+    alphabet = "abcdefghijklmnopqrstuvwxyz    \n"
+    for _ in range(token_count):
+        if token_delay:
+            time.sleep(token_delay)
+        yield "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 3)))
+
+
+async def run_clean_stream(app, query: str, token_count: int, token_delay: float) -> dict:
+    """Drive /clean-markdown-stream through the ASGI app and count body frames"""
+    body = json.dumps({"markdown_content": "# Benchmark\n\ncontent"}).encode()
+    frames = 0
+    body_bytes = 0
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if request_sent:
+            await asyncio.sleep(3600)
+            return {"type": "http.disconnect"}
+        request_sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        nonlocal frames, body_bytes
+        if message["type"] == "http.response.body" and message.get("body"):
+            frames += 1
+            body_bytes += len(message["body"])
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/clean-markdown-stream",
+        "raw_path": b"/clean-markdown-stream",
+        "query_string": query.encode(),
+        "headers": [(b"content-type", b"application/json"), (b"host", b"benchmark")],
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+
+    with patch("vllm_manager.vllm_manager._is_vllm_running", return_value=True), \
+         patch("services.VLLMService.clean_markdown_content_stream",
+               side_effect=lambda content: fake_token_stream(token_count, token_delay)):
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        await app(scope, receive, send)
+        cpu_time = time.process_time() - cpu_start
+        wall_time = time.perf_counter() - wall_start
+
+    return {
+        "frames": frames,
+        "bytes": body_bytes,
+        "wall_seconds": wall_time,
+        "cpu_seconds": cpu_time,
+        "frames_per_second": frames / wall_time if wall_time else 0.0,
+    }
+
+
+def benchmark_streaming(args: argparse.Namespace) -> None:
+    """Compare per-token writes with coalesced writes on /clean-markdown-stream"""
+    import logging
+    logging.disable(logging.INFO)
+
+    from main import app
+
+    token_delay = args.token_delay_ms / 1000
+    scenarios = [
+        ("per-token (before)", "flush_interval_ms=0&flush_size=1"),
+        ("coalesced (after)", f"flush_interval_ms={args.flush_interval_ms}&flush_size={args.flush_size}"),
+    ]
+
+    print(f"Streaming {args.tokens} tokens, {args.token_delay_ms}ms between tokens")
+    print(f"{'mode':<22}{'frames':>10}{'frames/s':>12}{'wall s':>10}{'cpu s':>10}{'cpu us/token':>14}")
+    for name, query in scenarios:
+        result = asyncio.run(run_clean_stream(app, query, args.tokens, token_delay))
+        print(
+            f"{name:<22}{result['frames']:>10}{result['frames_per_second']:>12.0f}"
+            f"{result['wall_seconds']:>10.2f}{result['cpu_seconds']:>10.2f}"
+            f"{result['cpu_seconds'] / args.tokens * 1e6:>14.1f}"
+        )
+
+
+def split_into_chunks(text: str, chunk_size: int) -> list:
+    """Group paragraphs into chunks of about ``chunk_size`` characters"""
+    chunks = []
+    current = ""
+    for paragraph in text.split("\n\n"):
+        if current and len(current) + len(paragraph) > chunk_size:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
+async def load_corpus(paths: list, chunk_size: int) -> list:
+    """Extract PDFs and read Markdown/text files into cleaning-sized chunks"""
+    from services import PAGE_SEPARATOR, PDFConverterService
+
+    files = []
+    for path in map(Path, paths):
+        files.extend(sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path])
+
+    pdf_service = PDFConverterService()
+    chunks = []
+    for file in files:
+        if file.suffix.lower() == ".pdf":
+            pages = [page async for page in pdf_service.iter_pdf_pages(file.read_bytes(), file.name)]
+            text = PAGE_SEPARATOR.join(pages)
+        elif file.suffix.lower() in (".md", ".txt"):
+            text = file.read_text(errors="replace")
+        else:
+            continue
+        chunks.extend(split_into_chunks(text, chunk_size))
+    return chunks
+
+
+async def measure_cleaning_throughput(chunks: list, concurrency: int) -> dict:
+    """Clean chunks against the running vLLM server and measure generated tokens/sec"""
+    from config import settings
+    from prompts import get_prompt
+    from services import VLLMService
+    from vllm_manager import parse_prometheus_metrics
+    import httpx
+
+    service = VLLMService()
+    slots = asyncio.Semaphore(concurrency)
+    completion_tokens = 0
+    latencies = []
+
+    async def clean(chunk: str):
+        nonlocal completion_tokens
+        messages = get_prompt("rewrite").build_messages(chunk)
+        async with slots:
+            start = time.perf_counter()
+            response = await service.async_client.chat.completions.create(
+                model=settings.vllm_model_name,
+                messages=messages,
+                max_tokens=service._response_token_budget(messages),
+                temperature=settings.vllm_temperature
+            )
+            latencies.append(time.perf_counter() - start)
+        completion_tokens += response.usage.completion_tokens
+
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(clean(chunk) for chunk in chunks))
+    wall_time = time.perf_counter() - wall_start
+
+    acceptance_rate = None
+    try:
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            response = await client.get(f"{settings.vllm_base_url}/metrics")
+        metrics = parse_prometheus_metrics(response.text)
+    except httpx.HTTPError:
+        metrics = {}
+    drafted = metrics.get("vllm:spec_decode_num_draft_tokens_total")
+    if drafted:
+        acceptance_rate = metrics.get("vllm:spec_decode_num_accepted_tokens_total", 0.0) / drafted
+
+    latencies.sort()
+    return {
+        "completion_tokens": completion_tokens,
+        "wall_seconds": wall_time,
+        "tokens_per_second": completion_tokens / wall_time if wall_time else 0.0,
+        "p50_seconds": latencies[len(latencies) // 2],
+        "acceptance_rate": acceptance_rate,
+    }
+
+
+async def run_speculative_scenarios(args: argparse.Namespace, chunks: list) -> None:
+    from config import settings
+    from vllm_manager import vllm_manager
+
+    if await vllm_manager._is_vllm_running():
+        print(f"A vLLM server is already running at {settings.vllm_base_url}; stop it so each method gets a fresh server")
+        return
+
+    print(f"{'method':<10}{'tokens':>10}{'tokens/s':>12}{'speedup':>10}{'p50 s':>10}{'wall s':>10}{'accepted':>10}")
+    baseline = None
+    for method in args.methods.split(","):
+        method = "" if method == "off" else method
+        with patch.object(settings, "vllm_speculative_method", method):
+            if not await vllm_manager.start_vllm_service():
+                print(f"{method or 'off':<10}vLLM failed to start")
+                continue
+            try:
+                result = await measure_cleaning_throughput(chunks, args.concurrency)
+            finally:
+                await vllm_manager.stop_vllm_service()
+
+        baseline = baseline or result["tokens_per_second"]
+        accepted = f"{result['acceptance_rate']:.0%}" if result["acceptance_rate"] is not None else "-"
+        print(
+            f"{method or 'off':<10}{result['completion_tokens']:>10}{result['tokens_per_second']:>12.1f}"
+            f"{result['tokens_per_second'] / baseline:>9.2f}x{result['p50_seconds']:>10.2f}"
+            f"{result['wall_seconds']:>10.2f}{accepted:>10}"
+        )
+
+
+def benchmark_speculative(args: argparse.Namespace) -> None:
+    """Compare cleaning throughput with and without speculative decoding on a corpus"""
+    import logging
+    logging.disable(logging.INFO)
+
+    from config import settings
+
+    chunks = asyncio.run(load_corpus(args.corpus, settings.cleaning_chunk_size))[:args.max_chunks]
+    if not chunks:
+        print("No PDF, Markdown or text files found in the corpus")
+        return
+
+    print(f"Cleaning {len(chunks)} chunks from {', '.join(args.corpus)} with {args.concurrency} in flight")
+    asyncio.run(run_speculative_scenarios(args, chunks))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backend benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    streaming = subparsers.add_parser("streaming", help="Token coalescing on streaming responses")
+    streaming.add_argument("--tokens", type=int, default=20000)
+    streaming.add_argument("--token-delay-ms", type=float, default=0.0)
+    streaming.add_argument("--flush-interval-ms", type=int, default=50)
+    streaming.add_argument("--flush-size", type=int, default=16384)
+    streaming.set_defaults(func=benchmark_streaming)
+
+    speculative = subparsers.add_parser("speculative", help="Cleaning tokens/sec with and without speculative decoding")
+    speculative.add_argument("corpus", nargs="+", help="PDF, Markdown or text files, or directories of them")
+    speculative.add_argument("--methods", default="off,ngram", help="Comma-separated: off, ngram, draft")
+    speculative.add_argument("--max-chunks", type=int, default=32)
+    speculative.add_argument("--concurrency", type=int, default=1)
+    speculative.set_defaults(func=benchmark_speculative)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import hashlib
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+from config import settings
+from prompts import prompt_fingerprint
+
+_BLANK_RUN_PATTERN = re.compile(r"\n{3,}")
+
+
+def normalize_chunk(text: str) -> str:
+    """
+    Normalize a chunk so extraction noise does not change its cache key
+    
+    Line endings, trailing whitespace, runs of blank lines and Unicode
+    composition are normalized; the words themselves are left alone, since
+    any change to them could change the cleaned result.
+    """
+    text = unicodedata.normalize("NFC", text.replace("\r\n", "\n").replace("\r", "\n"))
+    text = "\n".join(line.rstrip() for line in text.split("\n"))
+    return _BLANK_RUN_PATTERN.sub("\n\n", text).strip()
+
+
+class ChunkCache:
+    """
+    Cleaned text of previously seen chunks, shared across documents
+    
+    Entries are keyed by the normalized chunk together with the output mode,
+    model and prompt fingerprint, so changing any of them never returns text
+    cleaned under the old ones. The least recently used entries are evicted
+    beyond ``max_entries``.
+    """
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def key(content: str, mode: str) -> str:
+        identity = f"{mode}\0{settings.vllm_model_name}\0{prompt_fingerprint()}\0{normalize_chunk(content)}"
+        return hashlib.sha256(identity.encode()).hexdigest()
+    
+    def get(self, content: str, mode: str) -> Optional[str]:
+        """Return the cleaned text of a chunk seen before, or None"""
+        if not settings.chunk_cache_enabled:
+            return None
+        key = self.key(content, mode)
+        cleaned = self._entries.get(key)
+        if cleaned is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return cleaned
+    
+    def put(self, content: str, mode: str, cleaned: str) -> None:
+        """Remember the cleaned text of a chunk"""
+        if not settings.chunk_cache_enabled or self.max_entries <= 0:
+            return
+        key = self.key(content, mode)
+        self._entries[key] = cleaned
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def discard(self, content: str, mode: str) -> None:
+        """Forget a chunk's cleaned text, e.g. after it was rejected"""
+        self._entries.pop(self.key(content, mode), None)
+    
+    def clear(self) -> None:
+        self._entries.clear()
+    
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": settings.chunk_cache_enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
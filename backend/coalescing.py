@@ -0,0 +1,96 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from config import settings
+from prompts import prompt_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+def conversion_key(file_content: bytes, **options: Any) -> str:
+    """
+    Identify a conversion by its input and everything that shapes its output
+    
+    Two uploads of the same file get the same key as long as they ask for the
+    same options and the model, prompt and chunking have not changed between them.
+    
+    Args:
+        file_content: Uploaded file content
+        **options: Request options that change the result (e.g. ``clean_with_llm``)
+    
+    Returns:
+        Hex digest of the content followed by a short digest of the options
+    """
+    shape = json.dumps({
+        **options,
+        "model": settings.vllm_model_name,
+        "prompt": prompt_fingerprint(),
+        "chunk_size": settings.cleaning_chunk_size,
+        "output_mode": settings.cleaning_output_mode
+    }, sort_keys=True)
+    content_digest = hashlib.sha256(file_content).hexdigest()
+    return f"{content_digest}:{hashlib.sha256(shape.encode()).hexdigest()[:16]}"
+
+
+class InFlightCalls:
+    """
+    Share one running call between identical requests
+    
+    The first request for a key (the leader) starts the call as a task; requests
+    for the same key made before it finishes (followers) await that task instead
+    of starting their own. The task is shielded, so a client that disconnects
+    does not cancel the work the others are waiting on. Nothing is kept once the
+    call finishes.
+    """
+    
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.followers = 0
+    
+    async def run(self, key: str, call: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """
+        Run ``call`` unless an identical one is already running, and return its result
+        
+        Args:
+            key: Identity of the call, e.g. from ``conversion_key``
+            call: Coroutine function doing the work
+        
+        Returns:
+            Tuple of (result, whether it was shared from another request's call)
+        
+        Raises:
+            Exception: Whatever the shared call raised
+        """
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            self.followers += 1
+            logger.info(f"Joining in-flight call {key[:12]}")
+        else:
+            self.leaders += 1
+            task = asyncio.create_task(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task), shared
+    
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the error as retrieved in case every waiter went away
+            task.exception()
+    
+    def snapshot(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "followers": self.followers
+        }
+
+
+# Global table of running conversions
+conversion_calls = InFlightCalls()
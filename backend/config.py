@@ -17,6 +17,18 @@ class Settings(BaseSettings):
     vllm_startup_timeout: int = 300  # Timeout for vLLM startup (seconds)
     vllm_gpu_memory_utilization: float = 0.8
     vllm_max_model_len: int = 32768
+    vllm_enable_prefix_caching: bool = True  # Reuse KV cache of the shared cleaning prompt prefix
+    vllm_speculative_method: str = ""  # "" (off), "ngram" (prompt lookup) or "draft" (separate draft model)
+    vllm_num_speculative_tokens: int = 5  # Tokens proposed per speculation step
+    vllm_ngram_prompt_lookup_max: int = 4  # Longest n-gram matched against the prompt
+    vllm_ngram_prompt_lookup_min: int = 2  # Shortest n-gram matched against the prompt
+    vllm_speculative_draft_model: str = ""  # Draft model name or path for the "draft" method
+    vllm_idle_action: str = "none"  # "none", "sleep" (free GPU memory, keep the process) or "stop" once idle
+    vllm_idle_timeout: int = 900  # Seconds without requests before the idle action is taken
+    vllm_sleep_level: int = 1  # vLLM sleep level: 1 offloads weights to CPU memory, 2 discards them
+    gpu_probe_ttl: int = 300  # Seconds a GPU detection result is reused before detecting again
+    process_sample_interval: float = 5.0  # Seconds between samples of the vLLM process's resource usage
+    process_sample_history: int = 720  # Samples kept for /vllm/status/history (an hour at the default interval)
     
     # File Upload Configuration
     max_file_size_mb: int = 50
@@ -31,10 +43,54 @@ class Settings(BaseSettings):
     vllm_max_tokens: int = 16384
     vllm_temperature: float = 0.1
     vllm_timeout: int = 300  # seconds
+    vllm_retry_attempts: int = 3  # Retries of a request that failed with a connection error or 5xx
+    vllm_retry_base_delay: float = 0.5  # Seconds before the first retry; doubled per retry, with full jitter
+    vllm_retry_max_delay: float = 8.0  # Upper bound for a single retry delay
+    vllm_circuit_failure_threshold: int = 5  # Consecutive failures that open the circuit breaker
+    vllm_circuit_reset_timeout: float = 30.0  # Seconds the circuit stays open before a trial request
+    vllm_chunk_retries: int = 1  # Times a chunk is cleaned again after its requests failed
+    vllm_chunk_retry_timeout: float = 120.0  # Longest a chunk waits for vLLM to come back before using raw text
+    hedging_enabled: bool = False  # Duplicate slow non-streaming requests and use whichever answers first
+    hedging_percentile: float = 95.0  # Latency percentile (scaled to each request's max_tokens) after which a request is hedged
+    hedging_min_delay: float = 0.5  # Never hedge a request sooner than this (seconds)
+    hedging_budget: float = 0.05  # Largest share of recent requests that may be hedged
+    hedging_replica_urls: List[str] = []  # vLLM replicas to send hedges to; empty hedges to the same server with higher priority
+    hedging_priority: int = -10  # vLLM scheduling priority of hedges to the same server (lower runs earlier)
+    vllm_max_concurrent_requests: int = 8  # Max cleaning requests in flight per document
+    adaptive_max_tokens_enabled: bool = True  # Size max_tokens to each request's content instead of the whole context
+    output_token_ratio: float = 1.2  # First-attempt max_tokens per estimated content token
+    output_token_margin: int = 128  # Tokens added to the proportional budget
+    output_token_retry_growth: float = 2.0  # Budget multiplier when a response stops at max_tokens
+    cleaning_chunk_size: int = 8000  # Characters of extracted pages grouped into one cleaning request
+    cleaning_output_mode: str = "rewrite"  # "rewrite" (model returns the full text) or "edits" (model returns line edits)
+    preclean_enabled: bool = True  # Run the rule-based pre-cleaner on pages before vLLM
+    header_footer_edge_lines: int = 3  # Lines at the top and bottom of each page checked for running headers/footers
+    header_footer_min_pages: int = 3  # Pages an edge line must recur on to be stripped as a header/footer
+    structured_repair_enabled: bool = True  # Repair table/equation regions with dedicated guided-decoding requests
+    structured_repair_max_region_lines: int = 60  # Larger regions are left to the general cleaning prompt
+    drift_guard_enabled: bool = True  # Keep the raw chunk when cleaning dropped or invented content
+    drift_min_coverage: float = 0.85  # Share of the raw text's word shingles the cleaned text must keep
+    drift_min_support: float = 0.85  # Share of the cleaned text's word shingles that must come from the raw text
+    drift_shingle_size: int = 3  # Words per shingle
+    drift_min_tokens: int = 20  # Chunks with fewer raw words are not checked
+    skip_clean_enabled: bool = True  # Skip vLLM for chunks the quality scorer finds already clean
+    skip_clean_max_score: float = 1.0  # Chunks scoring below this are returned without cleaning
+    chunk_cache_enabled: bool = True  # Reuse the cleaned text of chunks seen before in any document
+    chunk_cache_max_entries: int = 5000  # Least recently used cleaned chunks beyond this are evicted
+    coalesce_conversions_enabled: bool = True  # Identical uploads made while one is converting share its work
+    job_store_max_jobs: int = 50  # Finished conversions kept in memory for incremental re-conversion
+    job_store_dir: str = ""  # Also store finished conversions here so they survive restarts (empty: memory only)
     
     # Streaming Configuration
     vllm_stream_chunk_size: int = 1  # Size of streaming chunks
     vllm_disable_log_stats: bool = True  # Disable vLLM stats logging for better streaming
+    stream_flush_interval_ms: int = 50  # Coalesce streamed tokens for this long before writing
+    stream_flush_size: int = 16384  # Write coalesced tokens as soon as this many characters are buffered
+    stream_heartbeat_interval: int = 15  # Seconds of silence before an SSE heartbeat comment
+    stream_buffer_max_events: int = 10000  # Events kept per stream for Last-Event-ID replay
+    stream_buffer_ttl: int = 600  # Seconds a finished stream stays available for replay
+    stream_buffer_max_streams: int = 100  # Finished streams beyond this are evicted oldest first
+    websocket_max_conversions: int = 4  # Concurrent conversions per WebSocket connection
     
     # Model Download Configuration
     model_cache_dir: str = "./models"  # Directory to cache downloaded models
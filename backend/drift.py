@@ -0,0 +1,81 @@
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List
+
+_HYPHENATED_BREAK_PATTERN = re.compile(r"(\w)-\n\s*(\w)")
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into comparable word tokens
+    
+    Markdown syntax, punctuation and case are ignored, ligatures are expanded
+    and words hyphenated across lines are joined, so fixing extraction
+    artifacts does not count as a change in content.
+    """
+    text = unicodedata.normalize("NFKC", text)
+    text = _HYPHENATED_BREAK_PATTERN.sub(r"\1\2", text)
+    return _WORD_PATTERN.findall(text.lower())
+
+
+def shingles(tokens: List[str], size: int) -> Counter:
+    """Count the overlapping ``size``-token n-grams of a token list"""
+    size = max(1, min(size, len(tokens)))
+    return Counter(tuple(tokens[i:i + size]) for i in range(len(tokens) - size + 1))
+
+
+def measure_drift(raw: str, cleaned: str, shingle_size: int = 3) -> Dict[str, float]:
+    """
+    Compare the content of a cleaned chunk with the text it was cleaned from
+    
+    ``coverage`` is the share of the raw text's shingles still present in the
+    cleaned text (low when content was dropped); ``support`` is the share of
+    the cleaned text's shingles found in the raw text (low when content was
+    invented or rewritten).
+    
+    Args:
+        raw: Text sent to the model
+        cleaned: Text the model returned
+        shingle_size: Tokens per shingle
+    
+    Returns:
+        Dictionary with ``coverage``, ``support`` and the token counts of both texts
+    """
+    raw_tokens = tokenize(raw)
+    cleaned_tokens = tokenize(cleaned)
+    size = min(shingle_size, len(raw_tokens), len(cleaned_tokens)) or 1
+    raw_shingles = shingles(raw_tokens, size)
+    cleaned_shingles = shingles(cleaned_tokens, size)
+    shared = sum((raw_shingles & cleaned_shingles).values())
+    
+    return {
+        "coverage": round(shared / sum(raw_shingles.values()), 4) if raw_shingles else 1.0,
+        "support": round(shared / sum(cleaned_shingles.values()), 4) if cleaned_shingles else 1.0,
+        "raw_tokens": len(raw_tokens),
+        "cleaned_tokens": len(cleaned_tokens)
+    }
+
+
+def has_drifted(
+    raw: str,
+    cleaned: str,
+    min_coverage: float,
+    min_support: float,
+    shingle_size: int = 3,
+    min_tokens: int = 20
+) -> tuple[bool, Dict[str, float]]:
+    """
+    Decide whether a cleaned chunk dropped or invented too much content to be kept
+    
+    Chunks with fewer than ``min_tokens`` raw tokens are never flagged, since
+    removing a header or page number from them swings the ratios too much.
+    
+    Returns:
+        Tuple of (drifted, drift measurements)
+    """
+    report = measure_drift(raw, cleaned, shingle_size)
+    if report["raw_tokens"] < min_tokens:
+        return False, report
+    return report["coverage"] < min_coverage or report["support"] < min_support, report
@@ -0,0 +1,120 @@
+import re
+from typing import List, NamedTuple, Optional
+
+EDIT_SCRIPT_INSTRUCTIONS = """The input lines are numbered as "<n>| <text>". Reply only with edits, one per line:
+R <n>: <text>        replace line n with text
+R <n>-<m>: <text>    replace lines n to m with one line of text
+D <n>  or  D <n>-<m> delete line n or lines n to m
+I <n>: <text>        insert a line after line n (I 0 inserts at the top)
+Join wrapped lines and hyphenated words with a single R over the range. Never repeat lines that need no change. Reply NONE if nothing needs fixing."""
+
+_EDIT_PATTERN = re.compile(r"^([RDI])\s+(\d+)(?:\s*-\s*(\d+))?\s*(?::\s?(.*))?$")
+
+
+class EditScriptError(Exception):
+    """Raised when a model's edit script cannot be parsed or applied"""
+
+
+class LineEdit(NamedTuple):
+    """One edit against 1-based line numbers of the original text"""
+    op: str
+    start: int
+    end: int
+    text: Optional[str]
+
+
+def number_lines(text: str) -> str:
+    """Prefix every line with its 1-based line number for the edit prompt"""
+    return "\n".join(f"{number}| {line}" for number, line in enumerate(text.split("\n"), start=1))
+
+
+def parse_edit_script(script: str, line_count: int) -> List[LineEdit]:
+    """
+    Parse and validate an edit script
+    
+    Args:
+        script: Model output in the format described by ``EDIT_SCRIPT_INSTRUCTIONS``
+        line_count: Number of lines in the original text
+    
+    Returns:
+        The edits, in the order they appeared
+    
+    Raises:
+        EditScriptError: If a line is malformed, out of range, or edits overlap
+    """
+    script = script.strip().strip("`").strip()
+    if not script or script.upper() == "NONE":
+        return []
+    
+    edits = []
+    for raw_line in script.split("\n"):
+        if not raw_line.strip():
+            continue
+        match = _EDIT_PATTERN.match(raw_line.strip())
+        if not match:
+            raise EditScriptError(f"Malformed edit: {raw_line[:80]!r}")
+        
+        op, start, end, text = match.group(1), int(match.group(2)), match.group(3), match.group(4)
+        end = int(end) if end else start
+        
+        if op == "I":
+            if end != start or text is None or not 0 <= start <= line_count:
+                raise EditScriptError(f"Invalid insert: {raw_line[:80]!r}")
+        elif not 1 <= start <= end <= line_count:
+            raise EditScriptError(f"Line range out of bounds: {raw_line[:80]!r}")
+        elif (op == "R") != (text is not None):
+            raise EditScriptError(f"Replacement text missing or unexpected: {raw_line[:80]!r}")
+        
+        edits.append(LineEdit(op, start, end, text))
+    
+    covered = set()
+    for edit in edits:
+        if edit.op == "I":
+            continue
+        lines = set(range(edit.start, edit.end + 1))
+        if covered & lines:
+            raise EditScriptError(f"Overlapping edits on line {min(covered & lines)}")
+        covered |= lines
+    
+    for edit in edits:
+        # Inserting after a line that is itself replaced or deleted (other than the last) is ambiguous
+        if edit.op == "I" and edit.start in covered and edit.start + 1 in covered:
+            raise EditScriptError(f"Insert inside an edited range after line {edit.start}")
+    
+    return edits
+
+
+def apply_edits(text: str, edits: List[LineEdit]) -> str:
+    """
+    Apply validated edits to the original text
+    
+    Replacements and deletions refer to original line numbers, so they are
+    applied from the bottom up; inserts after the same line keep their order.
+    
+    Args:
+        text: Original text the line numbers refer to
+        edits: Edits returned by ``parse_edit_script``
+    
+    Returns:
+        The edited text
+    """
+    lines = text.split("\n")
+    inserts: dict = {}
+    for edit in edits:
+        if edit.op == "I":
+            inserts.setdefault(edit.start, []).append(edit.text)
+    
+    ranges = sorted((edit for edit in edits if edit.op != "I"), key=lambda edit: edit.start, reverse=True)
+    insert_points = sorted(inserts, reverse=True)
+    
+    # Walk from the end so earlier line numbers stay valid
+    for edit in ranges:
+        while insert_points and insert_points[0] >= edit.end:
+            point = insert_points.pop(0)
+            lines[point:point] = inserts[point]
+        replacement = [edit.text] if edit.op == "R" else []
+        lines[edit.start - 1:edit.end] = replacement
+    for point in insert_points:
+        lines[point:point] = inserts[point]
+    
+    return "\n".join(lines)
@@ -0,0 +1,84 @@
+from collections import deque
+from typing import Optional
+
+
+class HedgingPolicy:
+    """
+    Decide when a slow non-streaming request gets a duplicate, and how many may
+    
+    Latencies are tracked per requested output token, since a chunk's decode
+    time grows with its max_tokens. A request is hedged once it has run longer
+    than the chosen percentile of recent latencies (scaled to its own budget),
+    and only while hedges stay within ``budget`` of recent requests.
+    """
+    
+    def __init__(
+        self,
+        percentile: float,
+        min_delay: float,
+        budget: float,
+        window: int = 1000,
+        min_samples: int = 20
+    ):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.budget = budget
+        self.min_samples = min_samples
+        self.seconds_per_token = deque(maxlen=window)
+        self.recent_hedges = deque(maxlen=window)
+        self.in_flight_hedges = 0
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+    
+    def delay(self, max_tokens: int) -> Optional[float]:
+        """
+        Seconds to wait before hedging a request
+        
+        Returns:
+            The delay, or None while there are too few samples to estimate it
+        """
+        if len(self.seconds_per_token) < self.min_samples:
+            return None
+        samples = sorted(self.seconds_per_token)
+        index = min(len(samples) - 1, int(len(samples) * self.percentile / 100))
+        return max(self.min_delay, samples[index] * max(max_tokens, 1))
+    
+    def try_acquire(self) -> bool:
+        """Reserve a hedge if one more fits in the budget of recent requests"""
+        hedges = sum(self.recent_hedges) + self.in_flight_hedges + 1
+        if hedges > self.budget * (len(self.recent_hedges) + 1):
+            return False
+        self.in_flight_hedges += 1
+        return True
+    
+    def release(self) -> None:
+        """Give back a hedge reserved for a request that failed or was cancelled"""
+        self.in_flight_hedges -= 1
+    
+    def record(self, seconds: float, max_tokens: int, hedged: bool = False, hedge_won: bool = False) -> None:
+        """
+        Record a finished request
+        
+        Args:
+            seconds: Time until the first successful response
+            max_tokens: Output budget of the request
+            hedged: Whether a hedge reserved with ``try_acquire`` was sent
+            hedge_won: Whether the hedge answered first
+        """
+        self.requests += 1
+        self.recent_hedges.append(hedged)
+        self.seconds_per_token.append(seconds / max(max_tokens, 1))
+        if hedged:
+            self.in_flight_hedges -= 1
+            self.hedges += 1
+            self.hedge_wins += hedge_won
+    
+    def snapshot(self) -> dict:
+        return {
+            "requests": self.requests,
+            "hedged": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_ratio": round(self.hedges / self.requests, 4) if self.requests else 0.0,
+            "latency_samples": len(self.seconds_per_token)
+        }
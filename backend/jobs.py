@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+import re
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional
+
+from chunk_cache import normalize_chunk
+from drift import measure_drift
+
+logger = logging.getLogger(__name__)
+
+_PARAGRAPH_BREAK_PATTERN = re.compile(r"\n[ \t]*\n")
+_JOB_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+# Cleaned paragraphs must keep this share of their raw paragraph's words to be reused alone
+MIN_PARAGRAPH_COVERAGE = 0.5
+
+
+class CleanedChunk(NamedTuple):
+    """Text of a chunk as sent for cleaning, and the cleaned text that replaced it"""
+    raw: str
+    cleaned: str
+
+
+def split_paragraphs(text: str) -> List[str]:
+    """Split text at blank lines, dropping empty paragraphs"""
+    return [paragraph for paragraph in _PARAGRAPH_BREAK_PATTERN.split(text) if paragraph.strip()]
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+class PreviousConversion:
+    """
+    Cleaned text of an earlier job, looked up by chunk and by paragraph
+    
+    Whole chunks are matched by their normalized raw text. Paragraphs can
+    only be matched inside chunks whose cleaning kept the paragraph structure
+    (as many cleaned paragraphs as raw ones, each still covering its raw
+    paragraph), since only then is it known which cleaned text belongs to
+    which raw paragraph.
+    """
+    
+    def __init__(self, chunks: List[CleanedChunk]):
+        self._chunks: Dict[str, str] = {}
+        self._paragraphs: Dict[str, str] = {}
+        for raw, cleaned in chunks:
+            self._chunks[normalize_chunk(raw)] = cleaned
+            raw_paragraphs = split_paragraphs(raw)
+            cleaned_paragraphs = split_paragraphs(cleaned)
+            if len(raw_paragraphs) != len(cleaned_paragraphs):
+                continue
+            pairs = list(zip(raw_paragraphs, cleaned_paragraphs))
+            if all(measure_drift(r, c, 1)["coverage"] >= MIN_PARAGRAPH_COVERAGE for r, c in pairs):
+                for raw_paragraph, cleaned_paragraph in pairs:
+                    self._paragraphs.setdefault(normalize_chunk(raw_paragraph), cleaned_paragraph)
+    
+    def chunk(self, raw: str) -> Optional[str]:
+        """Return the previous cleaned text of an unchanged chunk, or None"""
+        return self._chunks.get(normalize_chunk(raw))
+    
+    def plan(self, raw: str) -> List[tuple[str, Optional[str]]]:
+        """
+        Split a changed chunk into runs of unchanged and changed paragraphs
+        
+        Returns:
+            List of (raw text, previous cleaned text or None when it must be
+            cleaned) for consecutive runs of paragraphs, in order
+        """
+        runs: List[tuple[List[str], Optional[List[str]]]] = []
+        for paragraph in split_paragraphs(raw):
+            cleaned = self._paragraphs.get(normalize_chunk(paragraph))
+            if runs and (cleaned is None) == (runs[-1][1] is None):
+                runs[-1][0].append(paragraph)
+                if cleaned is not None:
+                    runs[-1][1].append(cleaned)
+            else:
+                runs.append(([paragraph], None if cleaned is None else [cleaned]))
+        return [
+            ("\n\n".join(raw_run), None if cleaned_run is None else "\n\n".join(cleaned_run))
+            for raw_run, cleaned_run in runs
+        ]
+
+
+class ConversionJob:
+    """Id of a running conversion and the chunks it has cleaned so far"""
+    
+    def __init__(self, job_id: str, previous: Optional[PreviousConversion] = None):
+        self.job_id = job_id
+        self.previous = previous
+        self._chunks: Dict[int, CleanedChunk] = {}
+    
+    def record(self, chunk_index: int, raw: str, cleaned: str) -> None:
+        self._chunks[chunk_index] = CleanedChunk(raw, cleaned)
+    
+    def cleaned_chunks(self) -> List[CleanedChunk]:
+        return [self._chunks[index] for index in sorted(self._chunks)]
+
+
+class JobStore:
+    """
+    Cleaned chunks of finished conversions, kept for incremental re-conversion
+    
+    The most recent ``max_jobs`` jobs are kept in memory. With a
+    ``directory``, every job is also written there as JSON so it can be used
+    as a previous job after a restart.
+    """
+    
+    def __init__(self, max_jobs: int, directory: str = ""):
+        self.max_jobs = max_jobs
+        self.directory = directory
+        self._jobs: OrderedDict[str, List[CleanedChunk]] = OrderedDict()
+    
+    def save(self, job_id: str, chunks: List[CleanedChunk]) -> None:
+        """Keep the cleaned chunks of a finished job"""
+        self._jobs[job_id] = chunks
+        self._jobs.move_to_end(job_id)
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+        
+        if self.directory:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(self._path(job_id), "w", encoding="utf-8") as f:
+                    json.dump([chunk._asdict() for chunk in chunks], f, ensure_ascii=False)
+            except OSError as e:
+                logger.error(f"Failed to store job {job_id}: {e}")
+    
+    def load(self, job_id: str) -> Optional[PreviousConversion]:
+        """
+        Look up a finished job
+        
+        Returns:
+            The job's cleaned text, or None if the id is unknown or expired
+        """
+        chunks = self._read(job_id)
+        return PreviousConversion(chunks) if chunks is not None else None
+    
+    def __contains__(self, job_id: str) -> bool:
+        if not _JOB_ID_PATTERN.fullmatch(job_id or ""):
+            return False
+        return job_id in self._jobs or bool(self.directory) and os.path.exists(self._path(job_id))
+    
+    def _read(self, job_id: str) -> Optional[List[CleanedChunk]]:
+        if not _JOB_ID_PATTERN.fullmatch(job_id or ""):
+            return None
+        if job_id in self._jobs:
+            self._jobs.move_to_end(job_id)
+            return self._jobs[job_id]
+        if not self.directory or not os.path.exists(self._path(job_id)):
+            return None
+        try:
+            with open(self._path(job_id), encoding="utf-8") as f:
+                return [CleanedChunk(**chunk) for chunk in json.load(f)]
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"Failed to read job {job_id}: {e}")
+            return None
+    
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from config import settings
+from vllm_manager import VLLMManager, vllm_manager
+
+logger = logging.getLogger(__name__)
+
+IDLE_ACTIONS = ("none", "sleep", "stop")
+
+
+class VLLMLifecycle:
+    """
+    Put vLLM to sleep or stop it when idle, and wake it as soon as work arrives
+    
+    After ``vllm_idle_timeout`` seconds without requests, a vLLM server started
+    by this backend is put to sleep (freeing GPU memory while the process
+    stays up) or stopped, depending on ``vllm_idle_action``. Uploads call
+    ``preflight`` before extracting the PDF, which starts waking vLLM in the
+    background so the model loads while MarkItDown runs; requests to vLLM call
+    ``ensure_ready`` and only wait for whatever wake-up is still left.
+    
+    States: ``unknown`` (not managed, e.g. an external server or after a manual
+    stop), ``running``, ``waking``, ``sleeping`` and ``stopped`` (stopped for
+    being idle). Only ``waking``, ``sleeping`` and ``stopped`` are woken
+    automatically.
+    """
+    
+    def __init__(self, manager: VLLMManager, clock: Callable[[], float] = time.monotonic):
+        self.manager = manager
+        self.clock = clock
+        self.state = "unknown"
+        self.last_activity = clock()
+        self.sleeps = 0
+        self.stops = 0
+        self.failed_wakes = 0
+        self.cold_starts = 0
+        self.wakes = 0
+        # Recent (kind, seconds) of cold starts and wake-ups
+        self.durations = deque(maxlen=50)
+        self._wake_task: Optional[asyncio.Task] = None
+        self._monitor: Optional[asyncio.Task] = None
+        self._transition = asyncio.Lock()
+    
+    def record_activity(self) -> None:
+        self.last_activity = self.clock()
+    
+    async def start(self, model_name: Optional[str] = None) -> bool:
+        """Start vLLM now (e.g. at startup or on request), recording the cold start"""
+        async with self._transition:
+            return await self._start_locked("start", model_name)
+    
+    async def stop(self) -> bool:
+        """Stop vLLM on request; it is not woken automatically afterwards"""
+        # A start holding the transition lock would otherwise run to its timeout first
+        await self.manager.abandon_startup()
+        async with self._transition:
+            self.state = "unknown"
+            return await self.manager.stop_vllm_service()
+    
+    async def restart(self, model_name: Optional[str] = None) -> bool:
+        await self.manager.abandon_startup()
+        async with self._transition:
+            return await self._start_locked("start", model_name, restart=True)
+    
+    async def preflight(self) -> bool:
+        """
+        Make sure vLLM will be available to an upload that is about to start
+        
+        Wakes or starts vLLM in the background when it is asleep, stopped or
+        down (and ``vllm_auto_start`` allows starting it), without waiting.
+        
+        Returns:
+            False if vLLM is down and may not be started, True otherwise
+        """
+        self.record_activity()
+        if self.state in ("waking", "sleeping", "stopped"):
+            self.wake_in_background()
+            return True
+        if await self.manager._is_vllm_running():
+            if self.state == "unknown" and self.manager.process is not None:
+                self.state = "running"
+            return True
+        if not settings.vllm_auto_start:
+            return False
+        logger.info("vLLM is not running, starting it while the upload is processed...")
+        self.wake_in_background()
+        return True
+    
+    async def ensure_ready(self) -> None:
+        """
+        Wait until vLLM is awake if it was put to sleep, stopped for idleness or is starting
+        
+        Raises:
+            Exception: If vLLM could not be woken or started
+        """
+        self.record_activity()
+        if self.state not in ("waking", "sleeping", "stopped"):
+            return
+        # Shielded so a cancelled request does not abort a wake-up others wait for
+        if not await asyncio.shield(self.wake_in_background()):
+            raise Exception("vLLM service is not available and failed to start")
+    
+    def wake_in_background(self) -> asyncio.Task:
+        """Start waking vLLM unless a wake-up is already running, and return its task"""
+        if self._wake_task is None or self._wake_task.done():
+            previous = self.state
+            # Set before the task runs so concurrent callers wait for it
+            self.state = "waking"
+            self._wake_task = asyncio.create_task(self._wake(previous))
+        return self._wake_task
+    
+    async def _wake(self, previous: str) -> bool:
+        async with self._transition:
+            if previous != "sleeping":
+                # Only a server this backend stopped for idleness stays "stopped" on failure
+                return await self._start_locked(
+                    "start", on_failure="stopped" if previous == "stopped" else "unknown"
+                )
+            started = self.clock()
+            woken = await self.manager.wake_vllm_service()
+            if woken:
+                self.state = "running"
+                self.wakes += 1
+                self._record_duration("wake", started)
+            else:
+                self.state = "sleeping"
+                self.failed_wakes += 1
+            return woken
+    
+    async def _start_locked(self, kind: str, model_name: Optional[str] = None,
+                            on_failure: str = "unknown", restart: bool = False) -> bool:
+        started = self.clock()
+        previous_process = self.manager.process
+        if restart:
+            success = await self.manager.restart_vllm_service(model_name)
+        else:
+            success = await self.manager.start_vllm_service(model_name)
+        if success:
+            self.state = "running" if self.manager.process is not None else "unknown"
+            # A start that found vLLM already running did not load anything
+            if self.manager.process is not None and self.manager.process is not previous_process:
+                self.cold_starts += 1
+                self._record_duration(kind, started)
+        else:
+            self.state = on_failure
+            self.failed_wakes += 1
+        return success
+    
+    def _record_duration(self, kind: str, started: float) -> None:
+        seconds = self.clock() - started
+        self.durations.append((kind, seconds))
+        logger.info(f"vLLM {kind} took {seconds:.1f}s")
+    
+    async def check_idle(self) -> Optional[str]:
+        """
+        Apply the idle action if vLLM has had no requests for ``vllm_idle_timeout`` seconds
+        
+        Only a server started by this backend is put to sleep or stopped, and
+        not while vLLM still reports running or waiting requests (e.g. a long
+        streamed response) or while its load cannot be read.
+        
+        Returns:
+            The new state if the action was applied, otherwise None
+        """
+        action = settings.vllm_idle_action
+        if action == "none" or self.state != "running" or self.manager.process is None:
+            return None
+        if self.clock() - self.last_activity < settings.vllm_idle_timeout:
+            return None
+        load = await self.manager.get_request_load()
+        if load is None:
+            # Unknown load is not idleness; check again on the next round
+            return None
+        if load:
+            self.record_activity()
+            return None
+        
+        async with self._transition:
+            if self.state != "running" or self.clock() - self.last_activity < settings.vllm_idle_timeout:
+                return None
+            idle_seconds = self.clock() - self.last_activity
+            if action == "sleep":
+                self.state = "sleeping"
+                if not await self.manager.sleep_vllm_service(settings.vllm_sleep_level):
+                    self.state = "running"
+                    return None
+                self.sleeps += 1
+            else:
+                self.state = "stopped"
+                await self.manager.stop_vllm_service()
+                self.stops += 1
+            logger.info(f"vLLM idle for {idle_seconds:.0f}s, now {self.state}")
+            return self.state
+    
+    def start_monitor(self) -> None:
+        """Check for idleness in the background while the idle action is enabled"""
+        if settings.vllm_idle_action not in IDLE_ACTIONS:
+            raise Exception(f"Unknown vLLM idle action: {settings.vllm_idle_action}")
+        if settings.vllm_idle_action != "none" and self._monitor is None:
+            self._monitor = asyncio.create_task(self._watch_idle())
+    
+    async def stop_monitor(self) -> None:
+        if self._monitor is not None:
+            self._monitor.cancel()
+            try:
+                await self._monitor
+            except asyncio.CancelledError:
+                pass
+            self._monitor = None
+    
+    async def _watch_idle(self) -> None:
+        interval = max(1.0, min(settings.vllm_idle_timeout / 4, 30.0))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.check_idle()
+            except Exception as e:
+                logger.warning(f"vLLM idle check failed: {e}")
+    
+    def snapshot(self) -> dict:
+        def summary(kind: str, count: int) -> dict:
+            seconds = [duration for k, duration in self.durations if k == kind]
+            return {
+                "count": count,
+                "last_seconds": round(seconds[-1], 1) if seconds else None,
+                "mean_seconds": round(sum(seconds) / len(seconds), 1) if seconds else None,
+                "max_seconds": round(max(seconds), 1) if seconds else None
+            }
+        
+        return {
+            "state": self.state,
+            "idle_action": settings.vllm_idle_action,
+            "idle_timeout": settings.vllm_idle_timeout,
+            "idle_seconds": round(self.clock() - self.last_activity, 1),
+            "cold_starts": summary("start", self.cold_starts),
+            "wakes": summary("wake", self.wakes),
+            "sleeps": self.sleeps,
+            "idle_stops": self.stops,
+            "failed_wakes": self.failed_wakes
+        }
+
+
+# Global lifecycle controller for the managed vLLM server
+vllm_lifecycle = VLLMLifecycle(vllm_manager)
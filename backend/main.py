@@ -3,15 +3,22 @@ import atexit
 import base64
 import urllib.parse
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Header, Query, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import Optional
 import json
 
+from coalescing import conversion_calls, conversion_key
 from config import settings
+from lifecycle import vllm_lifecycle
+from prompts import prompt_fingerprint
+from resilience import CircuitOpenError
 from services import document_service
+from streaming import EventBuffer, coalesce_text, stream_registry, text_broadcasts
 from vllm_manager import vllm_manager
+from websocket_channel import ConversionChannel
 
 # Configure logging
 logging.basicConfig(level=getattr(logging, settings.log_level))
@@ -41,19 +48,26 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting PDF to Markdown Converter Backend...")
     
+    # Detect the GPU once up front so status endpoints can report it without waiting
+    await vllm_manager.probe_gpu()
+    
     # Start vLLM service if auto-start is enabled
     if settings.vllm_auto_start:
         logger.info("Auto-starting vLLM service...")
-        success = await vllm_manager.start_vllm_service()
+        success = await vllm_lifecycle.start()
         if success:
             logger.info("vLLM service started successfully")
         else:
             logger.warning("Failed to start vLLM service - continuing without it")
+    vllm_lifecycle.start_monitor()
+    vllm_manager.sampler.start()
     
     yield
     
     # Shutdown
     logger.info("Shutting down backend services...")
+    await vllm_lifecycle.stop_monitor()
+    await vllm_manager.sampler.stop()
     await vllm_manager.stop_vllm_service()
     logger.info("Backend shutdown complete")
 
@@ -86,6 +100,30 @@ class VLLMControlRequest(BaseModel):
     model_name: str = None
 
 
+def shared_result(result: dict, filename: str) -> dict:
+    """Copy a conversion result shared from another upload of the same file under this upload's filename"""
+    return {
+        **result,
+        "filename": filename,
+        "metadata": {**result["metadata"], "original_filename": filename, "coalesced": True}
+    }
+
+
+async def require_vllm() -> None:
+    """
+    Wait until vLLM can take requests, waking or starting it if needed
+    
+    Raises:
+        HTTPException: 503 if vLLM is down and may not be started, or failed to start
+    """
+    if not await vllm_lifecycle.preflight():
+        raise HTTPException(status_code=503, detail="vLLM service is not available")
+    try:
+        await vllm_lifecycle.ensure_ready()
+    except Exception:
+        raise HTTPException(status_code=503, detail="vLLM service is not available and failed to start")
+
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -109,16 +147,57 @@ async def get_vllm_status():
     """Get detailed vLLM service status"""
     status = vllm_manager.get_vllm_status()
     status["service_responsive"] = await vllm_manager._is_vllm_running()
+    status["lifecycle"] = vllm_lifecycle.snapshot()
     return status
 
 
+@app.get("/vllm/status/history")
+async def get_vllm_status_history(seconds: Optional[float] = Query(None, gt=0)):
+    """
+    Get recent resource usage samples of the vLLM process, oldest first
+    
+    Args:
+        seconds: Only return samples from the last this many seconds (default: all kept)
+    """
+    return {
+        "interval_seconds": settings.process_sample_interval,
+        "samples": vllm_manager.sampler.series(seconds)
+    }
+
+
+@app.get("/vllm/metrics")
+async def get_vllm_metrics():
+    """Get prefix cache hit rate scraped from vLLM, the active prompt version and request counters"""
+    return {
+        "prompt_version": prompt_fingerprint(),
+        "prefix_caching_enabled": settings.vllm_enable_prefix_caching,
+        "prefix_cache": await vllm_manager.get_prefix_cache_metrics(),
+        "truncation": dict(document_service.vllm_service.truncation_stats),
+        "circuit_breaker": document_service.vllm_service.circuit_breaker.snapshot(),
+        "hedging": {
+            "enabled": settings.hedging_enabled,
+            **document_service.vllm_service.hedging.snapshot()
+        },
+        "chunk_cache": document_service.vllm_service.chunk_cache.snapshot(),
+        "lifecycle": vllm_lifecycle.snapshot(),
+        "coalescing": {
+            "enabled": settings.coalesce_conversions_enabled,
+            **conversion_calls.snapshot(),
+            "joined_streams": stream_registry.joined,
+            "joined_text_streams": text_broadcasts.joined
+        }
+    }
+
+
 @app.post("/vllm/start")
 async def start_vllm_service(request: VLLMControlRequest = None):
     """Start vLLM service"""
     model_name = request.model_name if request else None
     
     logger.info(f"Manual start requested for vLLM service (model: {model_name or 'default'})")
-    success = await vllm_manager.start_vllm_service(model_name)
+    success = await vllm_lifecycle.start(model_name)
+    if success:
+        document_service.vllm_service.circuit_breaker.record_success()
     
     return {
         "success": success,
@@ -131,7 +210,9 @@ async def start_vllm_service(request: VLLMControlRequest = None):
 async def stop_vllm_service():
     """Stop vLLM service"""
     logger.info("Manual stop requested for vLLM service")
-    success = await vllm_manager.stop_vllm_service()
+    # Cleaning requests fail fast instead of waiting out timeouts against a stopped server
+    document_service.vllm_service.circuit_breaker.trip()
+    success = await vllm_lifecycle.stop()
     
     return {
         "success": success,
@@ -145,7 +226,10 @@ async def restart_vllm_service(request: VLLMControlRequest = None):
     model_name = request.model_name if request else None
     
     logger.info(f"Manual restart requested for vLLM service (model: {model_name or 'default'})")
-    success = await vllm_manager.restart_vllm_service(model_name)
+    document_service.vllm_service.circuit_breaker.trip()
+    success = await vllm_lifecycle.restart(model_name)
+    if success:
+        document_service.vllm_service.circuit_breaker.record_success()
     
     return {
         "success": success,
@@ -157,7 +241,9 @@ async def restart_vllm_service(request: VLLMControlRequest = None):
 @app.post("/upload")
 async def upload_pdf(
     file: UploadFile = File(...),
-    clean_with_llm: bool = True
+    clean_with_llm: bool = True,
+    preclean: Optional[bool] = None,
+    previous_job_id: Optional[str] = None
 ):
     """
     Upload PDF file and convert to markdown format
@@ -165,6 +251,10 @@ async def upload_pdf(
     Args:
         file: PDF file to convert
         clean_with_llm: Whether to clean the content with vLLM (default: True)
+        preclean: Run the rule-based pre-cleaner (default: PRECLEAN_ENABLED when
+            cleaning with vLLM, off otherwise)
+        previous_job_id: ``job_id`` of an earlier version of the document; only
+            its changed chunks and paragraphs are cleaned again
     
     Returns:
         JSON response with markdown content and metadata
@@ -185,32 +275,48 @@ async def upload_pdf(
             detail=f"File size too large. Maximum size is {settings.max_file_size_mb}MB"
         )
     
-    # Check if vLLM is needed and available
-    if clean_with_llm and not await vllm_manager._is_vllm_running():
+    if previous_job_id and previous_job_id not in document_service.jobs:
+        raise HTTPException(
+            status_code=404,
+            detail="Previous job not found or expired"
+        )
+    
+    # Check if vLLM is needed and available; waking it starts now so the
+    # model loads while the PDF is extracted
+    if clean_with_llm and not await vllm_lifecycle.preflight():
         logger.warning("vLLM cleaning requested but service is not running")
-        if settings.vllm_auto_start:
-            logger.info("Attempting to start vLLM service...")
-            success = await vllm_manager.start_vllm_service()
-            if not success:
-                raise HTTPException(
-                    status_code=503,
-                    detail="vLLM service is not available and failed to start. Try again or use convert-text endpoint."
-                )
-        else:
-            raise HTTPException(
-                status_code=503,
-                detail="vLLM service is not available. Use convert-text endpoint for basic conversion."
-            )
+        raise HTTPException(
+            status_code=503,
+            detail="vLLM service is not available. Use convert-text endpoint for basic conversion."
+        )
     
     try:
         # Read file content
         file_content = await file.read()
         logger.info(f"Processing uploaded file: {file.filename} ({len(file_content)} bytes)")
         
-        # Process document
-        result = await document_service.process_document(
-            file_content, file.filename, clean_with_llm
-        )
+        # Process document, or wait for an identical upload that is already being processed
+        if settings.coalesce_conversions_enabled:
+            if preclean is None:
+                preclean = clean_with_llm and settings.preclean_enabled
+            key = conversion_key(
+                file_content,
+                clean_with_llm=clean_with_llm,
+                preclean=preclean,
+                previous_job_id=previous_job_id
+            )
+            result, shared = await conversion_calls.run(
+                key,
+                lambda: document_service.process_document(
+                    file_content, file.filename, clean_with_llm, preclean, previous_job_id
+                )
+            )
+            if shared:
+                result = shared_result(result, file.filename)
+        else:
+            result = await document_service.process_document(
+                file_content, file.filename, clean_with_llm, preclean, previous_job_id
+            )
         
         logger.info(f"Successfully processed {file.filename}")
         return JSONResponse(content=result)
@@ -227,12 +333,18 @@ async def upload_pdf(
 
 @app.post("/convert-text")
 async def convert_text_only(
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    preclean: bool = False
 ):
     """
     Convert PDF to markdown without LLM cleaning (faster option)
+    
+    Args:
+        file: PDF file to convert
+        preclean: Apply the rule-based pre-cleaner (de-hyphenation, paragraph
+            joining, header/footer and page number removal, glyph normalization)
     """
-    return await upload_pdf(file, clean_with_llm=False)
+    return await upload_pdf(file, clean_with_llm=False, preclean=preclean)
 
 
 @app.post("/clean-markdown")
@@ -250,23 +362,10 @@ async def clean_existing_markdown(request: CleanMarkdownRequest):
         raise HTTPException(status_code=400, detail="Markdown content cannot be empty")
     
     # Check if vLLM is available
-    if not await vllm_manager._is_vllm_running():
-        if settings.vllm_auto_start:
-            logger.info("Starting vLLM service for markdown cleaning...")
-            success = await vllm_manager.start_vllm_service()
-            if not success:
-                raise HTTPException(
-                    status_code=503,
-                    detail="vLLM service is not available and failed to start"
-                )
-        else:
-            raise HTTPException(
-                status_code=503,
-                detail="vLLM service is not available"
-            )
+    await require_vllm()
     
     try:
-        cleaned_content = await document_service.vllm_service.clean_markdown_content(
+        cleaned_content = await document_service.vllm_service.clean_markdown_content_cached(
             request.markdown_content
         )
         return {
@@ -275,40 +374,43 @@ async def clean_existing_markdown(request: CleanMarkdownRequest):
             "cleaned_content": cleaned_content,
             "content_length": len(cleaned_content)
         }
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, round(e.retry_after)))}
+        )
     except Exception as e:
         logger.error(f"Error cleaning markdown: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to clean markdown: {str(e)}")
 
 
 @app.post("/clean-markdown-stream")
-async def clean_existing_markdown_stream(request: CleanMarkdownRequest):
+async def clean_existing_markdown_stream(
+    request: CleanMarkdownRequest,
+    flush_interval_ms: Optional[int] = None,
+    flush_size: Optional[int] = None
+):
     """
     Clean existing markdown content using vLLM with streaming response
     
     Args:
         request: Request containing markdown content to clean
+        flush_interval_ms: Maximum time tokens are batched before being written
+            (default: settings.stream_flush_interval_ms)
+        flush_size: Characters that trigger an immediate write
+            (default: settings.stream_flush_size)
         
     Returns:
-        Streaming response with cleaned markdown content token by token
+        Streaming response with cleaned markdown content, written in batches of tokens
     """
     if not request.markdown_content.strip():
         raise HTTPException(status_code=400, detail="Markdown content cannot be empty")
     
     # Check if vLLM is available
-    if not await vllm_manager._is_vllm_running():
-        if settings.vllm_auto_start:
-            logger.info("Starting vLLM service for markdown cleaning...")
-            success = await vllm_manager.start_vllm_service()
-            if not success:
-                raise HTTPException(
-                    status_code=503,
-                    detail="vLLM service is not available and failed to start"
-                )
-        else:
-            raise HTTPException(
-                status_code=503,
-                detail="vLLM service is not available"
-            )
+    await require_vllm()
+    
+    flush_interval, flush_size = resolve_stream_flush(flush_interval_ms, flush_size)
     
     # Use the sync generator directly without async wrapper
     def generate_stream():
@@ -321,13 +423,13 @@ async def clean_existing_markdown_stream(request: CleanMarkdownRequest):
                 request.markdown_content
             )
             
-            token_count = 0
-            for token in generator:  # Sync iteration
-                token_count += 1
-                logger.debug(f"FastAPI yielding token {token_count}: {repr(token[:20])}")
-                yield token
+            # Batch tokens so each HTTP chunk carries many of them
+            write_count = 0
+            for batch in coalesce_text(generator, flush_interval, flush_size):  # Sync iteration
+                write_count += 1
+                yield batch
                 
-            logger.info(f"FastAPI streaming completed with {token_count} tokens")
+            logger.info(f"FastAPI streaming completed with {write_count} writes")
             
         except Exception as stream_error:
             logger.error(f"Error in FastAPI stream generation: {stream_error}")
@@ -350,18 +452,67 @@ async def clean_existing_markdown_stream(request: CleanMarkdownRequest):
         raise HTTPException(status_code=500, detail=f"Failed to create streaming response: {str(e)}")
 
 
+def resolve_stream_flush(
+    flush_interval_ms: Optional[int],
+    flush_size: Optional[int]
+) -> tuple[float, int]:
+    """Apply per-request token coalescing overrides to the configured defaults"""
+    if flush_interval_ms is None:
+        flush_interval_ms = settings.stream_flush_interval_ms
+    if flush_size is None:
+        flush_size = settings.stream_flush_size
+    return max(flush_interval_ms, 0) / 1000, max(flush_size, 1)
+
+
+def sse_response(
+    stream: EventBuffer,
+    last_event_id: int = 0,
+    filename: Optional[str] = None
+) -> StreamingResponse:
+    """Create a Server-Sent Events response that replays and follows a stream"""
+    headers = {
+        "X-Content-Type": "streaming",
+        "X-Stream-Id": stream.stream_id,
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no"  # Stop nginx from buffering events
+    }
+    if filename is not None:
+        headers["X-Filename"] = encode_filename_for_header(filename)
+    
+    return StreamingResponse(
+        stream.subscribe(last_event_id, heartbeat_interval=settings.stream_heartbeat_interval),
+        media_type="text/event-stream; charset=utf-8",
+        headers=headers
+    )
+
+
 @app.post("/upload-stream")
 async def upload_pdf_stream(
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    incremental: bool = False,
+    flush_interval_ms: Optional[int] = None,
+    flush_size: Optional[int] = None,
+    previous_job_id: Optional[str] = None
 ):
     """
     Upload PDF file, convert to markdown, and clean with streaming LLM response
     
     Args:
         file: PDF file to convert
+        incremental: Stream typed Server-Sent Events page by page instead of
+            waiting for the whole document to be extracted (default: False)
+        flush_interval_ms: Maximum time tokens are batched before being written
+            (default: settings.stream_flush_interval_ms)
+        flush_size: Characters that trigger an immediate write
+            (default: settings.stream_flush_size)
+        previous_job_id: ``job_id`` of an earlier version of the document whose
+            cleaned text is reused for unchanged parts (incremental mode only,
+            rejected otherwise)
     
     Returns:
-        Streaming response with cleaned markdown content token by token
+        Streaming response with cleaned markdown content token by token, or
+        Server-Sent Events when ``incremental`` is set
     """
     
     # Validate file type
@@ -379,54 +530,106 @@ async def upload_pdf_stream(
             detail=f"File size too large. Maximum size is {settings.max_file_size_mb}MB"
         )
     
-    # Check if vLLM is available
-    if not await vllm_manager._is_vllm_running():
-        if settings.vllm_auto_start:
-            logger.info("Attempting to start vLLM service...")
-            success = await vllm_manager.start_vllm_service()
-            if not success:
-                raise HTTPException(
-                    status_code=503,
-                    detail="vLLM service is not available and failed to start."
-                )
-        else:
-            raise HTTPException(
-                status_code=503,
-                detail="vLLM service is not available."
-            )
+    if previous_job_id and not incremental:
+        raise HTTPException(
+            status_code=400,
+            detail="previous_job_id requires incremental=true"
+        )
+    
+    if previous_job_id and previous_job_id not in document_service.jobs:
+        raise HTTPException(
+            status_code=404,
+            detail="Previous job not found or expired"
+        )
+    
+    # Check if vLLM is available; waking it starts now so the model loads
+    # while the PDF is extracted
+    if not await vllm_lifecycle.preflight():
+        raise HTTPException(
+            status_code=503,
+            detail="vLLM service is not available."
+        )
     
     try:
         # Read file content
         file_content = await file.read()
         logger.info(f"Processing uploaded file for streaming: {file.filename} ({len(file_content)} bytes)")
         
-        # Convert PDF to markdown first (non-streaming) - using the correct attribute
-        raw_markdown = await document_service.pdf_service.convert_pdf_to_markdown(
-            file_content, file.filename
-        )
+        flush_interval, flush_size = resolve_stream_flush(flush_interval_ms, flush_size)
         
-        logger.info(f"PDF converted to markdown, starting streaming cleanup...")
+        if incremental:
+            key = None
+            stream = None
+            if settings.coalesce_conversions_enabled:
+                key = conversion_key(file_content, incremental=True, previous_job_id=previous_job_id)
+                stream = stream_registry.join(key)
+            if stream is not None:
+                # Replay and follow the identical upload's stream instead of converting again
+                logger.info(f"Joining stream {stream.stream_id} for identical upload {file.filename}")
+                return sse_response(stream, filename=file.filename)
+            
+            events = document_service.stream_document(
+                file_content, file.filename, stream_tokens=True, previous_job_id=previous_job_id
+            )
+            # Generation runs in the registry, detached from this connection,
+            # so a client that drops can resume via GET /upload-stream/{stream_id}
+            stream = stream_registry.start(events, flush_interval, flush_size, key=key)
+            return sse_response(stream, filename=file.filename)
+        
+        key = None
+        broadcast = None
+        if settings.coalesce_conversions_enabled:
+            key = conversion_key(file_content, incremental=False)
+            broadcast = text_broadcasts.join(key)
         
-        def generate_stream():
+        if broadcast is None:
+            # Convert PDF to markdown first (non-streaming) - using the correct attribute
+            if key is not None:
+                raw_markdown, _ = await conversion_calls.run(
+                    conversion_key(file_content, extract_only=True),
+                    lambda: document_service.pdf_service.convert_pdf_to_markdown(file_content, file.filename)
+                )
+            else:
+                raw_markdown = await document_service.pdf_service.convert_pdf_to_markdown(
+                    file_content, file.filename
+                )
+            
+            # The synchronous stream below bypasses the async client, so wait for vLLM here
+            await require_vllm()
+            if key is not None:
+                # An identical upload waiting on the same extraction may have started cleaning meanwhile
+                broadcast = text_broadcasts.join(key)
+        
+        if broadcast is None:
+            logger.info(f"PDF converted to markdown, starting streaming cleanup...")
+            
+            # Stream cleaned content using sync generator (consistent with clean_markdown_content_stream);
+            # it runs detached from this connection so identical uploads can follow the same tokens
+            generator = document_service.vllm_service.clean_markdown_content_stream(raw_markdown)
+            # Batch tokens so each HTTP chunk carries many of them
+            broadcast = text_broadcasts.start(
+                coalesce_text(generator, flush_interval, flush_size),
+                key=key,
+                metadata={"raw_content_length": len(raw_markdown)}
+            )
+        else:
+            logger.info(f"Following the cleanup stream of an identical upload for {file.filename}")
+        
+        async def generate_stream():
             """Generate streaming response with PDF metadata header"""
             try:
                 # Send metadata as first chunk (JSON format) - ensure UTF-8 encoding
                 metadata = {
                     "filename": file.filename,
                     "file_size_bytes": len(file_content),
-                    "raw_content_length": len(raw_markdown)
+                    **broadcast.metadata
                 }
                 # Ensure proper JSON serialization with UTF-8 support
                 metadata_json = json.dumps(metadata, ensure_ascii=False)
                 yield f"data: {metadata_json}\n\n"
                 
-                # Stream cleaned content using sync generator (consistent with clean_markdown_content_stream)
-                generator = document_service.vllm_service.clean_markdown_content_stream(raw_markdown)
-                for token in generator:  # Use sync iteration like in the working endpoint
-                    # Ensure token is properly encoded as UTF-8 string
-                    if isinstance(token, bytes):
-                        token = token.decode('utf-8', errors='replace')
-                    yield token
+                async for batch in broadcast.subscribe():
+                    yield batch
                     
             except Exception as stream_error:
                 logger.error(f"Error in PDF stream generation: {stream_error}")
@@ -455,6 +658,56 @@ async def upload_pdf_stream(
         )
 
 
+@app.get("/upload-stream/{stream_id}")
+async def resume_upload_stream(
+    stream_id: str,
+    last_event_id: Optional[str] = Header(None),
+    last_event_id_param: Optional[int] = Query(None, alias="last_event_id")
+):
+    """
+    Reconnect to an incremental upload stream
+    
+    Replays every event after the client's Last-Event-ID (header, or the
+    ``last_event_id`` query parameter for clients that cannot set headers) and
+    then keeps following the still-running conversion.
+    
+    Args:
+        stream_id: Id from the ``X-Stream-Id`` header or the metadata event
+        last_event_id: Id of the last event the client received
+    
+    Returns:
+        Server-Sent Events response continuing the stream
+    """
+    stream = stream_registry.get(stream_id)
+    if stream is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Stream not found or expired"
+        )
+    
+    resume_from = last_event_id_param or 0
+    if last_event_id:
+        try:
+            resume_from = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Last-Event-ID must be an integer")
+    
+    logger.info(f"Resuming stream {stream_id} after event {resume_from}")
+    return sse_response(stream, resume_from)
+
+
+@app.websocket("/ws/convert")
+async def convert_over_websocket(websocket: WebSocket):
+    """
+    Convert PDFs over a single WebSocket connection
+    
+    Several conversions can share one connection. Files are uploaded as binary
+    frames and each conversion can be paused, resumed, cancelled or have a
+    chunk re-cleaned while it streams events back (see ``ConversionChannel``).
+    """
+    await ConversionChannel(websocket, document_service).run()
+
+
 if __name__ == "__main__":
     import uvicorn
     
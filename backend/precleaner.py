@@ -0,0 +1,259 @@
+import hashlib
+import re
+from collections import Counter
+from typing import List, Optional
+
+LIGATURES = {
+    "ﬀ": "ff",
+    "ﬁ": "fi",
+    "ﬂ": "fl",
+    "ﬃ": "ffi",
+    "ﬄ": "ffl",
+    "ﬅ": "st",
+    "ﬆ": "st"
+}
+
+BULLET_GLYPHS = "•●▪◦‣∙○■□➢►▶✓"
+
+_LIGATURE_PATTERN = re.compile("|".join(LIGATURES))
+_BULLET_PATTERN = re.compile(rf"^(\s*)[{BULLET_GLYPHS}·]\s*", re.MULTILINE)
+_HYPHENATION_PATTERN = re.compile(r"([a-z])-\n[ \t]*([a-z])")
+_ROMAN_NUMERAL = r"(?=[ivxlcdm])m{0,3}(?:cm|cd|d?c{0,3})(?:xc|xl|l?x{0,3})(?:ix|iv|v?i{0,3})"
+_PAGE_NUMERAL = rf"(?:\d{{1,4}}|{_ROMAN_NUMERAL}|{_ROMAN_NUMERAL.upper()})"
+_PAGE_NUMBER_PATTERN = re.compile(
+    rf"^\s*(?:(?i:page)\s+)?[-–—]?\s*{_PAGE_NUMERAL}\s*[-–—]?"
+    r"(?:\s*(?:/|(?i:of))\s*\d{1,4})?\s*$"
+)
+_BARE_NUMBER_PATTERN = re.compile(rf"^\s*({_PAGE_NUMERAL})\s*$")
+_ROMAN_VALUES = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100, "d": 500, "m": 1000}
+_STRUCTURAL_LINE_PATTERN = re.compile(r"^\s*(?:#|[-*+] |\d+[.)] |>|\||```)")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+_NUMBER_TOKEN_PATTERN = re.compile(rf"\b(?:\d+|{_ROMAN_NUMERAL})\b")
+_SENTENCE_END = ".!?:;\"')]"
+
+
+def normalize_glyphs(text: str) -> str:
+    """Replace ligature glyphs with their letters and bullet glyphs with Markdown list markers"""
+    text = _LIGATURE_PATTERN.sub(lambda match: LIGATURES[match.group(0)], text)
+    return _BULLET_PATTERN.sub(r"\1- ", text)
+
+
+def join_hyphenated_words(text: str) -> str:
+    """Rejoin lowercase words that were hyphenated across a line break"""
+    return _HYPHENATION_PATTERN.sub(r"\1\2", text)
+
+
+def join_wrapped_lines(text: str) -> str:
+    """
+    Join prose lines that were wrapped mid-sentence
+    
+    A line is joined to the next when it does not end a sentence, neither line
+    is Markdown structure (heading, list item, quote, table, code fence) and
+    the next line continues in lowercase. Code blocks are left untouched.
+    """
+    lines = text.split("\n")
+    joined: List[str] = []
+    in_code_block = False
+    
+    for line in lines:
+        if line.lstrip().startswith("```"):
+            in_code_block = not in_code_block
+            joined.append(line)
+            continue
+        
+        previous = joined[-1] if joined else ""
+        if (
+            not in_code_block
+            and previous.strip()
+            and line.strip()
+            and not previous.lstrip().startswith("```")
+            and previous.rstrip()[-1] not in _SENTENCE_END
+            and not _STRUCTURAL_LINE_PATTERN.match(previous)
+            and not _STRUCTURAL_LINE_PATTERN.match(line)
+            and line.lstrip()[0].islower()
+        ):
+            joined[-1] = f"{previous.rstrip()} {line.strip()}"
+        else:
+            joined.append(line)
+    
+    return "\n".join(joined)
+
+
+def is_page_number(line: str) -> bool:
+    """Whether a line holds nothing but a page number such as ``12``, ``- 12 -`` or ``Page 3 of 10``"""
+    return bool(line.strip()) and bool(_PAGE_NUMBER_PATTERN.match(line))
+
+
+def bare_number_value(line: str) -> Optional[int]:
+    """
+    Value of a line holding nothing but a number or a well-formed roman numeral
+    
+    Such lines are only page numbers in context: "I", "DC" or "2024" are
+    also ordinary text.
+    
+    Returns:
+        The number, or None if the line is anything else
+    """
+    match = _BARE_NUMBER_PATTERN.match(line)
+    if not match:
+        return None
+    token = match.group(1)
+    if token.isdigit():
+        return int(token)
+    values = [_ROMAN_VALUES[char] for char in token.lower()]
+    return sum(
+        -value if i + 1 < len(values) and value < values[i + 1] else value
+        for i, value in enumerate(values)
+    )
+
+
+class HeaderFooterDetector:
+    """
+    Detect running headers and footers across the pages of a document
+    
+    The first and last ``edge_lines`` non-blank lines of every observed page
+    are normalized (case, whitespace, and digits or roman numerals collapsed
+    so changing page numbers still match) and hashed. A line whose hash
+    occurs at the same edge of at least ``min_pages`` pages is treated as a
+    running header or footer, unless its normalized text also repeats within
+    a single page (templated body lines such as numbered table rows).
+    
+    Decorated page numbers (``- 12 -``, ``Page 3 of 10``) are always stripped
+    from the edges. A bare number or roman numeral is only stripped when it
+    recurs at that edge like a running footer, or continues the numbering of
+    a neighbouring page, so edge lines like "I" or "2024" stay.
+    """
+    
+    def __init__(self, edge_lines: int = 3, min_pages: int = 3):
+        self.edge_lines = edge_lines
+        self.min_pages = min_pages
+        self.pages_observed = 0
+        self.lines_removed = 0
+        self.chars_removed = 0
+        self._page_counts: Counter = Counter()
+        self._body_keys: set = set()
+        self._edge_numbers: List[set] = []
+    
+    @staticmethod
+    def line_key(edge: str, line: str) -> bytes:
+        """Hash of a line's normalized text at the given edge (``header``, ``footer`` or ``body``)"""
+        normalized = _WHITESPACE_PATTERN.sub(" ", line.strip().lower())
+        normalized = _NUMBER_TOKEN_PATTERN.sub("#", normalized)
+        return hashlib.blake2b(f"{edge}\0{normalized}".encode(), digest_size=8).digest()
+    
+    def observe(self, page: str) -> None:
+        """Count the edge lines of a page"""
+        content = [line for line in page.split("\n") if line.strip()]
+        keys = {self.line_key("header", line) for line in content[:self.edge_lines]}
+        keys |= {self.line_key("footer", line) for line in content[-self.edge_lines:]}
+        self._page_counts.update(keys)
+        
+        body_counts = Counter(self.line_key("body", line) for line in content)
+        self._body_keys.update(key for key, count in body_counts.items() if count > 1)
+        edges = content[:self.edge_lines] + content[-self.edge_lines:]
+        self._edge_numbers.append({bare_number_value(line) for line in edges} - {None})
+        self.pages_observed += 1
+    
+    def is_repeated(self, edge: str, line: str) -> bool:
+        """Whether a line recurs at this edge on enough observed pages"""
+        return (
+            self._page_counts[self.line_key(edge, line)] >= self.min_pages
+            and self.line_key("body", line) not in self._body_keys
+        )
+    
+    def continues_numbering(self, index: Optional[int], line: str) -> bool:
+        """Whether a bare number on the observed page ``index`` follows on from the page before or after it"""
+        value = bare_number_value(line)
+        if value is None or index is None:
+            return False
+        return (
+            (0 < index <= len(self._edge_numbers) and value - 1 in self._edge_numbers[index - 1])
+            or (index + 1 < len(self._edge_numbers) and value + 1 in self._edge_numbers[index + 1])
+        )
+    
+    def is_page_number_at(self, edge: str, index: Optional[int], line: str) -> bool:
+        """Whether an edge line is a page number in the context of the observed pages"""
+        if not is_page_number(line):
+            return False
+        if bare_number_value(line) is None:
+            return True
+        return self.is_repeated(edge, line) or self.continues_numbering(index, line)
+    
+    def strip(self, lines: List[str], index: Optional[int] = None) -> List[str]:
+        """
+        Remove page numbers and repeated headers/footers from the edges of a page
+        
+        Args:
+            lines: Lines of one page
+            index: Position of the page among the observed pages, used to
+                recognize bare page numbers by their sequence
+        
+        Returns:
+            The remaining lines
+        """
+        for edge, side in (("header", 0), ("footer", -1)):
+            for _ in range(self.edge_lines):
+                content = [i for i, line in enumerate(lines) if line.strip()]
+                if not content:
+                    return lines
+                
+                position = content[side]
+                line = lines[position]
+                if not self.is_page_number_at(edge, index, line) and not self.is_repeated(edge, line):
+                    break
+                
+                del lines[position]
+                self.lines_removed += 1
+                self.chars_removed += len(line) + 1
+        
+        return lines
+    
+    @property
+    def tokens_saved(self) -> int:
+        """Estimated prompt tokens removed, at the ~4 characters per token VLLMService assumes"""
+        return self.chars_removed // 4
+
+
+class PreCleaner:
+    """
+    Deterministic pre-cleaning of extracted pages before they reach the LLM
+    
+    Every page is passed to ``add_page`` as it is extracted so running
+    headers and footers can be detected across pages; ``clean_page`` then
+    strips them along with page numbers, rejoins hyphenated words and wrapped
+    lines, and normalizes ligature and bullet glyphs. Cleaning a page after
+    its neighbours were added lets headers be removed from the first pages too.
+    """
+    
+    def __init__(self, edge_lines: int = 3, min_pages: int = 3):
+        self.headers_footers = HeaderFooterDetector(edge_lines, min_pages)
+        self.chars_removed = 0
+    
+    def add_page(self, page: str) -> None:
+        """Record a newly extracted page for header/footer detection"""
+        self.headers_footers.observe(page)
+    
+    def clean_page(self, page: str, index: Optional[int] = None) -> str:
+        """
+        Pre-clean one page
+        
+        Args:
+            page: Raw Markdown of the page
+            index: Position of the page among the added pages
+        
+        Returns:
+            The page with mechanical extraction artifacts fixed
+        """
+        lines = self.headers_footers.strip(page.split("\n"), index)
+        text = "\n".join(lines)
+        text = join_hyphenated_words(text)
+        text = join_wrapped_lines(text)
+        text = normalize_glyphs(text)
+        
+        self.chars_removed += len(page) - len(text)
+        return text
+
+
+def preclean_markdown(text: str) -> str:
+    """Pre-clean a single Markdown document that is not split into pages"""
+    return PreCleaner().clean_page(text)
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import psutil
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessSample(NamedTuple):
+    """Resource usage of the vLLM process and its children at one point in time"""
+    timestamp: float
+    pid: int
+    status: str
+    rss_mb: float
+    cpu_percent: float
+    gpu_memory_mb: Optional[float]
+    open_fds: Optional[int]
+    threads: int
+
+
+class ProcessSampler:
+    """
+    Sample the vLLM process tree's resource usage in the background
+    
+    Every ``process_sample_interval`` seconds, RSS, CPU, GPU memory (when
+    NVML is available), open file descriptors and threads of the process
+    returned by ``get_pid`` and its children (vLLM runs its engine in child
+    processes) are recorded into a ring buffer of ``process_sample_history``
+    samples. Status endpoints read the latest sample instead of querying the
+    processes on every request; CPU percentages are measured between
+    consecutive samples, so they are meaningful from the second sample on.
+    """
+    
+    def __init__(self, get_pid: Callable[[], Optional[int]], max_samples: Optional[int] = None):
+        self.get_pid = get_pid
+        self.samples = deque(maxlen=max_samples or settings.process_sample_history)
+        # psutil keeps the CPU time of the previous call per Process object
+        self._processes: Dict[int, psutil.Process] = {}
+        self._nvml: Optional[bool] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def sample(self) -> Optional[ProcessSample]:
+        """
+        Measure the process tree now and record the sample
+        
+        Blocking (reads /proc and NVML); run it in a worker thread.
+        
+        Returns:
+            The sample, or None if there is no process to measure
+        """
+        pid = self.get_pid()
+        if pid is None:
+            self._processes.clear()
+            return None
+        try:
+            root = self._process(pid)
+            tree = [root] + [self._process(child.pid) for child in root.children(recursive=True)]
+        except psutil.NoSuchProcess:
+            self._processes.clear()
+            return None
+        
+        rss = 0
+        cpu = 0.0
+        fds: Optional[int] = 0
+        threads = 0
+        alive = set()
+        for proc in tree:
+            try:
+                with proc.oneshot():
+                    rss += proc.memory_info().rss
+                    cpu += proc.cpu_percent()
+                    threads += proc.num_threads()
+                    if fds is not None:
+                        try:
+                            fds += proc.num_fds()
+                        except (psutil.AccessDenied, AttributeError):
+                            fds = None  # Not permitted, or not a POSIX system
+                alive.add(proc.pid)
+            except psutil.NoSuchProcess:
+                continue
+        # Forget processes that exited so their CPU baselines do not linger
+        for gone in set(self._processes) - alive:
+            del self._processes[gone]
+        
+        try:
+            status = root.status()
+        except psutil.NoSuchProcess:
+            status = psutil.STATUS_DEAD
+        
+        sample = ProcessSample(
+            timestamp=time.time(),
+            pid=pid,
+            status=status,
+            rss_mb=round(rss / 1024 / 1024, 1),
+            cpu_percent=round(cpu, 1),
+            gpu_memory_mb=self._gpu_memory_mb(alive),
+            open_fds=fds,
+            threads=threads
+        )
+        self.samples.append(sample)
+        return sample
+    
+    def _process(self, pid: int) -> psutil.Process:
+        if pid not in self._processes:
+            self._processes[pid] = psutil.Process(pid)
+        return self._processes[pid]
+    
+    def _gpu_memory_mb(self, pids: set) -> Optional[float]:
+        """GPU memory used by the given processes, or None without NVML"""
+        if self._nvml is False:
+            return None
+        try:
+            import pynvml
+            if self._nvml is None:
+                pynvml.nvmlInit()
+                self._nvml = True
+            used = 0
+            for index in range(pynvml.nvmlDeviceGetCount()):
+                handle = pynvml.nvmlDeviceGetHandleByIndex(index)
+                for proc in pynvml.nvmlDeviceGetComputeRunningProcesses(handle):
+                    if proc.pid in pids and proc.usedGpuMemory:
+                        used += proc.usedGpuMemory
+            return round(used / 1024 / 1024, 1)
+        except ImportError:
+            self._nvml = False
+            return None
+        except Exception as e:
+            if self._nvml is None:
+                logger.info(f"GPU memory sampling unavailable: {e}")
+                self._nvml = False
+            return None
+    
+    def latest(self) -> Optional[ProcessSample]:
+        """Most recent sample of the current process, or None"""
+        pid = self.get_pid()
+        if not self.samples or self.samples[-1].pid != pid:
+            return None
+        return self.samples[-1]
+    
+    def series(self, seconds: Optional[float] = None) -> List[dict]:
+        """
+        Recorded samples, oldest first
+        
+        Args:
+            seconds: Only return samples taken within this many seconds
+        """
+        samples = list(self.samples)
+        if seconds is not None:
+            cutoff = time.time() - seconds
+            samples = [sample for sample in samples if sample.timestamp >= cutoff]
+        return [sample._asdict() for sample in samples]
+    
+    def start(self) -> None:
+        """Start sampling in the background"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.sample)
+            except Exception as e:
+                logger.warning(f"Process sampling failed: {e}")
+            await asyncio.sleep(settings.process_sample_interval)
@@ -0,0 +1,78 @@
+import hashlib
+from typing import Dict, List
+
+from edit_script import EDIT_SCRIPT_INSTRUCTIONS
+
+# Bump whenever CLEANING_PREFIX changes; cached results are keyed by it
+PROMPT_VERSION = "clean-v1"
+
+# Shared by every cleaning request and never formatted, so vLLM's prefix cache
+# can reuse its KV blocks across requests. Task-specific text and the content
+# always come after it, in the user message.
+CLEANING_PREFIX = """You clean Markdown that was extracted from PDF files. /no_think
+
+Fix extraction artifacts and nothing else:
+- Rejoin words hyphenated across line breaks and lines wrapped in the middle of a sentence.
+- Remove running page headers, footers and page numbers.
+- Replace ligature glyphs and broken characters with the intended letters.
+- Restore headings, lists, tables and code blocks as proper Markdown.
+- Keep the wording, language, order and all content of the document unchanged.
+- Never summarize, translate, explain or add commentary.
+Respond directly without thinking."""
+
+
+class PromptTemplate:
+    """A cleaning task: the shared prefix followed by task instructions and the content"""
+    
+    def __init__(self, name: str, instruction: str):
+        self.name = name
+        self.instruction = instruction
+    
+    def build_messages(self, content: str) -> List[Dict[str, str]]:
+        """
+        Build chat messages for one request
+        
+        Args:
+            content: Text to clean, already in the form the task expects
+        
+        Returns:
+            Chat messages starting with the byte-identical cleaning prefix
+        """
+        return [
+            {"role": "system", "content": CLEANING_PREFIX},
+            {"role": "user", "content": f"{self.instruction}\n\n{content}"}
+        ]
+
+
+PROMPT_TEMPLATES: Dict[str, PromptTemplate] = {
+    "rewrite": PromptTemplate(
+        "rewrite",
+        "Output the cleaned Markdown of the following text and nothing else."
+    ),
+    "edits": PromptTemplate("edits", EDIT_SCRIPT_INSTRUCTIONS),
+    "table": PromptTemplate(
+        "table",
+        "The following lines are a table whose columns were flattened into whitespace. "
+        "Return its cells as JSON with a \"header\" list and a \"rows\" list of lists, "
+        "one string per cell, keeping every value exactly as written."
+    ),
+    "equation": PromptTemplate(
+        "equation",
+        "The following lines are a formula extracted from a PDF. "
+        "Return it as display LaTeX between $$ lines, without any other text."
+    ),
+}
+
+
+def get_prompt(name: str) -> PromptTemplate:
+    """Look up a registered prompt template by name"""
+    try:
+        return PROMPT_TEMPLATES[name]
+    except KeyError:
+        raise Exception(f"Unknown prompt template: {name}")
+
+
+def prompt_fingerprint() -> str:
+    """Short hash of the version and shared prefix, for cache keys and status output"""
+    digest = hashlib.sha256(f"{PROMPT_VERSION}\0{CLEANING_PREFIX}".encode()).hexdigest()
+    return f"{PROMPT_VERSION}-{digest[:12]}"
@@ -0,0 +1,99 @@
+import re
+from typing import Dict
+
+# Signal rates at which a chunk is considered to need LLM cleaning
+QUALITY_THRESHOLDS = {
+    "hyphenation": 0.02,      # words broken across lines, per line
+    "ligatures": 0.001,       # ligature/cid artifacts, per character
+    "line_wraps": 0.35,       # prose lines wrapped mid-sentence, per line
+    "garbage": 0.005,         # control/replacement/private-use characters, per character
+    "table_misalignment": 0.1  # misaligned table rows, per line
+}
+
+LIGATURE_CHARACTERS = "ﬀﬁﬂﬃﬄﬅﬆ"
+
+_HYPHENATION_PATTERN = re.compile(r"[a-z]-\n[ \t]*[a-z]")
+_LIGATURE_PATTERN = re.compile(rf"[{LIGATURE_CHARACTERS}]|\(cid:\d+\)")
+_GARBAGE_PATTERN = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\x7f\ufffd\ue000-\uf8ff]")
+_WHITESPACE_COLUMNS_PATTERN = re.compile(r"\S(?: {3,}|\t)\S.*\S(?: {3,}|\t)\S")
+_STRUCTURAL_LINE_PATTERN = re.compile(r"^\s*(?:#|[-*+] |\d+[.)] |>|\||```)")
+
+
+def score_markdown_quality(text: str) -> Dict[str, float]:
+    """
+    Measure extraction artifacts that LLM cleaning would fix
+    
+    Every signal is a rate (per line or per character) so chunks of any size
+    compare against the same thresholds. The ``score`` is the worst signal
+    relative to its threshold in ``QUALITY_THRESHOLDS``; 1.0 or more means at
+    least one kind of artifact is common enough to be worth cleaning.
+    
+    Args:
+        text: Raw Markdown of a page or chunk
+    
+    Returns:
+        Dictionary with one rate per signal plus the combined ``score``
+    """
+    lines = [line for line in text.split("\n") if line.strip()]
+    line_count = max(len(lines), 1)
+    char_count = max(len(text), 1)
+    
+    scores = {
+        "hyphenation": len(_HYPHENATION_PATTERN.findall(text)) / line_count,
+        "ligatures": len(_LIGATURE_PATTERN.findall(text)) / char_count,
+        "line_wraps": _line_wrap_rate(lines),
+        "garbage": len(_GARBAGE_PATTERN.findall(text)) / char_count,
+        "table_misalignment": _table_misalignment_rate(lines)
+    }
+    scores["score"] = max(
+        scores[signal] / threshold for signal, threshold in QUALITY_THRESHOLDS.items()
+    )
+    return {name: round(value, 4) for name, value in scores.items()}
+
+
+def needs_cleaning(text: str, max_score: float = 1.0) -> tuple[bool, Dict[str, float]]:
+    """
+    Decide whether a chunk is worth sending to the LLM
+    
+    Args:
+        text: Raw Markdown of a page or chunk
+        max_score: Highest quality score that is still treated as clean
+    
+    Returns:
+        Tuple of (needs_cleaning, quality scores)
+    """
+    scores = score_markdown_quality(text)
+    return scores["score"] >= max_score, scores
+
+
+def _line_wrap_rate(lines: list[str]) -> float:
+    """Share of prose lines that end mid-sentence and continue in lowercase"""
+    prose = [line.strip() for line in lines if not _STRUCTURAL_LINE_PATTERN.match(line)]
+    if len(prose) < 2:
+        return 0.0
+    
+    wraps = sum(
+        1 for line, following in zip(prose, prose[1:])
+        if line[-1] not in ".:;!?)\"'" and following[0].islower()
+    )
+    return wraps / (len(prose) - 1)
+
+
+def _table_misalignment_rate(lines: list[str]) -> float:
+    """Share of lines that are broken Markdown table rows or space-aligned columns"""
+    misaligned = 0
+    previous_columns = None
+    
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith("|"):
+            columns = stripped.strip("|").count("|") + 1
+            if previous_columns is not None and columns != previous_columns:
+                misaligned += 1
+            previous_columns = columns
+        else:
+            previous_columns = None
+            if _WHITESPACE_COLUMNS_PATTERN.search(stripped):
+                misaligned += 1
+    
+    return misaligned / max(len(lines), 1)
@@ -0,0 +1,183 @@
+import re
+from typing import Any, Dict, List, NamedTuple
+
+# JSON schema the model's table output is constrained to (vLLM guided_json)
+TABLE_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "header": {"type": "array", "items": {"type": "string"}, "minItems": 1},
+        "rows": {
+            "type": "array",
+            "items": {"type": "array", "items": {"type": "string"}}
+        }
+    },
+    "required": ["header", "rows"],
+    "additionalProperties": False
+}
+
+# Display LaTeX only (vLLM guided_regex); keeps the model from adding prose around formulas
+EQUATION_PATTERN = r"\$\$\n[^$]{1,2000}\n\$\$"
+
+MATH_SYMBOLS = "=+−×÷^_∑∏∫√∞≤≥≈≠±∂∇αβγδεζηθικλμνξπρστυφχψωΓΔΘΛΞΠΣΦΨΩ"
+MATH_RELATIONS = "=≤≥≈≠∑∏∫√"
+
+MATH_FUNCTIONS = {"sin", "cos", "tan", "log", "exp", "lim", "max", "min", "det", "mod"}
+
+_COLUMN_GAP_PATTERN = re.compile(r" {2,}|\t+")
+_STRUCTURAL_LINE_PATTERN = re.compile(r"^\s*(?:#|[-*+] |>|```)")
+_SENTENCE_END_PATTERN = re.compile(r"[^\W\d][.!?]$")
+_PLAIN_WORD_PATTERN = re.compile(r"^[A-Za-z]{3,}[.,;:]?$")
+_MATH_PUNCTUATION = set("()[]{}/*<>|")
+
+# Most words a whitespace table cell holds; longer runs are prose split by double spaces
+MAX_CELL_WORDS = 6
+# Fewest math tokens (symbols, numbers, variables) a line needs to be a formula
+MIN_MATH_TOKENS = 3
+
+
+class Region(NamedTuple):
+    """A run of lines (0-based, inclusive) that needs a specialized repair"""
+    kind: str
+    start: int
+    end: int
+
+
+def table_cells(line: str) -> List[str]:
+    """Split a line into cells at runs of two or more spaces or tabs"""
+    return _COLUMN_GAP_PATTERN.split(line.strip())
+
+
+def _is_table_cell(cell: str) -> bool:
+    """Whether a cell is short and does not end a sentence"""
+    return len(cell.split()) <= MAX_CELL_WORDS and not _SENTENCE_END_PATTERN.search(cell)
+
+
+def is_table_line(line: str) -> bool:
+    """Whether a line looks like a whitespace-aligned row of at least three data cells"""
+    stripped = line.strip()
+    if not stripped or stripped.startswith("|") or _STRUCTURAL_LINE_PATTERN.match(stripped):
+        return False
+    cells = table_cells(stripped)
+    return len(cells) >= 3 and all(_is_table_cell(cell) for cell in cells)
+
+
+def _is_math_token(token: str) -> bool:
+    """Whether a token is a symbol, number, variable or bracketed expression"""
+    if len(token) == 1 and token.isalpha():
+        return True
+    return any(char in MATH_SYMBOLS or char in _MATH_PUNCTUATION or char.isnumeric() for char in token)
+
+
+def _is_plain_word(token: str) -> bool:
+    """Whether a token is an ordinary word rather than a variable or function name"""
+    return bool(_PLAIN_WORD_PATTERN.match(token)) and token.rstrip(".,;:").lower() not in MATH_FUNCTIONS
+
+
+def is_equation_line(line: str) -> bool:
+    """
+    Whether a short line is a formula
+    
+    It needs a relation or operator, several math tokens, a high density of math
+    symbols and no two plain words in a row, so prose such as ``Total = 5 items``
+    is not mistaken for an equation.
+    """
+    stripped = line.strip()
+    if not stripped or len(stripped) > 200 or stripped.startswith(("$$", "|", "#")):
+        return False
+    if not any(symbol in stripped for symbol in MATH_RELATIONS):
+        return False
+    tokens = stripped.split()
+    if sum(1 for token in tokens if _is_math_token(token)) < MIN_MATH_TOKENS:
+        return False
+    if any(_is_plain_word(first) and _is_plain_word(second) for first, second in zip(tokens, tokens[1:])):
+        return False
+    visible = stripped.replace(" ", "")
+    return sum(1 for char in visible if char in MATH_SYMBOLS) / len(visible) >= 0.08
+
+
+def detect_regions(text: str, min_table_lines: int = 2) -> List[Region]:
+    """
+    Find table-like and formula-like regions in extracted Markdown
+    
+    Tables are runs of at least ``min_table_lines`` consecutive whitespace-aligned
+    rows with the same number of columns; equations are runs of math-dense lines.
+    Code blocks are skipped.
+    
+    Args:
+        text: Markdown of a chunk
+        min_table_lines: Rows a whitespace table needs to be treated as a table
+    
+    Returns:
+        Regions in document order
+    """
+    regions: List[Region] = []
+    lines = text.split("\n")
+    in_code_block = False
+    run_kind = None
+    run_start = 0
+    run_columns = 0
+    
+    def close_run(end: int):
+        if run_kind == "table" and end - run_start + 1 >= min_table_lines:
+            regions.append(Region("table", run_start, end))
+        elif run_kind == "equation":
+            regions.append(Region("equation", run_start, end))
+    
+    for index, line in enumerate(lines):
+        if line.lstrip().startswith("```"):
+            in_code_block = not in_code_block
+        
+        kind = None
+        if not in_code_block:
+            if is_table_line(line):
+                kind = "table"
+            elif is_equation_line(line):
+                kind = "equation"
+        
+        columns = len(table_cells(line)) if kind == "table" else 0
+        if kind != run_kind or columns != run_columns:
+            close_run(index - 1)
+            run_kind = kind
+            run_start = index
+            run_columns = columns
+    
+    close_run(len(lines) - 1)
+    return regions
+
+
+def render_markdown_table(table: Dict[str, Any]) -> str:
+    """
+    Render a table parsed from the model's guided JSON output as a Markdown table
+    
+    Raises:
+        ValueError: If the table has no header
+    """
+    header = [str(cell) for cell in table.get("header") or []]
+    if not header:
+        raise ValueError("Table has no header")
+    
+    def format_row(cells: List[Any]) -> str:
+        cells = [str(cell).replace("|", "\\|").replace("\n", " ").strip() for cell in cells]
+        cells = (cells + [""] * len(header))[:len(header)]
+        return "| " + " | ".join(cells) + " |"
+    
+    lines = [format_row(header), "| " + " | ".join("---" for _ in header) + " |"]
+    lines.extend(format_row(row) for row in table.get("rows") or [])
+    return "\n".join(lines)
+
+
+def splice_regions(text: str, replacements: List[tuple]) -> str:
+    """
+    Replace regions of a text with their repaired content
+    
+    Args:
+        text: Original text the regions were detected in
+        replacements: ``(region, new_text)`` pairs; regions must not overlap
+    
+    Returns:
+        Text with every region replaced
+    """
+    lines = text.split("\n")
+    for region, new_text in sorted(replacements, key=lambda item: item[0].start, reverse=True):
+        lines[region.start:region.end + 1] = new_text.split("\n")
+    return "\n".join(lines)
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import httpx
+import openai
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling vLLM while the circuit breaker is open"""
+    
+    def __init__(self, retry_after: float):
+        super().__init__(f"vLLM circuit breaker is open, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Fail fast while vLLM is down instead of letting every request wait out its timeout
+    
+    After ``failure_threshold`` consecutive failures the circuit opens and calls
+    raise CircuitOpenError. Once ``reset_timeout`` seconds have passed, one
+    trial call is let through (half-open): success closes the circuit, failure
+    opens it for another ``reset_timeout``. Calls made while the trial is in
+    flight are told to retry after ``HALF_OPEN_RETRY_AFTER`` seconds.
+    """
+    
+    HALF_OPEN_RETRY_AFTER = 1.0
+    
+    def __init__(self, failure_threshold: int, reset_timeout: float, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_started_at = 0.0
+        self.times_opened = 0
+    
+    def before_call(self) -> None:
+        """
+        Check that a call may go ahead
+        
+        Raises:
+            CircuitOpenError: While the circuit is open, or half-open with a trial already let through
+        """
+        if self.state == "closed":
+            return
+        
+        now = self.clock()
+        if self.state == "open":
+            retry_after = self.retry_after()
+            if retry_after > 0:
+                raise CircuitOpenError(retry_after)
+        elif now - self.trial_started_at < self.reset_timeout:
+            raise CircuitOpenError(self.HALF_OPEN_RETRY_AFTER)
+        
+        # Let one trial call through (or another one, if the last never reported back)
+        self.state = "half_open"
+        self.trial_started_at = now
+    
+    def record_success(self) -> None:
+        if self.state != "closed":
+            logger.info("vLLM circuit breaker closed")
+        self.state = "closed"
+        self.consecutive_failures = 0
+    
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            self.trip()
+    
+    def trip(self) -> None:
+        """Open the circuit, e.g. when vLLM is known to be restarting"""
+        if self.state != "open":
+            logger.warning(f"vLLM circuit breaker opened for {self.reset_timeout}s")
+            self.times_opened += 1
+        self.state = "open"
+        self.opened_at = self.clock()
+    
+    def retry_after(self) -> float:
+        """Seconds until a call will be let through again"""
+        if self.state != "open":
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - self.clock())
+    
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "retry_after_seconds": round(self.retry_after(), 1)
+        }
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether an error is transient: connection failures, timeouts, rate limits and 5xx responses"""
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError, httpx.TransportError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """Exponential backoff with full jitter for the given 0-based retry attempt"""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+async def call_with_retry(
+    call: Callable[[], Awaitable[T]],
+    breaker: Optional[CircuitBreaker],
+    attempts: int,
+    base_delay: float,
+    max_delay: float
+) -> T:
+    """
+    Run a vLLM call, retrying transient failures with jittered exponential backoff
+    
+    Args:
+        call: Coroutine function making the request
+        breaker: Circuit breaker guarding the endpoint, if any
+        attempts: Retries after the first try
+        base_delay: Delay before the first retry, doubled for each further one
+        max_delay: Upper bound for a single delay
+    
+    Returns:
+        Result of the call
+    
+    Raises:
+        CircuitOpenError: If the circuit is or becomes open
+        Exception: The last error, if it is not transient or retries are exhausted
+    """
+    for attempt in range(attempts + 1):
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = await call()
+        except Exception as e:
+            if not is_retryable(e):
+                # vLLM answered, so it is up even though this request failed
+                if breaker is not None:
+                    breaker.record_success()
+                raise
+            if breaker is not None:
+                breaker.record_failure()
+            if attempt == attempts:
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            logger.warning(f"vLLM request failed ({e}), retry {attempt + 1}/{attempts} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
@@ -1,17 +1,66 @@
+import asyncio
+import json
 import logging
+import re
 import tempfile
+import time
 import os
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, AsyncIterator, Iterator
 from io import BytesIO
 
 import httpx
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from markitdown import MarkItDown
 
+from chunk_cache import ChunkCache
 from config import settings
+from drift import has_drifted
+from edit_script import EditScriptError, apply_edits, number_lines, parse_edit_script
+from hedging import HedgingPolicy
+from jobs import ConversionJob, JobStore, new_job_id, split_paragraphs
+from lifecycle import vllm_lifecycle
+from precleaner import PreCleaner
+from prompts import get_prompt
+from resilience import CircuitBreaker, CircuitOpenError, backoff_delay, call_with_retry, is_retryable
+from regions import EQUATION_PATTERN, TABLE_SCHEMA, detect_regions, render_markdown_table, splice_regions
+from quality import needs_cleaning
 
 logger = logging.getLogger(__name__)
 
+# Separator used when joining extracted pages back into one document
+PAGE_SEPARATOR = "\n"
+
+# Lets vLLM extend a trailing assistant message instead of starting a new turn
+CONTINUATION_REQUEST = {"continue_final_message": True, "add_generation_prompt": False}
+
+
+class TruncatedOutputError(Exception):
+    """vLLM stopped at the context limit before the response was complete"""
+    
+    def __init__(self, message: str, partial: str = ""):
+        super().__init__(message)
+        self.partial = partial
+
+
+def split_in_half(content: str) -> Optional[tuple[str, str]]:
+    """
+    Split content into two parts at the paragraph break closest to its middle
+    
+    Falls back to the line break closest to the middle when there is no
+    paragraph break. Joining the parts with a newline restores the content.
+    
+    Returns:
+        The two parts, or None if the content is a single line
+    """
+    lines = content.split("\n")
+    if len(lines) < 2:
+        return None
+    
+    middle = len(lines) // 2
+    paragraph_breaks = [index for index, line in enumerate(lines) if index and not line.strip()]
+    split_at = min(paragraph_breaks, key=lambda index: abs(index - middle)) if paragraph_breaks else middle
+    return "\n".join(lines[:split_at]), "\n".join(lines[split_at:])
+
 
 class PDFConverterService:
     """Service for converting PDF files to Markdown"""
@@ -19,10 +68,38 @@ class PDFConverterService:
     def __init__(self):
         self.md_converter = MarkItDown()
     
+    def conversion_method(self) -> str:
+        """
+        How PDFs are converted in this environment
+        
+        Returns:
+            "MarkItDown" when pages are extracted one by one with MarkItDown's
+            PDF converter logic (pdfplumber for tables and forms, pdfminer for
+            text), "pdfminer" when pdfplumber is missing and pages are plain
+            pdfminer text, or "MarkItDown (whole document)" when per-page
+            extraction is unavailable
+        """
+        try:
+            import pdfplumber  # noqa: F401
+            from markitdown.converters._pdf_converter import (  # noqa: F401
+                _extract_form_content_from_words, _merge_partial_numbering_lines
+            )
+            return "MarkItDown"
+        except ImportError:
+            pass
+        try:
+            from pdfminer.high_level import extract_pages  # noqa: F401
+            return "pdfminer"
+        except ImportError:
+            return "MarkItDown (whole document)"
+    
     async def convert_pdf_to_markdown(self, file_content: bytes, filename: str) -> str:
         """
         Convert PDF file content to Markdown format
         
+        Joins the pages of ``iter_pdf_pages`` when per-page extraction is
+        available, so every endpoint gets the same Markdown for a PDF.
+        
         Args:
             file_content: PDF file content as bytes
             filename: Original filename for logging
@@ -33,6 +110,13 @@ class PDFConverterService:
         Raises:
             Exception: If conversion fails
         """
+        if self.conversion_method() == "MarkItDown (whole document)":
+            return await self._convert_whole_document(file_content, filename)
+        pages = [page async for page in self.iter_pdf_pages(file_content, filename)]
+        return PAGE_SEPARATOR.join(pages)
+    
+    async def _convert_whole_document(self, file_content: bytes, filename: str) -> str:
+        """Convert a PDF in one go with MarkItDown"""
         logger.info(f"Converting PDF to Markdown: {filename}")
         
         # Create temporary file for MarkItDown processing
@@ -63,6 +147,111 @@ class PDFConverterService:
             except OSError:
                 pass
 
+    async def iter_pdf_pages(self, file_content: bytes, filename: str) -> AsyncIterator[str]:
+        """
+        Convert PDF file content to Markdown one page at a time
+        
+        Pages are extracted in a worker thread and yielded as soon as each one
+        is ready, so callers can start streaming before the whole document has
+        been processed. Falls back to a single whole-document page when
+        per-page extraction is unavailable (see ``conversion_method``).
+        
+        Args:
+            file_content: PDF file content as bytes
+            filename: Original filename for logging
+            
+        Yields:
+            Markdown content of each page
+            
+        Raises:
+            Exception: If conversion fails
+        """
+        method = self.conversion_method()
+        if method == "MarkItDown (whole document)":
+            logger.warning("Per-page extraction not available, falling back to whole-document conversion")
+            yield await self._convert_whole_document(file_content, filename)
+            return
+        
+        logger.info(f"Converting PDF to Markdown page by page with {method}: {filename}")
+        
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
+            temp_file.write(file_content)
+            temp_file_path = temp_file.name
+        
+        if method == "MarkItDown":
+            pages = self._extract_markitdown_pages(temp_file_path)
+        else:
+            pages = self._extract_page_texts(temp_file_path)
+        page_count = 0
+        has_content = False
+        # Page being extracted in the worker thread, kept so cancellation can let it finish
+        extracting: Optional[asyncio.Future] = None
+        
+        try:
+            while True:
+                extracting = asyncio.ensure_future(asyncio.to_thread(next, pages, None))
+                page_text = await asyncio.shield(extracting)
+                extracting = None
+                if page_text is None:
+                    break
+                page_count += 1
+                has_content = has_content or bool(page_text.strip())
+                yield self._fix_encoding_issues(page_text, filename)
+            
+            if not has_content:
+                raise Exception("Failed to extract content from PDF")
+            
+            logger.info(f"Successfully converted {filename} to Markdown ({page_count} pages)")
+            
+        finally:
+            try:
+                if extracting is not None:
+                    # A thread cannot be interrupted, and a generator cannot be closed while it runs
+                    await asyncio.wait([extracting])
+                    if not extracting.cancelled():
+                        extracting.exception()
+                pages.close()
+            finally:
+                try:
+                    os.unlink(temp_file_path)
+                except OSError:
+                    pass
+
+    def _extract_markitdown_pages(self, file_path: str) -> Iterator[str]:
+        """
+        Lazily extract each page the way MarkItDown's PDF converter does
+        
+        Pages with tables or form layout are rendered by MarkItDown's
+        pdfplumber-based extraction (Markdown tables); other pages use
+        pdfminer text, which MarkItDown prefers for prose.
+        """
+        import pdfplumber
+        from markitdown.converters._pdf_converter import (
+            _extract_form_content_from_words, _merge_partial_numbering_lines
+        )
+        
+        with pdfplumber.open(file_path) as pdf:
+            for page, text in zip(pdf.pages, self._extract_page_texts(file_path)):
+                try:
+                    content = _extract_form_content_from_words(page)
+                except Exception as e:
+                    logger.warning(f"Table extraction failed on page {page.page_number}, using plain text: {e}")
+                    content = None
+                finally:
+                    page.close()  # Free pdfplumber's cached page data
+                yield _merge_partial_numbering_lines(content if content is not None else text)
+
+    def _extract_page_texts(self, file_path: str) -> Iterator[str]:
+        """Lazily extract the text of each page of a PDF file"""
+        from pdfminer.high_level import extract_pages
+        from pdfminer.layout import LTTextContainer
+        
+        for page_layout in extract_pages(file_path):
+            yield "".join(
+                element.get_text() for element in page_layout
+                if isinstance(element, LTTextContainer)
+            )
+
     def _fix_encoding_issues(self, content: str, filename: str) -> str:
         """
         Fix potential encoding issues in content extracted from PDF
@@ -115,6 +304,56 @@ class PDFConverterService:
         return content
 
 
+class ThinkingFilter:
+    """Remove <think>...</think> sections from streamed model output
+    
+    Tags may be split across token deltas, so a possible partial tag at the end
+    of the received text is held back until the next delta arrives.
+    """
+    
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+    
+    def __init__(self):
+        self.thinking = False
+        self.pending = ""
+    
+    def feed(self, text: str) -> str:
+        """Add a token delta and return the visible text that is safe to emit"""
+        self.pending += text
+        visible = []
+        
+        while True:
+            tag = self.CLOSE_TAG if self.thinking else self.OPEN_TAG
+            index = self.pending.find(tag)
+            if index < 0:
+                break
+            if not self.thinking:
+                visible.append(self.pending[:index])
+            self.pending = self.pending[index + len(tag):]
+            self.thinking = not self.thinking
+        
+        # Hold back a trailing prefix of the tag we are looking for
+        tag = self.CLOSE_TAG if self.thinking else self.OPEN_TAG
+        held = 0
+        for length in range(min(len(tag) - 1, len(self.pending)), 0, -1):
+            if self.pending.endswith(tag[:length]):
+                held = length
+                break
+        
+        ready = self.pending[:len(self.pending) - held]
+        self.pending = self.pending[len(self.pending) - held:]
+        if not self.thinking:
+            visible.append(ready)
+        return "".join(visible)
+    
+    def flush(self) -> str:
+        """Return any held-back visible text at the end of the stream"""
+        remainder = "" if self.thinking else self.pending
+        self.pending = ""
+        return remainder
+
+
 class VLLMService:
     """Service for interacting with vLLM for content cleaning"""
     
@@ -123,6 +362,33 @@ class VLLMService:
             base_url=f"{settings.vllm_base_url}/v1",
             api_key="not-needed"  # vLLM doesn't require API key when running locally
         )
+        # Async client so concurrent cleaning requests don't block the event loop.
+        # Retries are handled by _request so they share the circuit breaker.
+        self.async_client = AsyncOpenAI(
+            base_url=f"{settings.vllm_base_url}/v1",
+            api_key="not-needed",
+            max_retries=0
+        )
+        self.circuit_breaker = CircuitBreaker(
+            settings.vllm_circuit_failure_threshold, settings.vllm_circuit_reset_timeout
+        )
+        self.hedging = HedgingPolicy(
+            settings.hedging_percentile, settings.hedging_min_delay, settings.hedging_budget
+        )
+        self.hedge_clients = [
+            AsyncOpenAI(base_url=f"{url.rstrip('/')}/v1", api_key="not-needed", max_retries=0)
+            for url in settings.hedging_replica_urls
+        ]
+        self.hedge_count = 0
+        # Cleaned text of chunks seen before, shared by every document
+        self.chunk_cache = ChunkCache(settings.chunk_cache_max_entries)
+        # Responses that stopped at max_tokens and how they were recovered
+        self.truncation_stats = {
+            "truncated_responses": 0,
+            "continuations": 0,
+            "retries": 0,
+            "unrecovered": 0
+        }
     
     async def test_connection(self) -> bool:
         """Test if vLLM service is reachable"""
@@ -148,32 +414,14 @@ class VLLMService:
             Exception: If cleaning fails
         """
         try:
-            system_prompt = self._get_cleaning_system_prompt()
-            user_prompt = f"Please clean and improve this markdown content:\n\n{markdown_content}"
-
-            # Estimate token count and adjust max_tokens if needed
-            estimated_input_tokens = self._estimate_token_count(system_prompt + user_prompt)
-            max_tokens = min(
-                settings.vllm_max_tokens,
-                settings.vllm_max_model_len - estimated_input_tokens - 100  # Leave 100 token buffer
-            )
-            
-            if max_tokens < 500:
-                raise Exception(f"Input too long: estimated {estimated_input_tokens} tokens, "
-                              f"leaving only {max_tokens} tokens for response")
-
-            response = self.client.chat.completions.create(
-                model=settings.vllm_model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                max_tokens=max_tokens,
+            messages = get_prompt("rewrite").build_messages(markdown_content)
+            cleaned_content, max_tokens = await self._create_completion(
+                messages,
+                markdown_content,
                 temperature=settings.vllm_temperature,
                 stream=False
             )
             
-            cleaned_content = response.choices[0].message.content
             logger.info(f"Successfully cleaned markdown content with vLLM (used {max_tokens} max_tokens)")
             return cleaned_content
             
@@ -181,10 +429,145 @@ class VLLMService:
             logger.error(f"Error cleaning markdown with vLLM: {e}")
             raise
 
+    async def clean_markdown_content_cached(self, markdown_content: str) -> str:
+        """
+        Clean markdown content, reusing the chunk cache shared with document conversions
+        
+        Args:
+            markdown_content: Raw markdown content to clean
+            
+        Returns:
+            Cleaned markdown content
+            
+        Raises:
+            Exception: If cleaning fails
+        """
+        cached = self.chunk_cache.get(markdown_content, "rewrite")
+        if cached is not None:
+            logger.info("Markdown content taken from the chunk cache")
+            return cached
+        
+        cleaned_content = await self.clean_markdown_content(markdown_content)
+        # Only output a document conversion would keep is shared with it
+        if not cleaned_content.strip():
+            logger.warning("Cleaning returned no content, not caching it")
+            return cleaned_content
+        if settings.drift_guard_enabled:
+            drifted, drift = await self.check_drift(markdown_content, cleaned_content)
+            if drifted:
+                logger.warning(f"Cleaned markdown drifted from its source, not caching it: {drift}")
+                return cleaned_content
+        self.chunk_cache.put(markdown_content, "rewrite", cleaned_content)
+        return cleaned_content
+    
+    async def check_drift(self, source: str, cleaned: str) -> tuple[bool, Dict[str, float]]:
+        """Run the drift guard on cleaned output against the text it was made from"""
+        # Shingling a chunk takes milliseconds; keep it off the loop that streams other chunks
+        return await asyncio.to_thread(
+            has_drifted,
+            source,
+            cleaned,
+            settings.drift_min_coverage,
+            settings.drift_min_support,
+            settings.drift_shingle_size,
+            settings.drift_min_tokens
+        )
+
+    async def clean_markdown_content_edits(self, markdown_content: str) -> str:
+        """
+        Clean markdown content by asking vLLM for line edits instead of a full rewrite
+        
+        The model sees the content with numbered lines and answers with a
+        compact edit script, so mostly-clean text costs a few output tokens
+        instead of a full copy. The edits are validated and applied locally;
+        if the script is malformed the chunk is cleaned with a full rewrite.
+        
+        Args:
+            markdown_content: Raw markdown content to clean
+            
+        Returns:
+            Cleaned markdown content
+            
+        Raises:
+            Exception: If cleaning fails
+        """
+        messages = get_prompt("edits").build_messages(number_lines(markdown_content))
+        output, _ = await self._create_completion(
+            messages,
+            markdown_content,
+            temperature=settings.vllm_temperature,
+            stream=False
+        )
+        
+        thinking_filter = ThinkingFilter()
+        script = thinking_filter.feed(output) + thinking_filter.flush()
+        
+        try:
+            edits = parse_edit_script(script, markdown_content.count("\n") + 1)
+        except EditScriptError as e:
+            logger.warning(f"Invalid edit script from vLLM, falling back to full rewrite: {e}")
+            return await self.clean_markdown_content(markdown_content)
+        
+        logger.info(f"Applied {len(edits)} line edits from vLLM ({len(script)} characters of output)")
+        return apply_edits(markdown_content, edits)
+
+    async def repair_table(self, region_text: str) -> str:
+        """
+        Rebuild a whitespace-flattened table with guided JSON decoding
+        
+        Args:
+            region_text: Lines of the table as extracted
+            
+        Returns:
+            The table as Markdown
+            
+        Raises:
+            Exception: If the request fails or the output is not a valid table
+        """
+        messages = get_prompt("table").build_messages(region_text)
+        output, _ = await self._create_completion(
+            messages,
+            region_text,
+            continue_on_length=False,
+            temperature=0.0,
+            extra_body={"guided_json": TABLE_SCHEMA}
+        )
+        return render_markdown_table(json.loads(output))
+    
+    async def repair_equation(self, region_text: str) -> str:
+        """
+        Convert an extracted formula to display LaTeX with guided regex decoding
+        
+        Args:
+            region_text: Lines of the formula as extracted
+            
+        Returns:
+            The formula between ``$$`` lines
+            
+        Raises:
+            Exception: If the request fails or the output does not match the pattern
+        """
+        messages = get_prompt("equation").build_messages(region_text)
+        output, _ = await self._create_completion(
+            messages,
+            region_text,
+            continue_on_length=False,
+            temperature=0.0,
+            extra_body={"guided_regex": EQUATION_PATTERN}
+        )
+        content = output.strip()
+        if not re.fullmatch(EQUATION_PATTERN, content):
+            raise Exception("Equation output does not match the expected LaTeX block")
+        return content
+
     def clean_markdown_content_stream(self, markdown_content: str):
         """
         Clean and improve markdown content using vLLM with streaming response
         
+        The first request gets the adaptive max_tokens budget; a response cut
+        off at it is continued from where it stopped with a larger budget,
+        like clean_markdown_content_stream_async.
+        
         Args:
             markdown_content: Raw markdown content to clean
             
@@ -192,133 +575,401 @@ class VLLMService:
             str: Token by token response from vLLM
             
         Raises:
+            TruncatedOutputError: If the response is still truncated at the context limit
             Exception: If cleaning fails
         """
         try:
-            # Use proper Qwen3 system message format
-            system_prompt = "Clean and format the provided markdown text. Fix any formatting errors, OCR mistakes, and improve structure. Output only the cleaned markdown without explanations."
-            user_prompt = f"Clean this markdown content:\n\n{markdown_content}"
-            
-            # Additional safety: ensure content is properly encoded before sending to vLLM
-            try:
-                markdown_content.encode('utf-8')
-                logger.debug("Markdown content encoding verified as UTF-8 compatible")
-            except UnicodeEncodeError as e:
-                logger.warning(f"Markdown content has encoding issues, applying fix: {e}")
-                markdown_content = self._fix_encoding_issues(markdown_content, "streaming_input")
-                user_prompt = f"Clean this markdown content:\n\n{markdown_content}"
-
-            # Estimate token count and adjust max_tokens if needed
-            estimated_input_tokens = self._estimate_token_count(system_prompt + user_prompt)
-            max_tokens = min(
-                settings.vllm_max_tokens,
-                settings.vllm_max_model_len - estimated_input_tokens - 100  # Leave 100 token buffer
-            )
-            
-            if max_tokens < 500:
-                raise Exception(f"Input too long: estimated {estimated_input_tokens} tokens, "
-                              f"leaving only {max_tokens} tokens for response")
+            messages, ceiling = self._prepare_stream_request(markdown_content)
+            max_tokens = self._adaptive_token_budget(markdown_content, ceiling)
+            request_messages, request_tokens = messages, max_tokens
+            output = ""
 
             logger.info(f"Starting streaming markdown cleaning with vLLM (max_tokens: {max_tokens}, no-thinking mode)")
             
-            # Create streaming response with Qwen3 non-thinking mode settings
-            # According to Qwen3 docs: For non-thinking mode, use Temperature=0.7, TopP=0.8, TopK=20
-            stream = self.client.chat.completions.create(
-                model=settings.vllm_model_name,
-                messages=[
-                    {"role": "system", "content": "You are a text formatter. Respond directly without thinking. /no_think"},
-                    {"role": "user", "content": f"/no_think Clean this markdown:\n\n{markdown_content}"}
-                ],
-                max_tokens=max_tokens,
-                temperature=0.7,  # Qwen3 recommended for non-thinking mode
-                top_p=0.8,        # Qwen3 recommended for non-thinking mode
-                stream=True,
-                stream_options={"include_usage": False}
-            )
-            
-            logger.info(f"Stream object created, starting token iteration...")
             token_count = 0
             thinking_mode = False
             buffer = ""
             
-            # IMPORTANT: Use sync iteration, not async - this was the bug!
-            try:
-                for chunk in stream:  # NOT async for!
-                    if chunk.choices and len(chunk.choices) > 0:
-                        choice = chunk.choices[0]
-                        if choice.delta and choice.delta.content is not None:
-                            content = choice.delta.content
-                            buffer += content
+            while True:
+                self.circuit_breaker.before_call()
+                try:
+                    # Create streaming response with Qwen3 non-thinking mode settings
+                    # According to Qwen3 docs: For non-thinking mode, use Temperature=0.7, TopP=0.8, TopK=20
+                    stream = self.client.chat.completions.create(
+                        model=settings.vllm_model_name,
+                        messages=request_messages,
+                        max_tokens=request_tokens,
+                        temperature=0.7,  # Qwen3 recommended for non-thinking mode
+                        top_p=0.8,        # Qwen3 recommended for non-thinking mode
+                        stream=True,
+                        stream_options={"include_usage": False},
+                        **({"extra_body": CONTINUATION_REQUEST} if output else {})
+                    )
+                    
+                    logger.info(f"Stream object created, starting token iteration...")
+                    finish_reason = None
+                    
+                    # IMPORTANT: Use sync iteration, not async - this was the bug!
+                    for chunk in stream:  # NOT async for!
+                        if chunk.choices and len(chunk.choices) > 0:
+                            choice = chunk.choices[0]
+                            if choice.delta and choice.delta.content is not None:
+                                content = choice.delta.content
+                                output += content
+                                buffer += content
                             
-                            # Handle thinking tags - filter them out
-                            if "<think>" in buffer:
-                                thinking_mode = True
-                                # Remove everything up to and including <think>
-                                buffer = buffer.split("<think>", 1)[-1]
-                                continue
-                            elif "</think>" in buffer and thinking_mode:
-                                thinking_mode = False
-                                # Remove everything up to and including </think>
-                                parts = buffer.split("</think>", 1)
-                                if len(parts) > 1:
-                                    buffer = parts[1]
-                                else:
+                                # Handle thinking tags - filter them out
+                                if "<think>" in buffer:
+                                    thinking_mode = True
+                                    # Remove everything up to and including <think>
+                                    buffer = buffer.split("<think>", 1)[-1]
+                                    continue
+                                elif "</think>" in buffer and thinking_mode:
+                                    thinking_mode = False
+                                    # Remove everything up to and including </think>
+                                    parts = buffer.split("</think>", 1)
+                                    if len(parts) > 1:
+                                        buffer = parts[1]
+                                    else:
+                                        buffer = ""
+                                    # Continue to process any remaining content
+                                    if buffer.strip():
+                                        token_count += 1
+                                        # Ensure content is properly encoded as UTF-8 string
+                                        if isinstance(buffer, bytes):
+                                            buffer = buffer.decode('utf-8', errors='replace')
+                                        elif not isinstance(buffer, str):
+                                            buffer = str(buffer)
+                                        yield buffer
+                                        buffer = ""
+                                    continue
+                                elif thinking_mode:
+                                    # Skip content while in thinking mode
                                     buffer = ""
-                                # Continue to process any remaining content
-                                if buffer.strip():
+                                    continue
+                                else:
+                                    # Normal content - yield it
                                     token_count += 1
-                                    logger.debug(f"Yielding token {token_count}: '{buffer[:20]}...'")
+                                    # Ensure content is properly encoded as UTF-8 string
+                                    if isinstance(content, bytes):
+                                        content = content.decode('utf-8', errors='replace')
+                                    elif not isinstance(content, str):
+                                        content = str(content)
+                                    yield content
+                                    buffer = ""
+                                
+                            elif choice.finish_reason:
+                                logger.info(f"Stream finished with reason: {choice.finish_reason}")
+                                finish_reason = choice.finish_reason
+                                # Yield any remaining buffer content
+                                if buffer.strip() and not thinking_mode:
                                     # Ensure content is properly encoded as UTF-8 string
                                     if isinstance(buffer, bytes):
                                         buffer = buffer.decode('utf-8', errors='replace')
                                     elif not isinstance(buffer, str):
                                         buffer = str(buffer)
                                     yield buffer
-                                    buffer = ""
-                                continue
-                            elif thinking_mode:
-                                # Skip content while in thinking mode
-                                buffer = ""
-                                continue
-                            else:
-                                # Normal content - yield it
-                                token_count += 1
-                                logger.debug(f"Yielding token {token_count}: '{content[:20]}...'")
-                                # Ensure content is properly encoded as UTF-8 string
-                                if isinstance(content, bytes):
-                                    content = content.decode('utf-8', errors='replace')
-                                elif not isinstance(content, str):
-                                    content = str(content)
-                                yield content
-                                buffer = ""
-                                
-                        elif choice.finish_reason:
-                            logger.info(f"Stream finished with reason: {choice.finish_reason}")
-                            # Yield any remaining buffer content
-                            if buffer.strip() and not thinking_mode:
-                                # Ensure content is properly encoded as UTF-8 string
-                                if isinstance(buffer, bytes):
-                                    buffer = buffer.decode('utf-8', errors='replace')
-                                elif not isinstance(buffer, str):
-                                    buffer = str(buffer)
-                                yield buffer
-                            break
-                    else:
-                        logger.debug("Received chunk with no choices")
+                                break
+                        else:
+                            logger.debug("Received chunk with no choices")
                         
-            except Exception as stream_error:
-                logger.error(f"Error during streaming iteration: {stream_error}")
-                raise
+                except GeneratorExit:
+                    # The client went away mid-stream, so vLLM was answering
+                    self.circuit_breaker.record_success()
+                    raise
+                except Exception as stream_error:
+                    logger.error(f"Error during streaming iteration: {stream_error}")
+                    if is_retryable(stream_error):
+                        self.circuit_breaker.record_failure()
+                    else:
+                        # vLLM answered, so it is up even though this request failed
+                        self.circuit_breaker.record_success()
+                    raise
+                self.circuit_breaker.record_success()
+                
+                if finish_reason != "length":
+                    break
                 
+                # Continue the stream where it stopped; the tokens sent so far stay valid
+                next_tokens = self._grow_truncated_budget(max_tokens, ceiling, output)
+                self.truncation_stats["continuations"] += 1
+                request_messages = self._continuation_messages(messages, output)
+                request_tokens = next_tokens - max_tokens
+                max_tokens = next_tokens
+            
             logger.info(f"Streaming completed. Total tokens yielded: {token_count}")
                     
         except Exception as e:
             logger.error(f"Error streaming markdown cleaning with vLLM: {e}")
             raise
 
-    def _get_cleaning_system_prompt(self) -> str:
-        """Get the system prompt for markdown cleaning"""
-        return """Fix formatting and clean the text. Output the corrected version immediately without any explanation."""
+    async def clean_markdown_content_stream_async(self, markdown_content: str) -> AsyncIterator[str]:
+        """
+        Clean markdown content with vLLM, streaming tokens without blocking the event loop
+        
+        Uses the same prompt and sampling settings as clean_markdown_content_stream,
+        so several chunks can be streamed concurrently.
+        
+        Args:
+            markdown_content: Raw markdown content to clean
+            
+        Yields:
+            str: Token deltas from vLLM with thinking sections removed
+            
+        Raises:
+            TruncatedOutputError: If the response is still truncated at the context limit
+            Exception: If cleaning fails
+        """
+        messages, ceiling = self._prepare_stream_request(markdown_content)
+        max_tokens = self._adaptive_token_budget(markdown_content, ceiling)
+        request_messages, request_tokens = messages, max_tokens
+        output = ""
+        
+        thinking_filter = ThinkingFilter()
+        while True:
+            stream = await self._request(
+                model=settings.vllm_model_name,
+                messages=request_messages,
+                max_tokens=request_tokens,
+                temperature=0.7,  # Qwen3 recommended for non-thinking mode
+                top_p=0.8,        # Qwen3 recommended for non-thinking mode
+                stream=True,
+                stream_options={"include_usage": False},
+                **({"extra_body": CONTINUATION_REQUEST} if output else {})
+            )
+            
+            finish_reason = None
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.delta and choice.delta.content:
+                    output += choice.delta.content
+                    content = thinking_filter.feed(choice.delta.content)
+                    if content:
+                        yield content
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+                    break
+            
+            if finish_reason != "length":
+                break
+            
+            # Continue the stream where it stopped; the tokens sent so far stay valid
+            next_tokens = self._grow_truncated_budget(max_tokens, ceiling, output)
+            self.truncation_stats["continuations"] += 1
+            request_messages = self._continuation_messages(messages, output)
+            request_tokens = next_tokens - max_tokens
+            max_tokens = next_tokens
+        
+        remainder = thinking_filter.flush()
+        if remainder:
+            yield remainder
+
+    def _prepare_stream_request(self, markdown_content: str) -> tuple[list, int]:
+        """
+        Build the chat messages and max_tokens budget for a streaming clean
+        
+        Raises:
+            Exception: If the input leaves too little room for a response
+        """
+        # Additional safety: ensure content is properly encoded before sending to vLLM
+        try:
+            markdown_content.encode('utf-8')
+            logger.debug("Markdown content encoding verified as UTF-8 compatible")
+        except UnicodeEncodeError as e:
+            logger.warning(f"Markdown content has encoding issues, applying fix: {e}")
+            markdown_content = self._fix_encoding_issues(markdown_content, "streaming_input")
+        
+        messages = get_prompt("rewrite").build_messages(markdown_content)
+        return messages, self._response_token_budget(messages)
+
+    async def _create_completion(
+        self,
+        messages: list,
+        content: str,
+        continue_on_length: bool = True,
+        **kwargs
+    ) -> tuple[str, int]:
+        """
+        Run a non-streaming completion with a max_tokens budget sized to the content
+        
+        Reserving the whole context for every response keeps vLLM from scheduling
+        many sequences at once, so the first attempt gets a budget proportional
+        to the content. A response cut off at that budget is continued from
+        where it stopped (or, with ``continue_on_length`` False, e.g. for
+        grammar-constrained output, generated again) with a larger budget, up
+        to the context limit.
+        
+        Args:
+            messages: Chat messages of the request
+            content: The part of the prompt the response reproduces
+            continue_on_length: Continue truncated output instead of regenerating it
+            **kwargs: Further arguments for ``chat.completions.create``
+            
+        Returns:
+            Tuple of (response text, total max_tokens it was generated with)
+            
+        Raises:
+            TruncatedOutputError: If the response is still truncated at the context limit
+            Exception: If the input leaves too little room for a response or the request fails
+        """
+        ceiling = self._response_token_budget(messages)
+        max_tokens = self._adaptive_token_budget(content, ceiling)
+        request_messages, request_tokens = messages, max_tokens
+        output = ""
+        
+        while True:
+            response = await self._request(
+                model=settings.vllm_model_name,
+                messages=request_messages,
+                max_tokens=request_tokens,
+                **kwargs
+            )
+            choice = response.choices[0]
+            output += choice.message.content or ""
+            if choice.finish_reason != "length":
+                return output, max_tokens
+            
+            next_tokens = self._grow_truncated_budget(max_tokens, ceiling, output)
+            if continue_on_length:
+                self.truncation_stats["continuations"] += 1
+                request_messages = self._continuation_messages(messages, output)
+                request_tokens = next_tokens - max_tokens
+                kwargs["extra_body"] = {**kwargs.get("extra_body", {}), **CONTINUATION_REQUEST}
+            else:
+                self.truncation_stats["retries"] += 1
+                output = ""
+                request_tokens = next_tokens
+            max_tokens = next_tokens
+    
+    async def _request(self, **kwargs):
+        """
+        Send a chat completion request, retrying transient failures
+        
+        Connection errors and 5xx responses are retried with jittered
+        exponential backoff; while the circuit breaker is open the request
+        fails immediately with CircuitOpenError. With ``hedging_enabled``,
+        slow non-streaming requests are hedged. A vLLM server that was put to
+        sleep or stopped for idleness is woken first.
+        """
+        await vllm_lifecycle.ensure_ready()
+        if settings.hedging_enabled and not kwargs.get("stream"):
+            return await self._hedged_request(kwargs)
+        return await self._retrying_request(kwargs)
+    
+    async def _hedged_request(self, kwargs: dict):
+        """
+        Send a request and, if it runs past the hedging delay, a duplicate
+        
+        The delay is derived from recent latencies (``hedging_percentile``)
+        and hedges are capped at ``hedging_budget`` of requests. Whichever
+        response arrives first is used; the other request is cancelled,
+        which makes vLLM abort it.
+        """
+        max_tokens = kwargs.get("max_tokens", 1)
+        start = time.monotonic()
+        primary = asyncio.create_task(self._retrying_request(kwargs))
+        tasks = {primary}
+        hedged = False
+        
+        try:
+            delay = self.hedging.delay(max_tokens)
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self.hedging.try_acquire():
+                    hedged = True
+                    logger.info(f"Request still running after {delay:.2f}s, sending a hedge")
+                    tasks.add(asyncio.create_task(self._hedge_request(kwargs)))
+            
+            winner = None
+            pending = set(tasks)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if task.exception() is None), None)
+            
+            if winner is None:
+                # Both failed; the hedge only ran because the primary was slow, so report the primary
+                raise primary.exception()
+            
+            self.hedging.record(time.monotonic() - start, max_tokens, hedged, winner is not primary)
+            hedged = False
+            return winner.result()
+        finally:
+            if hedged:
+                self.hedging.release()
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    async def _hedge_request(self, kwargs: dict):
+        """Send the duplicate of a slow request to a replica, or to vLLM with a higher priority"""
+        if self.hedge_clients:
+            client = self.hedge_clients[self.hedge_count % len(self.hedge_clients)]
+            self.hedge_count += 1
+            return await client.chat.completions.create(**kwargs)
+        
+        self.hedge_count += 1
+        extra_body = {**(kwargs.get("extra_body") or {}), "priority": settings.hedging_priority}
+        return await self.async_client.chat.completions.create(**{**kwargs, "extra_body": extra_body})
+    
+    async def _retrying_request(self, kwargs: dict):
+        """Send a request with the retry policy and circuit breaker"""
+        return await call_with_retry(
+            lambda: self.async_client.chat.completions.create(**kwargs),
+            self.circuit_breaker,
+            settings.vllm_retry_attempts,
+            settings.vllm_retry_base_delay,
+            settings.vllm_retry_max_delay
+        )
+    
+    def _grow_truncated_budget(self, max_tokens: int, ceiling: int, partial: str) -> int:
+        """
+        Record a truncated response and compute the next, larger budget
+        
+        Raises:
+            TruncatedOutputError: If the budget is already at the context limit
+        """
+        self.truncation_stats["truncated_responses"] += 1
+        if max_tokens >= ceiling:
+            self.truncation_stats["unrecovered"] += 1
+            raise TruncatedOutputError(f"Response truncated at the context limit ({max_tokens} tokens)", partial)
+        
+        next_tokens = min(ceiling, int(max_tokens * settings.output_token_retry_growth))
+        logger.info(f"Response hit max_tokens={max_tokens}, extending budget to {next_tokens}")
+        return next_tokens
+    
+    def _continuation_messages(self, messages: list, partial: str) -> list:
+        """Messages that ask vLLM to extend a partial response"""
+        return messages + [{"role": "assistant", "content": partial}]
+    
+    def _adaptive_token_budget(self, content: str, ceiling: int) -> int:
+        """First-attempt max_tokens: a multiple of the content's tokens plus a margin"""
+        if not settings.adaptive_max_tokens_enabled:
+            return ceiling
+        budget = int(self._estimate_token_count(content) * settings.output_token_ratio) + settings.output_token_margin
+        return min(ceiling, budget)
+    
+    def _response_token_budget(self, messages: list) -> int:
+        """
+        Compute the largest max_tokens a request can use from its estimated input size
+        
+        Raises:
+            Exception: If the input leaves too little room for a response
+        """
+        estimated_input_tokens = self._estimate_token_count(
+            "".join(message["content"] for message in messages)
+        )
+        max_tokens = min(
+            settings.vllm_max_tokens,
+            settings.vllm_max_model_len - estimated_input_tokens - 100  # Leave 100 token buffer
+        )
+        
+        if max_tokens < 500:
+            raise Exception(f"Input too long: estimated {estimated_input_tokens} tokens, "
+                          f"leaving only {max_tokens} tokens for response")
+        
+        return max_tokens
 
     def _estimate_token_count(self, text: str) -> int:
         """
@@ -376,44 +1027,79 @@ class DocumentProcessingService:
     def __init__(self):
         self.pdf_service = PDFConverterService()
         self.vllm_service = VLLMService()
+        self.jobs = JobStore(settings.job_store_max_jobs, settings.job_store_dir)
     
     async def process_document(
         self, 
         file_content: bytes, 
         filename: str, 
-        clean_with_llm: bool = True
+        clean_with_llm: bool = True,
+        preclean: Optional[bool] = None,
+        previous_job_id: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Process a PDF document: convert to markdown and optionally clean with LLM
         
+        Extraction and cleaning are pipelined: each completed page range is
+        queued to vLLM as soon as it is extracted, so generation for the
+        first chunks overlaps with extraction of the rest of the document.
+        
         Args:
             file_content: PDF file content as bytes
             filename: Original filename
             clean_with_llm: Whether to clean content with vLLM
+            preclean: Apply the rule-based pre-cleaner (defaults to ``preclean_enabled``)
+            previous_job_id: Job id of an earlier version of the document whose
+                cleaned text is reused for unchanged chunks and paragraphs
             
         Returns:
             Dictionary with processing results
         """
-        # Convert PDF to Markdown
-        raw_markdown = await self.pdf_service.convert_pdf_to_markdown(
-            file_content, filename
-        )
-        
-        # Clean with vLLM if requested
-        final_markdown = raw_markdown
+        job_id = None
+        raw_pages: Dict[int, str] = {}
+        cleaned_chunks: Dict[int, str] = {}
+        skipped_chunks = 0
+        truncated_chunks = 0
+        drifted_chunks = 0
+        cached_chunks = 0
+        reused_chunks = 0
+        reused_paragraphs = 0
         cleaned_with_llm = False
+        stats: Dict[str, Any] = {}
         
-        if clean_with_llm:
-            try:
-                logger.info("Cleaning markdown content with vLLM")
-                final_markdown = await self.vllm_service.clean_markdown_content(raw_markdown)
-                cleaned_with_llm = final_markdown != raw_markdown
-            except Exception as e:
-                logger.warning(f"vLLM cleaning failed, using raw markdown: {e}")
-                # Continue with raw markdown if cleaning fails
+        async for event in self.stream_document(
+            file_content, filename, clean_with_llm, preclean=preclean, previous_job_id=previous_job_id
+        ):
+            if event["type"] == "metadata":
+                job_id = event["job_id"]
+            elif event["type"] == "stats":
+                stats = event
+            elif event["type"] == "raw_page":
+                raw_pages[event["page"]] = event["content"]
+            elif event["type"] == "chunk_done":
+                cleaned_chunks[event["chunk"]] = event["content"]
+                skipped_chunks += bool(event.get("skipped"))
+                truncated_chunks += bool(event.get("truncated"))
+                drifted_chunks += bool(event.get("drift"))
+                cached_chunks += bool(event.get("cached"))
+                reused_chunks += bool(event.get("reused"))
+                reused_paragraphs += event.get("reused_paragraphs", 0)
+                cleaned_with_llm = cleaned_with_llm or event["cleaned_with_llm"]
+            elif event["type"] == "error":
+                raise Exception(event["message"])
+        
+        raw_markdown = PAGE_SEPARATOR.join(raw_pages[page] for page in sorted(raw_pages))
+        
+        # Chunks cover every page in order, so joining them rebuilds the document
+        final_markdown = raw_markdown
+        if cleaned_chunks:
+            final_markdown = PAGE_SEPARATOR.join(
+                cleaned_chunks[chunk] for chunk in sorted(cleaned_chunks)
+            )
         
         return {
             "success": True,
+            "job_id": job_id,
             "filename": filename,
             "raw_markdown": raw_markdown,
             "cleaned_markdown": final_markdown,
@@ -422,11 +1108,582 @@ class DocumentProcessingService:
             "metadata": {
                 "original_filename": filename,
                 "file_size_bytes": len(file_content),
-                "conversion_method": "MarkItDown",
-                "llm_cleaning": clean_with_llm
+                "conversion_method": self.pdf_service.conversion_method(),
+                "llm_cleaning": clean_with_llm,
+                "page_count": len(raw_pages),
+                "chunk_count": len(cleaned_chunks),
+                "skipped_chunk_count": skipped_chunks,
+                "skip_ratio": round(skipped_chunks / len(cleaned_chunks), 3) if cleaned_chunks else 0.0,
+                "truncated_chunk_count": truncated_chunks,
+                "drifted_chunk_count": drifted_chunks,
+                "cached_chunk_count": cached_chunks,
+                "previous_job_id": previous_job_id,
+                "reused_chunk_count": reused_chunks,
+                "reused_paragraph_count": reused_paragraphs,
+                "resplit_chunk_count": stats.get("resplit_chunk_count", 0),
+                "precleaned_chars_removed": stats.get("precleaned_chars_removed", 0),
+                "header_footer_lines_removed": stats.get("header_footer_lines_removed", 0),
+                "header_footer_tokens_saved": stats.get("header_footer_tokens_saved", 0)
             }
         }
     
+    async def stream_document(
+        self,
+        file_content: bytes,
+        filename: str,
+        clean_with_llm: bool = True,
+        stream_tokens: bool = False,
+        run_gate: Optional[asyncio.Event] = None,
+        preclean: Optional[bool] = None,
+        previous_job_id: Optional[str] = None,
+        chunk_sources: Optional[Dict[int, str]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Process a PDF document incrementally, yielding events as work completes
+        
+        Raw page Markdown is yielded as soon as each page is extracted, and
+        cleaned replacements follow as vLLM finishes each chunk, so the first
+        event never waits for the whole document to be converted.
+        
+        Args:
+            file_content: PDF file content as bytes
+            filename: Original filename
+            clean_with_llm: Whether to clean content with vLLM
+            stream_tokens: Also yield ``token`` events while each chunk is generated
+            run_gate: Optional event that pauses extraction and generation while cleared
+            preclean: Apply the rule-based pre-cleaner to every page; defaults to
+                ``preclean_enabled`` when cleaning with vLLM and off otherwise
+            previous_job_id: Job id of an earlier version of the document; its
+                cleaned text is spliced in for unchanged chunks and paragraphs
+            chunk_sources: Optional dict filled with the text of every chunk as
+                it is sent for cleaning (after pre-cleaning), by chunk index
+            
+        Yields:
+            Event dictionaries whose ``type`` is one of ``metadata``,
+            ``raw_page``, ``token``, ``chunk_done``, ``stats``, ``error`` or ``done``
+        """
+        job = ConversionJob(new_job_id())
+        yield {
+            "type": "metadata",
+            "filename": filename,
+            "file_size_bytes": len(file_content),
+            "llm_cleaning": clean_with_llm,
+            "job_id": job.job_id
+        }
+        
+        if previous_job_id:
+            # Building the paragraph index measures every stored paragraph; keep it off the loop
+            job.previous = await asyncio.to_thread(self.jobs.load, previous_job_id)
+            if job.previous is None:
+                yield {"type": "error", "message": f"Previous job {previous_job_id} not found or expired"}
+                yield {"type": "done"}
+                return
+        
+        queue: asyncio.Queue = asyncio.Queue()
+        producer = asyncio.create_task(
+            self._produce_document_events(
+                file_content, filename, clean_with_llm, stream_tokens, queue, run_gate, preclean, job,
+                chunk_sources
+            )
+        )
+        
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield event
+            await producer
+        finally:
+            if not producer.done():
+                producer.cancel()
+    
+    async def _produce_document_events(
+        self,
+        file_content: bytes,
+        filename: str,
+        clean_with_llm: bool,
+        stream_tokens: bool,
+        queue: asyncio.Queue,
+        run_gate: Optional[asyncio.Event] = None,
+        preclean: Optional[bool] = None,
+        job: Optional[ConversionJob] = None,
+        chunk_sources: Optional[Dict[int, str]] = None
+    ) -> None:
+        """
+        Extract pages and pipeline them into cleaning chunks
+        
+        Consecutive pages are grouped until they reach ``cleaning_chunk_size``
+        characters; each full group is run through the rule-based pre-cleaner
+        (when enabled) and handed to vLLM immediately while extraction
+        continues in its worker thread. Pre-cleaning a group only when it is
+        scheduled lets header/footer detection see every page in it; with the
+        pre-cleaner, full groups are held until ``header_footer_min_pages``
+        pages have been extracted (or extraction ends) so the first chunks
+        are stripped of running headers too.
+        """
+        if preclean is None:
+            preclean = clean_with_llm and settings.preclean_enabled
+        precleaner = PreCleaner(
+            settings.header_footer_edge_lines, settings.header_footer_min_pages
+        ) if preclean else None
+        
+        cleaning_tasks = []
+        cleaning_slots = asyncio.Semaphore(settings.vllm_max_concurrent_requests)
+        pending_pages: list[tuple[int, str]] = []
+        pending_size = 0
+        page_count = 0
+        raw_content_length = 0
+        start_time = time.monotonic()
+        
+        def schedule_chunk(pages: list[tuple[int, str]]):
+            if precleaner is not None:
+                pages = [(page, precleaner.clean_page(text, page)) for page, text in pages]
+            content = PAGE_SEPARATOR.join(text for _, text in pages)
+            if chunk_sources is not None:
+                chunk_sources[len(cleaning_tasks)] = content
+            cleaning_tasks.append(asyncio.create_task(
+                self._clean_chunk_event(
+                    len(cleaning_tasks),
+                    pages[0][0],
+                    pages[-1][0],
+                    content,
+                    queue,
+                    cleaning_slots,
+                    stream_tokens,
+                    run_gate,
+                    use_llm=clean_with_llm,
+                    job=job
+                )
+            ))
+        
+        def schedule_pending_chunks(final: bool = False):
+            nonlocal pending_pages, pending_size
+            if (
+                not final
+                and precleaner is not None
+                and precleaner.headers_footers.pages_observed < precleaner.headers_footers.min_pages
+            ):
+                # Running headers are only recognized once min_pages pages have been seen
+                return
+            chunk: list[tuple[int, str]] = []
+            size = 0
+            for page in pending_pages:
+                chunk.append(page)
+                size += len(page[1])
+                if size >= settings.cleaning_chunk_size:
+                    schedule_chunk(chunk)
+                    chunk, size = [], 0
+            if chunk and final:
+                schedule_chunk(chunk)
+                chunk, size = [], 0
+            pending_pages, pending_size = chunk, size
+        
+        try:
+            async for page_markdown in self.pdf_service.iter_pdf_pages(file_content, filename):
+                if run_gate is not None:
+                    await run_gate.wait()
+                
+                page_number = page_count
+                page_count += 1
+                raw_content_length += len(page_markdown)
+                
+                await queue.put({
+                    "type": "raw_page",
+                    "page": page_number,
+                    "content": page_markdown
+                })
+                
+                if not clean_with_llm and precleaner is None:
+                    continue
+                
+                if precleaner is not None:
+                    precleaner.add_page(page_markdown)
+                
+                pending_pages.append((page_number, page_markdown))
+                pending_size += len(page_markdown)
+                if pending_size >= settings.cleaning_chunk_size:
+                    schedule_pending_chunks()
+            
+            if pending_pages:
+                schedule_pending_chunks(final=True)
+            
+            chunk_events = await asyncio.gather(*cleaning_tasks) if cleaning_tasks else []
+            skipped_chunks = sum(1 for event in chunk_events if event.get("skipped"))
+            truncated_chunks = sum(1 for event in chunk_events if event.get("truncated"))
+            drifted_chunks = sum(1 for event in chunk_events if event.get("drift"))
+            resplit_chunks = sum(1 for event in chunk_events if event.get("resplit"))
+            cached_chunks = sum(1 for event in chunk_events if event.get("cached"))
+            reused_chunks = sum(1 for event in chunk_events if event.get("reused"))
+            reused_paragraphs = sum(event.get("reused_paragraphs", 0) for event in chunk_events)
+            
+            await queue.put({
+                "type": "stats",
+                "page_count": page_count,
+                "chunk_count": len(cleaning_tasks),
+                "skipped_chunk_count": skipped_chunks,
+                "skip_ratio": round(skipped_chunks / len(cleaning_tasks), 3) if cleaning_tasks else 0.0,
+                "truncated_chunk_count": truncated_chunks,
+                "resplit_chunk_count": resplit_chunks,
+                "drifted_chunk_count": drifted_chunks,
+                "cached_chunk_count": cached_chunks,
+                "reused_chunk_count": reused_chunks,
+                "reused_paragraph_count": reused_paragraphs,
+                "raw_content_length": raw_content_length,
+                "precleaned_chars_removed": precleaner.chars_removed if precleaner else 0,
+                "header_footer_lines_removed": precleaner.headers_footers.lines_removed if precleaner else 0,
+                "header_footer_tokens_saved": precleaner.headers_footers.tokens_saved if precleaner else 0,
+                "elapsed_seconds": round(time.monotonic() - start_time, 3)
+            })
+            if job is not None and clean_with_llm:
+                await asyncio.to_thread(self.jobs.save, job.job_id, job.cleaned_chunks())
+            await queue.put({"type": "done"})
+            
+        except Exception as e:
+            logger.error(f"Incremental processing failed for {filename}: {e}")
+            await queue.put({"type": "error", "message": str(e)})
+        finally:
+            for task in cleaning_tasks:
+                if not task.done():
+                    task.cancel()
+            await queue.put(None)
+    
+    async def _clean_chunk_event(
+        self,
+        chunk_index: int,
+        first_page: int,
+        last_page: int,
+        raw_content: str,
+        queue: asyncio.Queue,
+        cleaning_slots: asyncio.Semaphore,
+        stream_tokens: bool = False,
+        run_gate: Optional[asyncio.Event] = None,
+        allow_skip: bool = True,
+        use_llm: bool = True,
+        job: Optional[ConversionJob] = None
+    ) -> Dict[str, Any]:
+        """
+        Clean one chunk with vLLM and push its ``chunk_done`` replacement event
+        
+        Chunks the quality scorer finds already clean are passed through
+        unchanged with ``skipped`` set, and chunks cleaned before (in any
+        document) are taken from the chunk cache with ``cached`` set, unless
+        ``allow_skip`` is False. The cache is looked up by the chunk as sent
+        for cleaning, before its tables and formulas are repaired. With ``use_llm`` False the (pre-cleaned)
+        content is passed through as is.
+        
+        When ``job`` continues a previous job, an unchanged chunk takes its
+        previous cleaned text (``reused``), and a changed one only has its
+        changed paragraphs cleaned (``reused_paragraphs`` counts the rest).
+        The result is recorded on ``job`` unless cleaning failed or drifted.
+        
+        Returns:
+            The ``chunk_done`` event
+        """
+        event = {
+            "type": "chunk_done",
+            "chunk": chunk_index,
+            "pages": [first_page, last_page],
+            "cleaned_with_llm": False
+        }
+        
+        if not use_llm or not raw_content.strip():
+            event["content"] = raw_content
+            await queue.put(event)
+            return event
+        
+        source_content = raw_content
+        previous = job.previous if job is not None and allow_skip else None
+        reused = previous.chunk(source_content) if previous is not None else None
+        if reused is not None:
+            # Unchanged since the previous version, so nothing is repaired, scored or cleaned
+            event["content"] = reused
+            event["reused"] = True
+            event["cleaned_with_llm"] = reused != source_content
+            if stream_tokens:
+                await queue.put({"type": "token", "chunk": chunk_index, "content": reused})
+            job.record(chunk_index, source_content, reused)
+            await queue.put(event)
+            return event
+        
+        chunk_cache = self.vllm_service.chunk_cache
+        cache_mode = settings.cleaning_output_mode
+        # Keyed by the chunk as sent for cleaning, so a hit also skips the repair requests
+        cached = chunk_cache.get(source_content, cache_mode) if allow_skip else None
+        
+        regions_repaired = 0
+        if settings.structured_repair_enabled and cached is None:
+            if run_gate is not None:
+                await run_gate.wait()
+            raw_content, regions_repaired = await self._repair_structured_regions(
+                raw_content, cleaning_slots
+            )
+            if regions_repaired and settings.drift_guard_enabled:
+                drifted, drift = await self.vllm_service.check_drift(source_content, raw_content)
+                if drifted:
+                    logger.warning(f"Repaired regions of chunk {chunk_index} drifted from the extracted text, dropping them: {drift}")
+                    raw_content, regions_repaired = source_content, 0
+            if regions_repaired:
+                event["regions_repaired"] = regions_repaired
+                event["cleaned_with_llm"] = True
+        
+        if allow_skip and settings.skip_clean_enabled and cached is None:
+            should_clean, quality = needs_cleaning(raw_content, settings.skip_clean_max_score)
+            if not should_clean:
+                logger.debug(f"Skipping vLLM for clean chunk {chunk_index} (score {quality['score']})")
+                event["content"] = raw_content
+                event["skipped"] = True
+                event["quality"] = quality
+                if job is not None:
+                    job.record(chunk_index, source_content, raw_content)
+                await queue.put(event)
+                return event
+        
+        try:
+            runs = previous.plan(raw_content) if previous is not None and cached is None else []
+            if cached is not None:
+                cleaned_content, splits = cached, 0
+                event["cached"] = True
+                if stream_tokens:
+                    await queue.put({"type": "token", "chunk": chunk_index, "content": cached})
+            elif any(cleaned is not None for _, cleaned in runs):
+                cleaned_content, splits = await self._clean_changed_paragraphs(
+                    chunk_index, runs, queue, cleaning_slots, stream_tokens, run_gate, event
+                )
+            else:
+                cleaned_content, splits = await self._generate_chunk(
+                    chunk_index, raw_content, queue, cleaning_slots, stream_tokens, run_gate, event
+                )
+            if settings.drift_guard_enabled and cleaned_content != source_content:
+                # Checked against the extracted text, so LLM-written tables and formulas are covered too
+                drifted, drift = await self.vllm_service.check_drift(source_content, cleaned_content)
+                if drifted:
+                    logger.warning(f"Cleaned chunk {chunk_index} drifted from its source, using raw markdown: {drift}")
+                    event["drift"] = drift
+                    event.pop("regions_repaired", None)
+                    chunk_cache.discard(source_content, cache_mode)
+                    cleaned_content = raw_content = source_content
+                    regions_repaired = 0
+            if "drift" not in event:
+                if cached is None:
+                    chunk_cache.put(source_content, cache_mode, cleaned_content)
+                if job is not None:
+                    job.record(chunk_index, source_content, cleaned_content)
+            event["content"] = cleaned_content
+            # An unchanged response does not count as cleaned, matching the document-level flag
+            event["cleaned_with_llm"] = cleaned_content != raw_content or regions_repaired > 0
+            if splits:
+                event["resplit"] = splits
+        except Exception as e:
+            logger.warning(f"vLLM cleaning failed for chunk {chunk_index}, using raw markdown: {e}")
+            event["content"] = raw_content
+            event["error"] = str(e)
+            if isinstance(e, TruncatedOutputError):
+                # Streamed tokens of the cut-off response are replaced by the raw chunk
+                event["truncated"] = True
+        
+        await queue.put(event)
+        return event
+    
+    async def _clean_changed_paragraphs(
+        self,
+        chunk_index: int,
+        runs: list,
+        queue: asyncio.Queue,
+        cleaning_slots: asyncio.Semaphore,
+        stream_tokens: bool,
+        run_gate: Optional[asyncio.Event],
+        event: Dict[str, Any]
+    ) -> tuple[str, int]:
+        """
+        Clean the changed paragraph runs of a chunk and splice in the previous text of the rest
+        
+        Args:
+            runs: (raw text, previous cleaned text or None) runs from ``PreviousConversion.plan``
+        
+        Returns:
+            Tuple of (cleaned content, number of splits after truncation)
+        """
+        parts = []
+        splits = 0
+        for raw_run, cleaned_run in runs:
+            if parts and stream_tokens:
+                await queue.put({"type": "token", "chunk": chunk_index, "content": "\n\n"})
+            if cleaned_run is None:
+                cleaned_run, run_splits = await self._generate_chunk(
+                    chunk_index, raw_run, queue, cleaning_slots, stream_tokens, run_gate, event
+                )
+                splits += run_splits
+            else:
+                event["reused_paragraphs"] = event.get("reused_paragraphs", 0) + len(split_paragraphs(raw_run))
+                if stream_tokens:
+                    await queue.put({"type": "token", "chunk": chunk_index, "content": cleaned_run})
+            parts.append(cleaned_run)
+        return "\n\n".join(parts), splits
+    
+    async def _generate_chunk(
+        self,
+        chunk_index: int,
+        raw_content: str,
+        queue: asyncio.Queue,
+        cleaning_slots: asyncio.Semaphore,
+        stream_tokens: bool,
+        run_gate: Optional[asyncio.Event],
+        event: Dict[str, Any]
+    ) -> tuple[str, int]:
+        """
+        Generate the cleaned text of a chunk, cleaning it again if vLLM is unavailable
+        
+        Once the request-level retries are used up, the chunk is retried after
+        a backoff up to ``vllm_chunk_retries`` times, and while the circuit
+        breaker is open it waits for vLLM to come back, for at most
+        ``vllm_chunk_retry_timeout`` seconds. Only this chunk is redone, and not
+        after any of its tokens were streamed. The slot is released while waiting.
+        
+        Returns:
+            Tuple of (cleaned content, number of splits after truncation)
+        """
+        attempt = 0
+        deadline = time.monotonic() + settings.vllm_chunk_retry_timeout
+        
+        while True:
+            parts = []
+            try:
+                if run_gate is not None:
+                    await run_gate.wait()
+                async with cleaning_slots:
+                    if settings.cleaning_output_mode == "edits":
+                        # Edit scripts are not readable text, so no token events are streamed
+                        return await self._clean_or_split(
+                            raw_content, self.vllm_service.clean_markdown_content_edits
+                        )
+                    if stream_tokens:
+                        async for token in self.vllm_service.clean_markdown_content_stream_async(raw_content):
+                            parts.append(token)
+                            await queue.put({"type": "token", "chunk": chunk_index, "content": token})
+                            if run_gate is not None:
+                                await run_gate.wait()
+                        return "".join(parts), 0
+                    return await self._clean_or_split(raw_content, self.vllm_service.clean_markdown_content)
+            except Exception as e:
+                circuit_open = isinstance(e, CircuitOpenError)
+                if parts or settings.vllm_chunk_retries <= 0 or not (circuit_open or is_retryable(e)):
+                    raise
+                if not circuit_open and attempt >= settings.vllm_chunk_retries:
+                    raise
+                
+                delay = e.retry_after if circuit_open else backoff_delay(
+                    attempt, settings.vllm_retry_base_delay, settings.vllm_retry_max_delay
+                )
+                if time.monotonic() + delay > deadline:
+                    raise
+                if not circuit_open:
+                    attempt += 1
+                    event["retries"] = attempt
+                logger.info(f"Cleaning chunk {chunk_index} again in {delay:.1f}s after: {e}")
+                await asyncio.sleep(delay)
+    
+    async def _clean_or_split(self, content: str, clean) -> tuple[str, int]:
+        """
+        Clean content, splitting it in half whenever a response is truncated
+        
+        Args:
+            content: Markdown to clean
+            clean: Cleaning coroutine function of the VLLMService
+            
+        Returns:
+            Tuple of (cleaned content, number of splits needed)
+            
+        Raises:
+            TruncatedOutputError: If a single line is still truncated
+        """
+        try:
+            return await clean(content), 0
+        except TruncatedOutputError:
+            halves = split_in_half(content)
+            if halves is None:
+                raise
+            logger.info(f"Re-splitting truncated content of {len(content)} characters")
+            first, first_splits = await self._clean_or_split(halves[0], clean)
+            second, second_splits = await self._clean_or_split(halves[1], clean)
+            return f"{first}\n{second}", 1 + first_splits + second_splits
+    
+    async def _repair_structured_regions(
+        self,
+        content: str,
+        cleaning_slots: asyncio.Semaphore
+    ) -> tuple[str, int]:
+        """
+        Repair table and equation regions with specialized, grammar-constrained requests
+        
+        Each region is sent to vLLM on its own and spliced back in place; a
+        region whose repair fails keeps its extracted text.
+        
+        Returns:
+            Tuple of (content with repaired regions, number of regions repaired)
+        """
+        regions = [
+            region for region in detect_regions(content)
+            if region.end - region.start < settings.structured_repair_max_region_lines
+        ]
+        if not regions:
+            return content, 0
+        
+        lines = content.split("\n")
+        repairs = {
+            "table": self.vllm_service.repair_table,
+            "equation": self.vllm_service.repair_equation
+        }
+        
+        async def repair(region):
+            region_text = "\n".join(lines[region.start:region.end + 1])
+            try:
+                async with cleaning_slots:
+                    return region, await repairs[region.kind](region_text)
+            except Exception as e:
+                logger.warning(f"Could not repair {region.kind} region at line {region.start}: {e}")
+                return region, None
+        
+        results = await asyncio.gather(*(repair(region) for region in regions))
+        replacements = [(region, text) for region, text in results if text is not None]
+        return splice_regions(content, replacements), len(replacements)
+    
+    async def reclean_chunk(
+        self,
+        chunk_index: int,
+        pages: list,
+        raw_content: str,
+        run_gate: Optional[asyncio.Event] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Clean a single chunk again, e.g. when a user asks to redo one section
+        
+        Args:
+            chunk_index: Index of the chunk in its document
+            pages: ``[first, last]`` page numbers covered by the chunk
+            raw_content: Raw markdown of the chunk
+            run_gate: Optional event that pauses generation while cleared
+            
+        Yields:
+            ``token`` events followed by the chunk's ``chunk_done`` event
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(self._clean_chunk_event(
+            chunk_index, pages[0], pages[-1], raw_content, queue,
+            asyncio.Semaphore(1), stream_tokens=True, run_gate=run_gate, allow_skip=False
+        ))
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield event
+        finally:
+            if not task.done():
+                task.cancel()
+    
     async def get_health_status(self) -> Dict[str, str]:
         """Get health status of all services"""
         health_status = {
@@ -0,0 +1,501 @@
+import asyncio
+import itertools
+import json
+import logging
+import time
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def format_sse_event(event_type: str, data: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    """
+    Format a single Server-Sent Events message
+    
+    Args:
+        event_type: SSE event name (e.g. ``token``)
+        data: JSON-serializable event payload
+        event_id: Optional event id used by clients for Last-Event-ID
+    
+    Returns:
+        The framed event, terminated by a blank line
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    # JSON never contains raw newlines, so the payload always fits one data line
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def format_sse_comment(comment: str) -> str:
+    """Format an SSE comment line (ignored by clients, keeps proxies from idling out)"""
+    return f": {comment}\n\n"
+
+
+def coalesce_text(
+    tokens: Iterable[str],
+    flush_interval: float,
+    flush_size: int
+) -> Iterator[str]:
+    """
+    Batch small token deltas into larger writes
+    
+    A batch is written once it holds ``flush_size`` characters or its first
+    token has waited ``flush_interval`` seconds. Time is only checked when a
+    token arrives, which is enough for a steadily generating model; the last
+    batch is written when the token stream ends.
+    
+    Args:
+        tokens: Token deltas, typically 1-3 characters each
+        flush_interval: Maximum seconds a token is held back
+        flush_size: Characters that trigger an immediate write
+    
+    Yields:
+        Concatenated token batches
+    """
+    parts: List[str] = []
+    size = 0
+    first_at = 0.0
+    
+    for token in tokens:
+        if not parts:
+            first_at = time.monotonic()
+        parts.append(token)
+        size += len(token)
+        if size >= flush_size or time.monotonic() - first_at >= flush_interval:
+            yield "".join(parts)
+            parts = []
+            size = 0
+    
+    if parts:
+        yield "".join(parts)
+
+
+class TokenCoalescer:
+    """Merge token events per chunk until the flush interval or size is reached"""
+    
+    def __init__(self, flush_interval: float, flush_size: Optional[int] = None):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._pending: Dict[int, List[str]] = {}
+        self._pending_size = 0
+        self._pending_since: Optional[float] = None
+    
+    def add(self, chunk: int, content: str, now: float) -> None:
+        """Buffer a token delta for the given chunk"""
+        if self._pending_since is None:
+            self._pending_since = now
+        self._pending.setdefault(chunk, []).append(content)
+        self._pending_size += len(content)
+    
+    def time_until_due(self, now: float) -> Optional[float]:
+        """Seconds until buffered tokens must be flushed, or None if nothing is buffered"""
+        if self._pending_since is None:
+            return None
+        return max(0.0, self._pending_since + self.flush_interval - now)
+    
+    def due(self, now: float) -> bool:
+        """Whether buffered tokens have waited long enough or grown large enough"""
+        if self.flush_size is not None and self._pending_size >= self.flush_size:
+            return True
+        remaining = self.time_until_due(now)
+        return remaining is not None and remaining <= 0
+    
+    def drain(self) -> List[Dict[str, Any]]:
+        """Return one merged token event per chunk and clear the buffer"""
+        events = [
+            {"type": "token", "chunk": chunk, "content": "".join(parts)}
+            for chunk, parts in self._pending.items()
+        ]
+        self._pending = {}
+        self._pending_size = 0
+        self._pending_since = None
+        return events
+
+
+async def coalesce_events(
+    events: AsyncIterator[Dict[str, Any]],
+    flush_interval: float,
+    flush_size: Optional[int] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Merge token events from a processing event stream
+    
+    Token events are merged per chunk and flushed once per ``flush_interval``
+    or when ``flush_size`` characters are buffered, and always before any other
+    event so ordering is kept. The ``stats`` event is extended with how many
+    token deltas were received and how many token events were emitted.
+    
+    Args:
+        events: Event dictionaries with a ``type`` key
+        flush_interval: Seconds to buffer token events before emitting them
+        flush_size: Characters that trigger an immediate flush
+    
+    Yields:
+        Events with token deltas coalesced
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    async def pump_events():
+        try:
+            async for event in events:
+                await queue.put(event)
+        except Exception as e:
+            logger.error(f"Error in event source: {e}")
+            await queue.put({"type": "error", "message": str(e)})
+        finally:
+            await queue.put(None)
+    
+    pump_task = asyncio.create_task(pump_events())
+    coalescer = TokenCoalescer(flush_interval, flush_size)
+    token_deltas = 0
+    token_frames = 0
+    
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    queue.get(), timeout=coalescer.time_until_due(time.monotonic())
+                )
+            except asyncio.TimeoutError:
+                for token_event in coalescer.drain():
+                    token_frames += 1
+                    yield token_event
+                continue
+            
+            if event is not None and event["type"] == "token":
+                token_deltas += 1
+                now = time.monotonic()
+                coalescer.add(event["chunk"], event["content"], now)
+                if coalescer.due(now):
+                    for token_event in coalescer.drain():
+                        token_frames += 1
+                        yield token_event
+                continue
+            
+            # Flush buffered tokens first so they precede e.g. their chunk_done
+            for token_event in coalescer.drain():
+                token_frames += 1
+                yield token_event
+            if event is None:
+                break
+            
+            if event["type"] == "stats":
+                event = {**event, "token_deltas": token_deltas, "token_frames": token_frames}
+            yield event
+    finally:
+        if not pump_task.done():
+            pump_task.cancel()
+
+
+class EventBuffer:
+    """
+    Framed SSE events of one stream, kept so reconnecting clients can replay them
+    
+    A producer task appends events independently of any client connection, so
+    generation continues when a client drops. Subscribers replay everything
+    after their Last-Event-ID and then follow new events live. At most
+    ``max_events`` frames are retained.
+    """
+    
+    def __init__(self, stream_id: str, max_events: int):
+        self.stream_id = stream_id
+        self.created_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._frames: Deque[Tuple[int, str]] = deque(maxlen=max_events)
+        self._last_id = 0
+        self._changed = asyncio.Event()
+    
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+    
+    @property
+    def last_event_id(self) -> int:
+        return self._last_id
+    
+    @property
+    def replayable(self) -> bool:
+        """Whether a new subscriber can still replay the stream from its first event"""
+        return not self._frames or self._frames[0][0] == 1
+    
+    def append(self, event: Dict[str, Any]) -> None:
+        """Assign the next id to an event, frame it and wake subscribers"""
+        self._last_id += 1
+        self._frames.append((self._last_id, format_sse_event(event["type"], event, self._last_id)))
+        self._notify()
+    
+    def finish(self) -> None:
+        """Mark the stream complete so subscribers end after replaying it"""
+        self.finished_at = time.monotonic()
+        self._notify()
+    
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+    
+    async def produce(
+        self,
+        events: AsyncIterator[Dict[str, Any]],
+        flush_interval: float,
+        flush_size: Optional[int] = None
+    ) -> None:
+        """Consume processing events into the buffer, coalescing token events"""
+        try:
+            async for event in coalesce_events(events, flush_interval, flush_size):
+                if event["type"] == "metadata":
+                    event = {**event, "stream_id": self.stream_id}
+                self.append(event)
+        finally:
+            self.finish()
+    
+    async def subscribe(self, last_event_id: int = 0, heartbeat_interval: float = 15) -> AsyncIterator[str]:
+        """
+        Replay events after ``last_event_id``, then follow the stream live
+        
+        Args:
+            last_event_id: Id of the last event the client received (0 for all)
+            heartbeat_interval: Seconds of silence before a heartbeat comment
+        
+        Yields:
+            SSE-framed text, one write per batch of available events
+        """
+        cursor = last_event_id
+        if self._frames and cursor < self._frames[0][0] - 1:
+            # The bounded buffer has already dropped events this client never saw
+            yield format_sse_event("error", {
+                "type": "error",
+                "message": f"Events after id {cursor} are no longer available",
+                "first_available_id": self._frames[0][0]
+            })
+        
+        last_write = time.monotonic()
+        while True:
+            pending = []
+            if self._frames and cursor < self._last_id:
+                # Ids are contiguous, so the first unseen frame is found by offset
+                offset = max(cursor - self._frames[0][0] + 1, 0)
+                pending = list(itertools.islice(self._frames, offset, None))
+            if pending:
+                cursor = pending[-1][0]
+                last_write = time.monotonic()
+                yield "".join(frame for _, frame in pending)
+                continue
+            if self.finished:
+                return
+            
+            changed = self._changed
+            timeout = max(heartbeat_interval - (time.monotonic() - last_write), 0)
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                last_write = time.monotonic()
+                yield format_sse_comment("heartbeat")
+
+
+class StreamRegistry:
+    """Running and recently finished event streams, looked up by stream id"""
+    
+    def __init__(self, max_streams: int, ttl_seconds: float, max_events: int):
+        self.max_streams = max_streams
+        self.ttl_seconds = ttl_seconds
+        self.max_events = max_events
+        self._streams: Dict[str, EventBuffer] = {}
+        self._running_by_key: Dict[str, str] = {}
+        self.joined = 0
+    
+    def start(
+        self,
+        events: AsyncIterator[Dict[str, Any]],
+        flush_interval: float,
+        flush_size: Optional[int] = None,
+        key: Optional[str] = None
+    ) -> EventBuffer:
+        """
+        Start producing a new stream in the background and register it
+        
+        Args:
+            events: Event dictionaries with a ``type`` key
+            flush_interval: Seconds to buffer token events before emitting them
+            flush_size: Characters that trigger an immediate flush
+            key: Identity of the work behind the stream, so identical requests
+                made while it runs can join it (see ``join``)
+        """
+        self._prune()
+        buffer = EventBuffer(uuid.uuid4().hex, self.max_events)
+        buffer.task = asyncio.create_task(buffer.produce(events, flush_interval, flush_size))
+        self._streams[buffer.stream_id] = buffer
+        if key is not None:
+            self._running_by_key[key] = buffer.stream_id
+        return buffer
+    
+    def join(self, key: str) -> Optional[EventBuffer]:
+        """
+        Return the running stream started for ``key``, if a new subscriber can follow it
+        
+        Streams that finished or already dropped their first events are not
+        joined, since a joining client must see the whole conversion.
+        """
+        buffer = self._streams.get(self._running_by_key.get(key, ""))
+        if buffer is None or buffer.finished or not buffer.replayable:
+            self._running_by_key.pop(key, None)
+            return None
+        self.joined += 1
+        return buffer
+    
+    def get(self, stream_id: str) -> Optional[EventBuffer]:
+        """Return a running or unexpired stream"""
+        self._prune()
+        return self._streams.get(stream_id)
+    
+    def _prune(self) -> None:
+        """Drop expired finished streams, then the oldest finished ones over the limit"""
+        now = time.monotonic()
+        for stream_id, buffer in list(self._streams.items()):
+            if buffer.finished and now - buffer.finished_at > self.ttl_seconds:
+                del self._streams[stream_id]
+        for key, stream_id in list(self._running_by_key.items()):
+            if stream_id not in self._streams or self._streams[stream_id].finished:
+                del self._running_by_key[key]
+        
+        finished = sorted(
+            (buffer for buffer in self._streams.values() if buffer.finished),
+            key=lambda buffer: buffer.finished_at
+        )
+        while len(self._streams) >= self.max_streams and finished:
+            del self._streams[finished.pop(0).stream_id]
+
+
+class TextBroadcast:
+    """
+    Text batches of one plain-text stream, shared by identical requests
+    
+    A producer task reads a synchronous batch generator in a worker thread and
+    keeps every batch, so a request that joins late replays the text it missed
+    and then follows the stream live. Generation stops at the next batch once
+    every subscriber has left.
+    
+    Args:
+        metadata: Fields every subscriber's metadata line shares (e.g. ``raw_content_length``)
+    """
+    
+    def __init__(self, metadata: Optional[Dict[str, Any]] = None):
+        self.metadata = metadata or {}
+        self.task: Optional[asyncio.Task] = None
+        self.error: Optional[Exception] = None
+        self.finished = False
+        self.subscribers = 0
+        self.abandoned = False
+        self._batches: List[str] = []
+        self._changed = asyncio.Event()
+    
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+    
+    async def produce(self, batches: Iterator[str]) -> None:
+        """Read ``batches`` off the event loop until it ends or nobody is listening"""
+        try:
+            while not self.abandoned:
+                batch = await asyncio.to_thread(next, batches, None)
+                if batch is None:
+                    break
+                self._batches.append(batch)
+                self._notify()
+            else:
+                # Only closed between batches, since a running generator cannot be closed
+                batches.close()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            self._notify()
+    
+    async def subscribe(self) -> AsyncIterator[str]:
+        """
+        Replay every batch, then follow the stream live
+        
+        Yields:
+            Text, one write per run of available batches
+        
+        Raises:
+            Exception: Whatever the shared generator raised, after the text before it
+        """
+        self.subscribers += 1
+        cursor = 0
+        try:
+            while True:
+                if cursor < len(self._batches):
+                    pending = self._batches[cursor:]
+                    cursor = len(self._batches)
+                    yield "".join(pending)
+                    continue
+                if self.finished:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.finished:
+                self.abandoned = True
+
+
+class TextBroadcasts:
+    """Running plain-text streams, looked up by the identity of the work behind them"""
+    
+    def __init__(self):
+        self._running: Dict[str, TextBroadcast] = {}
+        self.joined = 0
+    
+    def start(
+        self,
+        batches: Iterator[str],
+        key: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> TextBroadcast:
+        """
+        Start producing a plain-text stream in the background
+        
+        Args:
+            batches: Synchronous generator of text batches
+            key: Identity of the work behind the stream, so identical requests
+                made while it runs can join it (see ``join``)
+            metadata: Fields shared by every subscriber's metadata line
+        """
+        broadcast = TextBroadcast(metadata)
+        broadcast.task = asyncio.create_task(broadcast.produce(batches))
+        if key is not None:
+            self._running[key] = broadcast
+            broadcast.task.add_done_callback(lambda _: self._forget(key, broadcast))
+        return broadcast
+    
+    def join(self, key: str) -> Optional[TextBroadcast]:
+        """Return the running stream started for ``key``, unless it finished or lost its subscribers"""
+        broadcast = self._running.get(key)
+        if broadcast is None or broadcast.finished or broadcast.abandoned:
+            return None
+        self.joined += 1
+        return broadcast
+    
+    def _forget(self, key: str, broadcast: TextBroadcast) -> None:
+        if self._running.get(key) is broadcast:
+            del self._running[key]
+
+
+# Global registry of resumable streams
+stream_registry = StreamRegistry(
+    max_streams=settings.stream_buffer_max_streams,
+    ttl_seconds=settings.stream_buffer_ttl,
+    max_events=settings.stream_buffer_max_events
+)
+
+# Global table of running plain-text streams
+text_broadcasts = TextBroadcasts()
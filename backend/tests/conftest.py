@@ -8,6 +8,9 @@ import asyncio
 import httpx
 from pathlib import Path
 from typing import AsyncGenerator
+from unittest.mock import AsyncMock, Mock, patch
+
+from services import document_service
 
 
 @pytest.fixture(scope="session")
@@ -18,6 +21,49 @@ def event_loop():
     loop.close()
 
 
+def pages_of(*pages):
+    """Stand-in for ``PDFConverterService.iter_pdf_pages`` that yields the given pages."""
+    async def fake_pages(self, file_content, filename):
+        for page in pages:
+            yield page
+    return fake_pages
+
+
+def completion(content: str, finish_reason: str = "stop") -> Mock:
+    """A non-streaming chat completion response."""
+    return Mock(choices=[Mock(message=Mock(content=content), finish_reason=finish_reason)])
+
+
+class FakeClock:
+    """Clock whose time only moves when a test sets ``now``."""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def cleaning():
+    """Clean one page per chunk by upper-casing it, without the quality, drift or repair steps."""
+    with patch('config.settings.cleaning_chunk_size', 1), \
+         patch('config.settings.skip_clean_enabled', False), \
+         patch('config.settings.drift_guard_enabled', False), \
+         patch('config.settings.structured_repair_enabled', False), \
+         patch('config.settings.preclean_enabled', False), \
+         patch('services.VLLMService.clean_markdown_content',
+               AsyncMock(side_effect=lambda content: content.upper())) as mock_clean:
+        yield mock_clean
+
+
+@pytest.fixture(autouse=True)
+def empty_chunk_cache():
+    """Keep cleaned chunks from leaking between tests through the global service's cache."""
+    document_service.vllm_service.chunk_cache.clear()
+    yield
+
+
 @pytest.fixture
 def base_url() -> str:
     """Base URL for the API server."""
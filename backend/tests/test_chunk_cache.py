@@ -0,0 +1,154 @@
+"""
+Tests for reusing the cleaned text of chunks seen in earlier documents
+"""
+
+import pytest
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+
+from chunk_cache import ChunkCache, normalize_chunk
+from main import app
+from services import DocumentProcessingService, document_service
+from tests.conftest import pages_of
+
+
+LICENSE = "Permission is hereby granted, free of charge, to any person obtaining a copy"
+
+
+async def convert(service: DocumentProcessingService, *pages) -> list:
+    with patch('services.PDFConverterService.iter_pdf_pages', pages_of(*pages)):
+        return [event async for event in service.stream_document(b"pdf", "doc.pdf")]
+
+
+class TestChunkCache:
+    """Test cache keys and eviction"""
+    
+    def test_whitespace_noise_keeps_key(self):
+        assert normalize_chunk("Line one  \r\nLine two\n\n\n\nEnd\n") == "Line one\nLine two\n\nEnd"
+        assert ChunkCache.key("Line one \nLine two", "rewrite") == ChunkCache.key("Line one\nLine two\n", "rewrite")
+    
+    def test_words_mode_and_prompt_change_key(self):
+        key = ChunkCache.key(LICENSE, "rewrite")
+        assert ChunkCache.key(LICENSE.replace("free", "fee"), "rewrite") != key
+        assert ChunkCache.key(LICENSE, "edits") != key
+        with patch('chunk_cache.prompt_fingerprint', return_value="v9-000000000000"):
+            assert ChunkCache.key(LICENSE, "rewrite") != key
+    
+    def test_least_recently_used_evicted(self):
+        cache = ChunkCache(max_entries=2)
+        cache.put("a", "rewrite", "A")
+        cache.put("b", "rewrite", "B")
+        cache.get("a", "rewrite")
+        cache.put("c", "rewrite", "C")
+        
+        assert cache.get("b", "rewrite") is None
+        assert cache.get("a", "rewrite") == "A"
+        assert cache.snapshot()["entries"] == 2
+    
+    def test_disabled_cache_stores_nothing(self):
+        cache = ChunkCache(max_entries=10)
+        with patch('config.settings.chunk_cache_enabled', False):
+            cache.put("a", "rewrite", "A")
+        assert cache.get("a", "rewrite") is None
+
+
+class TestChunkCachePipeline:
+    """Test sharing cleaned chunks between documents"""
+    
+    @pytest.mark.asyncio
+    async def test_shared_chunk_cleaned_once_across_documents(self, cleaning):
+        service = DocumentProcessingService()
+        await convert(service, LICENSE, "first paper")
+        events = await convert(service, LICENSE, "second paper")
+        
+        chunks = [event for event in events if event["type"] == "chunk_done"]
+        assert [chunk["content"] for chunk in chunks] == [LICENSE.upper(), "SECOND PAPER"]
+        assert chunks[0]["cached"] is True
+        assert "cached" not in chunks[1]
+        assert cleaning.await_count == 3
+        assert next(e for e in events if e["type"] == "stats")["cached_chunk_count"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_cached_chunk_streams_its_text(self, cleaning):
+        service = DocumentProcessingService()
+        service.vllm_service.chunk_cache.put(LICENSE, "rewrite", "cached text")
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', pages_of(LICENSE)):
+            events = [e async for e in service.stream_document(b"pdf", "doc.pdf", stream_tokens=True)]
+        
+        assert {"type": "token", "chunk": 0, "content": "cached text"} in events
+        assert cleaning.await_count == 0
+    
+    @pytest.mark.asyncio
+    async def test_drifted_output_not_cached(self, cleaning):
+        service = DocumentProcessingService()
+        cleaning.side_effect = lambda content: "Something else entirely " * 10
+        page = " ".join([LICENSE] * 3)
+        
+        with patch('config.settings.drift_guard_enabled', True):
+            await convert(service, page)
+        assert service.vllm_service.chunk_cache.snapshot()["entries"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_reclean_bypasses_and_refreshes_cache(self, cleaning):
+        service = DocumentProcessingService()
+        cache = service.vllm_service.chunk_cache
+        cache.put(LICENSE, "rewrite", "stale")
+        
+        async def stream(content):
+            yield content.upper()
+        
+        with patch.object(service.vllm_service, 'clean_markdown_content_stream_async', stream):
+            events = [e async for e in service.reclean_chunk(0, [0, 0], LICENSE)]
+        
+        assert events[-1]["content"] == LICENSE.upper()
+        assert cache.get(LICENSE, "rewrite") == LICENSE.upper()
+    
+    @pytest.mark.asyncio
+    async def test_cache_hit_skips_structured_repair(self, cleaning):
+        """Chunks are cached by their text before repair, so a hit needs no repair requests"""
+        service = DocumentProcessingService()
+        repair = AsyncMock(side_effect=lambda content, slots: (content + " (repaired)", 1))
+        
+        with patch('config.settings.structured_repair_enabled', True), \
+             patch.object(service, '_repair_structured_regions', repair):
+            await convert(service, LICENSE)
+            events = await convert(service, LICENSE)
+        
+        chunk = next(event for event in events if event["type"] == "chunk_done")
+        assert chunk["cached"] is True
+        assert chunk["content"] == (LICENSE + " (repaired)").upper()
+        assert repair.await_count == 1
+        assert cleaning.await_count == 1
+
+
+class TestCleanMarkdownCache:
+    """Test reusing cached chunks for /clean-markdown"""
+    
+    @patch('vllm_manager.vllm_manager._is_vllm_running')
+    def test_clean_markdown_reuses_cleaned_chunks(self, mock_vllm_running, cleaning):
+        mock_vllm_running.return_value = True
+        client = TestClient(app)
+        
+        with patch.object(document_service.vllm_service, 'chunk_cache', ChunkCache(max_entries=10)) as cache:
+            cache.put(LICENSE, "rewrite", "from a document")
+            cached = client.post("/clean-markdown", json={"markdown_content": LICENSE}).json()
+            first = client.post("/clean-markdown", json={"markdown_content": "new text"}).json()
+            second = client.post("/clean-markdown", json={"markdown_content": "new text"}).json()
+        
+        assert cached["cleaned_content"] == "from a document"
+        assert first["cleaned_content"] == second["cleaned_content"] == "NEW TEXT"
+        assert cleaning.await_count == 1
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("output", ["", "\n", "A summary the model wrote instead of the text it was given."])
+    async def test_rejected_output_is_not_cached(self, output):
+        service = document_service.vllm_service
+        source = f"{LICENSE}, to deal in the Software without restriction, including without limitation"
+        
+        with patch.object(service, 'clean_markdown_content', AsyncMock(return_value=output)) as clean:
+            assert await service.clean_markdown_content_cached(source) == output
+            assert await service.clean_markdown_content_cached(source) == output
+        
+        assert clean.await_count == 2
+        assert service.chunk_cache.get(source, "rewrite") is None
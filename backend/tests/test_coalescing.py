@@ -0,0 +1,280 @@
+"""
+Tests for sharing in-flight work between identical uploads
+"""
+
+import asyncio
+import httpx
+import json
+import pytest
+import threading
+from unittest.mock import AsyncMock, patch
+
+from coalescing import InFlightCalls, conversion_key
+from main import app
+from streaming import StreamRegistry, TextBroadcasts
+
+
+def upload(client: httpx.AsyncClient, filename: str, content: bytes = b"%PDF same file"):
+    return client.post("/upload", files={"file": (filename, content, "application/pdf")})
+
+
+class TestConversionKey:
+    """Test what makes two conversions identical"""
+    
+    def test_same_content_and_options_match(self):
+        assert conversion_key(b"pdf", clean_with_llm=True) == conversion_key(b"pdf", clean_with_llm=True)
+    
+    def test_content_options_and_prompt_change_key(self):
+        key = conversion_key(b"pdf", clean_with_llm=True)
+        assert conversion_key(b"other", clean_with_llm=True) != key
+        assert conversion_key(b"pdf", clean_with_llm=False) != key
+        with patch('coalescing.prompt_fingerprint', return_value="v2-000000000000"):
+            assert conversion_key(b"pdf", clean_with_llm=True) != key
+
+
+class TestInFlightCalls:
+    """Test joining a running call"""
+    
+    @pytest.mark.asyncio
+    async def test_followers_share_the_leaders_call(self):
+        calls = InFlightCalls()
+        release = asyncio.Event()
+        work = AsyncMock(side_effect=lambda: release.wait())
+        
+        waiters = [asyncio.create_task(calls.run("key", work)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters)
+        
+        assert work.await_count == 1
+        assert [shared for _, shared in results] == [False, True, True]
+        assert calls.snapshot() == {"in_flight": 0, "leaders": 1, "followers": 2}
+    
+    @pytest.mark.asyncio
+    async def test_finished_calls_are_not_reused(self):
+        calls = InFlightCalls()
+        work = AsyncMock(return_value="result")
+        
+        await calls.run("key", work)
+        assert await calls.run("key", work) == ("result", False)
+        assert work.await_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_error_reaches_every_waiter(self):
+        calls = InFlightCalls()
+        
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("broken pdf")
+        
+        results = await asyncio.gather(
+            calls.run("key", fail), calls.run("key", fail), return_exceptions=True
+        )
+        assert all(isinstance(result, ValueError) for result in results)
+    
+    @pytest.mark.asyncio
+    async def test_leader_leaving_does_not_cancel_followers(self):
+        calls = InFlightCalls()
+        release = asyncio.Event()
+        
+        async def work():
+            await release.wait()
+            return "result"
+        
+        leader = asyncio.create_task(calls.run("key", work))
+        follower = asyncio.create_task(calls.run("key", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        release.set()
+        
+        assert await follower == ("result", True)
+
+
+class TestCoalescedUploads:
+    """Test identical uploads through the API"""
+    
+    @pytest.mark.asyncio
+    async def test_identical_uploads_convert_once(self):
+        release = asyncio.Event()
+        
+        async def process(file_content, filename, clean_with_llm, preclean, previous_job_id):
+            await release.wait()
+            return {
+                "success": True,
+                "filename": filename,
+                "cleaned_markdown": "# Cleaned",
+                "metadata": {"original_filename": filename}
+            }
+        
+        transport = httpx.ASGITransport(app=app)
+        with patch('main.vllm_manager._is_vllm_running', AsyncMock(return_value=True)), \
+             patch('main.document_service.process_document', AsyncMock(side_effect=process)) as mock_process:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                first = asyncio.create_task(upload(client, "a.pdf"))
+                second = asyncio.create_task(upload(client, "b.pdf"))
+                other = asyncio.create_task(upload(client, "c.pdf", b"%PDF another file"))
+                await asyncio.sleep(0.1)
+                release.set()
+                first, second, other = await asyncio.gather(first, second, other)
+        
+        assert mock_process.await_count == 2
+        assert first.json()["filename"] == "a.pdf"
+        assert "coalesced" not in first.json()["metadata"]
+        assert second.json()["filename"] == "b.pdf"
+        assert second.json()["metadata"] == {"original_filename": "b.pdf", "coalesced": True}
+        assert other.json()["filename"] == "c.pdf"
+    
+    @pytest.mark.asyncio
+    async def test_coalescing_can_be_disabled(self):
+        process = AsyncMock(return_value={"filename": "a.pdf", "metadata": {}})
+        transport = httpx.ASGITransport(app=app)
+        with patch('main.vllm_manager._is_vllm_running', AsyncMock(return_value=True)), \
+             patch('main.document_service.process_document', process), \
+             patch('config.settings.coalesce_conversions_enabled', False):
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                await asyncio.gather(upload(client, "a.pdf"), upload(client, "b.pdf"))
+        
+        assert process.await_count == 2
+
+
+class TestJoinedStreams:
+    """Test identical incremental uploads following one stream"""
+    
+    @staticmethod
+    async def events(release: asyncio.Event):
+        yield {"type": "metadata", "filename": "a.pdf"}
+        await release.wait()
+        yield {"type": "done"}
+    
+    @pytest.mark.asyncio
+    async def test_running_stream_is_joined(self):
+        registry = StreamRegistry(max_streams=10, ttl_seconds=60, max_events=100)
+        release = asyncio.Event()
+        stream = registry.start(self.events(release), 0, key="key")
+        
+        assert registry.join("key") is stream
+        assert registry.join("other") is None
+        
+        release.set()
+        await stream.task
+        assert registry.join("key") is None
+        assert registry.joined == 1
+    
+    @pytest.mark.asyncio
+    async def test_stream_missing_its_first_events_is_not_joined(self):
+        registry = StreamRegistry(max_streams=10, ttl_seconds=60, max_events=1)
+        release = asyncio.Event()
+        stream = registry.start(self.events(release), 0, key="key")
+        await asyncio.sleep(0.01)
+        stream.append({"type": "token", "chunk": 0, "content": "x"})
+        
+        assert registry.join("key") is None
+        release.set()
+        await stream.task
+    
+    @pytest.mark.asyncio
+    async def test_identical_incremental_upload_joins_stream(self):
+        release = asyncio.Event()
+        
+        def stream_document(file_content, filename, stream_tokens, previous_job_id):
+            return self.events(release)
+        
+        transport = httpx.ASGITransport(app=app)
+        with patch('main.vllm_manager._is_vllm_running', AsyncMock(return_value=True)), \
+             patch('main.document_service.stream_document', side_effect=stream_document) as mock_stream:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                # The ASGI transport returns a response once its body is complete
+                asyncio.get_running_loop().call_later(0.1, release.set)
+                first, second = await asyncio.gather(*(
+                    client.post(
+                        "/upload-stream",
+                        params={"incremental": True},
+                        files={"file": (name, b"%PDF streamed", "application/pdf")}
+                    )
+                    for name in ("a.pdf", "b.pdf")
+                ))
+        
+        assert mock_stream.call_count == 1
+        assert first.headers["x-stream-id"] == second.headers["x-stream-id"]
+        assert second.headers["x-filename"] == "b.pdf"
+        assert first.text == second.text
+        assert "event: done" in second.text
+
+
+class TestTextBroadcasts:
+    """Test identical default-mode uploads following one plain-text stream"""
+    
+    @staticmethod
+    def batches(release: threading.Event, log: list):
+        try:
+            yield "Cleaned "
+            release.wait(timeout=5)
+            yield "text"
+        finally:
+            log.append("closed")
+    
+    @pytest.mark.asyncio
+    async def test_late_subscriber_replays_batches(self):
+        broadcasts = TextBroadcasts()
+        release = threading.Event()
+        broadcast = broadcasts.start(self.batches(release, []), key="key", metadata={"raw_content_length": 5})
+        
+        first = broadcast.subscribe()
+        assert await first.__anext__() == "Cleaned "
+        joined = broadcasts.join("key")
+        assert joined is broadcast
+        release.set()
+        
+        assert "".join([text async for text in joined.subscribe()]) == "Cleaned text"
+        assert "".join([text async for text in first]) == "text"
+        assert broadcasts.join("key") is None
+        assert broadcasts.joined == 1
+    
+    @pytest.mark.asyncio
+    async def test_generation_stops_when_every_subscriber_leaves(self):
+        broadcasts = TextBroadcasts()
+        release = threading.Event()
+        produced = []
+        
+        def batches():
+            for index in range(5):
+                produced.append(index)
+                yield str(index)
+                release.wait(timeout=5)
+        
+        broadcast = broadcasts.start(batches(), key="key")
+        subscriber = broadcast.subscribe()
+        await subscriber.__anext__()
+        await subscriber.aclose()
+        assert broadcasts.join("key") is None
+        
+        release.set()
+        await broadcast.task
+        # The batch being generated when the last subscriber left is the last one
+        assert produced == [0, 1]
+    
+    @pytest.mark.asyncio
+    async def test_identical_default_upload_follows_one_generation(self):
+        release = threading.Event()
+        
+        transport = httpx.ASGITransport(app=app)
+        with patch('main.vllm_manager._is_vllm_running', AsyncMock(return_value=True)), \
+             patch('main.document_service.pdf_service.convert_pdf_to_markdown', AsyncMock(return_value="# Doc")) as mock_convert, \
+             patch('main.document_service.vllm_service.clean_markdown_content_stream',
+                   side_effect=lambda raw: self.batches(release, [])) as mock_stream:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                # The ASGI transport returns a response once its body is complete
+                asyncio.get_running_loop().call_later(0.1, release.set)
+                first, second = await asyncio.gather(*(
+                    client.post("/upload-stream", files={"file": (name, b"%PDF plain", "application/pdf")})
+                    for name in ("a.pdf", "b.pdf")
+                ))
+        
+        assert mock_convert.await_count == 1
+        assert mock_stream.call_count == 1
+        for response, name in ((first, "a.pdf"), (second, "b.pdf")):
+            header, text = response.text.split("\n\n", 1)
+            assert json.loads(header[len("data: "):]) == {
+                "filename": name, "file_size_bytes": len(b"%PDF plain"), "raw_content_length": len("# Doc")
+            }
+            assert text == "Cleaned text"
@@ -0,0 +1,89 @@
+"""
+Tests for the drift guard that rejects cleaned chunks which lost or invented content
+"""
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from drift import has_drifted, measure_drift, tokenize
+from services import DocumentProcessingService
+from tests.conftest import pages_of
+
+
+RAW = """The quick brown fox jumps over the
+lazy dog while the extraction tool
+breaks every line at the page mar-
+gin instead of at the end of a
+sentence, which the model has to ﬁx."""
+
+CLEANED = (
+    "The quick brown fox jumps over the lazy dog while the extraction tool breaks every "
+    "line at the page margin instead of at the end of a sentence, which the model has to fix."
+)
+
+
+class TestDriftMeasurement:
+    """Test shingle coverage between raw and cleaned text"""
+    
+    def test_tokenize_ignores_extraction_artifacts(self):
+        assert tokenize("**Mar-\ngin** ﬁx") == ["margin", "fix"]
+    
+    def test_faithful_cleaning_is_kept(self):
+        drifted, report = has_drifted(RAW, CLEANED, 0.85, 0.85)
+        assert drifted is False
+        assert report["coverage"] == 1.0
+        assert report["support"] == 1.0
+    
+    def test_dropped_content_is_flagged(self):
+        drifted, report = has_drifted(RAW, "The quick brown fox jumps over the lazy dog.", 0.85, 0.85)
+        assert drifted is True
+        assert report["coverage"] < 0.5
+    
+    def test_invented_content_is_flagged(self):
+        invented = CLEANED + " The model then added a long summary that was never part of the page."
+        drifted, report = has_drifted(RAW, invented, 0.85, 0.85)
+        assert drifted is True
+        assert report["coverage"] == 1.0
+        assert report["support"] < 0.85
+    
+    def test_short_chunks_are_not_checked(self):
+        assert has_drifted("Page 3 of 10", "", 0.85, 0.85)[0] is False
+    
+    def test_empty_response(self):
+        assert measure_drift(RAW, "")["coverage"] == 0.0
+
+
+class TestDriftGuardPipeline:
+    """Test falling back to raw text for drifted chunks"""
+    
+    fake_pages = staticmethod(pages_of(RAW))
+    
+    @pytest.mark.asyncio
+    async def test_drifted_chunk_falls_back_to_raw(self):
+        service = DocumentProcessingService()
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', self.fake_pages), \
+             patch('config.settings.preclean_enabled', False), \
+             patch('config.settings.skip_clean_enabled', False), \
+             patch('services.VLLMService.clean_markdown_content', AsyncMock(return_value="The quick brown fox.")):
+            events = [e async for e in service.stream_document(b"pdf", "test.pdf")]
+        
+        chunk = next(e for e in events if e["type"] == "chunk_done")
+        assert chunk["content"] == RAW
+        assert chunk["cleaned_with_llm"] is False
+        assert chunk["drift"]["coverage"] < 0.85
+        assert next(e for e in events if e["type"] == "stats")["drifted_chunk_count"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_faithful_chunk_is_kept(self):
+        service = DocumentProcessingService()
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', self.fake_pages), \
+             patch('config.settings.preclean_enabled', False), \
+             patch('config.settings.skip_clean_enabled', False), \
+             patch('services.VLLMService.clean_markdown_content', AsyncMock(return_value=CLEANED)):
+            result = await service.process_document(b"pdf", "test.pdf")
+        
+        assert result["cleaned_markdown"] == CLEANED
+        assert result["cleaned_with_llm"] is True
+        assert result["metadata"]["drifted_chunk_count"] == 0
@@ -0,0 +1,92 @@
+"""
+Tests for the edit-based cleaning output mode
+"""
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from edit_script import EditScriptError, apply_edits, number_lines, parse_edit_script
+from services import DocumentProcessingService, VLLMService
+from tests.conftest import completion, pages_of
+
+
+ORIGINAL = "# Title\nThe text was wrap-\nped here.\nPage 3\nLast line"
+
+
+class TestEditScript:
+    """Test parsing, validating and applying edit scripts"""
+    
+    def test_number_lines(self):
+        assert number_lines("a\nb") == "1| a\n2| b"
+    
+    def test_apply_replace_delete_insert(self):
+        """Edits refer to original line numbers regardless of order"""
+        script = "D 4\nR 2-3: The text was wrapped here.\nI 5: New last line\nI 0: Preface"
+        edits = parse_edit_script(script, 5)
+        assert apply_edits(ORIGINAL, edits) == (
+            "Preface\n# Title\nThe text was wrapped here.\nLast line\nNew last line"
+        )
+    
+    @pytest.mark.parametrize("script", ["NONE", "", "```\nNONE\n```"])
+    def test_no_edits(self, script):
+        assert apply_edits(ORIGINAL, parse_edit_script(script, 5)) == ORIGINAL
+    
+    @pytest.mark.parametrize("script", [
+        "Here is the cleaned text:",
+        "R 6: out of range",
+        "R 3-2: backwards",
+        "D 2\nR 2: overlapping",
+        "R 2",
+        "D 2: text",
+        "I 7: after the end",
+        "R 1-3: x\nI 2: inside",
+    ])
+    def test_invalid_scripts_rejected(self, script):
+        with pytest.raises(EditScriptError):
+            parse_edit_script(script, 5)
+
+
+class TestEditCleaningMode:
+    """Test VLLMService edit mode and its fallback"""
+    
+    @pytest.mark.asyncio
+    async def test_edits_applied(self):
+        service = VLLMService()
+        create = AsyncMock(return_value=completion("<think></think>R 2-3: The text was wrapped here.\nD 4"))
+        
+        with patch.object(service.async_client.chat.completions, 'create', create):
+            result = await service.clean_markdown_content_edits(ORIGINAL)
+        
+        assert result == "# Title\nThe text was wrapped here.\nLast line"
+        prompt = create.call_args.kwargs["messages"][1]["content"]
+        assert "2| The text was wrap-" in prompt
+    
+    @pytest.mark.asyncio
+    async def test_malformed_script_falls_back_to_rewrite(self):
+        service = VLLMService()
+        create = AsyncMock(return_value=completion("Sure! Here is the cleaned text."))
+        
+        with patch.object(service.async_client.chat.completions, 'create', create), \
+             patch.object(service, 'clean_markdown_content', AsyncMock(return_value="rewritten")) as rewrite:
+            result = await service.clean_markdown_content_edits(ORIGINAL)
+        
+        assert result == "rewritten"
+        rewrite.assert_awaited_once_with(ORIGINAL)
+    
+    @pytest.mark.asyncio
+    async def test_pipeline_uses_edit_mode(self):
+        """With CLEANING_OUTPUT_MODE=edits chunks are cleaned through edits, without token events"""
+        service = DocumentProcessingService()
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', pages_of(ORIGINAL)), \
+             patch('config.settings.cleaning_output_mode', 'edits'), \
+             patch('config.settings.preclean_enabled', False), \
+             patch('config.settings.skip_clean_enabled', False), \
+             patch('services.VLLMService.clean_markdown_content_edits', AsyncMock(return_value="edited")) as edits, \
+             patch('services.VLLMService.clean_markdown_content_stream_async') as stream:
+            events = [e async for e in service.stream_document(b"pdf", "test.pdf", stream_tokens=True)]
+        
+        edits.assert_awaited_once_with(ORIGINAL)
+        stream.assert_not_called()
+        assert not [e for e in events if e["type"] == "token"]
+        assert next(e for e in events if e["type"] == "chunk_done")["content"] == "edited"
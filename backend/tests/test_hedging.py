@@ -0,0 +1,130 @@
+"""
+Tests for hedging slow non-streaming vLLM requests
+"""
+
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from hedging import HedgingPolicy
+from services import VLLMService
+from tests.conftest import completion
+from vllm_manager import VLLMManager
+
+
+def warmed_up_service(seconds_per_token: float = 0.0001) -> VLLMService:
+    """A service whose policy has enough samples to hedge after a short delay"""
+    service = VLLMService()
+    service.hedging = HedgingPolicy(percentile=95, min_delay=0.01, budget=0.5)
+    for _ in range(20):
+        service.hedging.record(seconds_per_token * 100, 100)
+    return service
+
+
+class TestHedgingPolicy:
+    """Test hedge delays and the hedge budget"""
+    
+    def test_no_delay_until_enough_samples(self):
+        policy = HedgingPolicy(percentile=95, min_delay=0.1, budget=0.1, min_samples=3)
+        policy.record(1.0, 100)
+        policy.record(1.0, 100)
+        assert policy.delay(100) is None
+    
+    def test_delay_scales_percentile_to_budget(self):
+        policy = HedgingPolicy(percentile=95, min_delay=0.5, budget=0.1, min_samples=1)
+        for seconds in range(1, 21):
+            policy.record(seconds, 100)  # 0.01 to 0.2 seconds per token
+        
+        assert policy.delay(1000) == pytest.approx(200)
+        assert policy.delay(1) == 0.5
+    
+    def test_budget_caps_hedges(self):
+        policy = HedgingPolicy(percentile=95, min_delay=0.1, budget=0.1)
+        for _ in range(9):
+            policy.record(1.0, 100)
+        
+        assert policy.try_acquire() is True
+        assert policy.try_acquire() is False
+        policy.record(1.0, 100, hedged=True)
+        assert policy.try_acquire() is False
+
+
+class TestHedgedRequests:
+    """Test racing a slow request against its hedge"""
+    
+    @pytest.mark.asyncio
+    async def test_slow_request_hedged_with_priority(self):
+        """Without replicas the hedge goes to the same server with a higher priority"""
+        service = warmed_up_service()
+        primary_cancelled = asyncio.Event()
+        
+        async def create(**kwargs):
+            if "priority" in (kwargs.get("extra_body") or {}):
+                return completion("from hedge")
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                primary_cancelled.set()
+                raise
+        
+        with patch('config.settings.hedging_enabled', True), \
+             patch.object(service.async_client.chat.completions, 'create', AsyncMock(side_effect=create)) as mock:
+            result = await service.clean_markdown_content("x" * 400)
+        
+        assert result == "from hedge"
+        assert mock.call_args.kwargs["extra_body"] == {"priority": -10}
+        await asyncio.wait_for(primary_cancelled.wait(), 1)
+        assert service.hedging.snapshot()["hedge_wins"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_fast_request_not_hedged(self):
+        service = warmed_up_service(seconds_per_token=1.0)
+        create = AsyncMock(return_value=completion("cleaned"))
+        
+        with patch('config.settings.hedging_enabled', True), \
+             patch.object(service.async_client.chat.completions, 'create', create):
+            assert await service.clean_markdown_content("x" * 400) == "cleaned"
+        
+        assert create.await_count == 1
+        assert service.hedging.snapshot()["hedged"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_hedge_sent_to_replica(self):
+        with patch('config.settings.hedging_replica_urls', ["http://replica:8000"]):
+            service = warmed_up_service()
+        
+        async def slow(**kwargs):
+            await asyncio.sleep(10)
+        
+        replica = service.hedge_clients[0]
+        with patch('config.settings.hedging_enabled', True), \
+             patch.object(service.async_client.chat.completions, 'create', AsyncMock(side_effect=slow)), \
+             patch.object(replica.chat.completions, 'create', AsyncMock(return_value=completion("replica"))) as hedge:
+            assert await service.clean_markdown_content("x" * 400) == "replica"
+        
+        assert "extra_body" not in hedge.call_args.kwargs
+    
+    @pytest.mark.asyncio
+    async def test_primary_error_reported_when_both_fail(self):
+        service = warmed_up_service()
+        
+        async def create(**kwargs):
+            if "priority" in (kwargs.get("extra_body") or {}):
+                raise ValueError("hedge failed")
+            await asyncio.sleep(0.05)
+            raise RuntimeError("primary failed")
+        
+        with patch('config.settings.hedging_enabled', True), \
+             patch.object(service.async_client.chat.completions, 'create', AsyncMock(side_effect=create)):
+            with pytest.raises(RuntimeError, match="primary failed"):
+                await service.clean_markdown_content("x" * 400)
+        
+        assert service.hedging.in_flight_hedges == 0
+    
+    def test_priority_scheduling_enabled_for_same_server_hedges(self):
+        manager = VLLMManager()
+        with patch.object(manager, '_has_gpu', return_value=True), \
+             patch('config.settings.hedging_enabled', True):
+            assert "priority" in manager._build_vllm_command("model")
+            with patch('config.settings.hedging_replica_urls', ["http://replica:8000"]):
+                assert "--scheduling-policy" not in manager._build_vllm_command("model")
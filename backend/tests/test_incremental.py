@@ -0,0 +1,151 @@
+"""
+Tests for re-converting a revised document against a previous job
+"""
+
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from jobs import CleanedChunk, JobStore, PreviousConversion, new_job_id
+from main import app
+from services import DocumentProcessingService
+from tests.conftest import pages_of
+
+
+INTRO = "Install the pump on a level surface.\n\nConnect the inlet hose."
+SAFETY_V1 = "Wear gloves at all times.\n\nDisconnect power before service.\n\nKeep away from children."
+SAFETY_V2 = "Wear gloves at all times.\n\nDisconnect power and water before service.\n\nKeep away from children."
+
+
+async def convert(service: DocumentProcessingService, pages, previous_job_id=None) -> list:
+    with patch('services.PDFConverterService.iter_pdf_pages', pages_of(*pages)):
+        return [
+            event async for event in service.stream_document(
+                b"pdf", "manual.pdf", previous_job_id=previous_job_id
+            )
+        ]
+
+
+@pytest.fixture
+def cleaning(cleaning):
+    """The shared cleaning stand-in with the chunk cache turned off too"""
+    with patch('config.settings.chunk_cache_enabled', False):
+        yield cleaning
+
+
+class TestPreviousConversion:
+    """Test matching chunks and paragraphs of an earlier job"""
+    
+    def test_changed_paragraphs_are_planned_for_cleaning(self):
+        previous = PreviousConversion([CleanedChunk(SAFETY_V1, SAFETY_V1.upper())])
+        
+        assert previous.plan(SAFETY_V2) == [
+            ("Wear gloves at all times.", "WEAR GLOVES AT ALL TIMES."),
+            ("Disconnect power and water before service.", None),
+            ("Keep away from children.", "KEEP AWAY FROM CHILDREN.")
+        ]
+    
+    def test_whitespace_changes_keep_chunk_match(self):
+        previous = PreviousConversion([CleanedChunk(INTRO, "cleaned intro")])
+        assert previous.chunk(INTRO.replace("\n\n", "  \n\n\n")) == "cleaned intro"
+    
+    def test_restructured_cleaning_not_matched_by_paragraph(self):
+        """When cleaning merged paragraphs, it is unknown which text belongs to which"""
+        previous = PreviousConversion([CleanedChunk(SAFETY_V1, "All safety rules in one paragraph.")])
+        assert all(cleaned is None for _, cleaned in previous.plan(SAFETY_V2))
+
+
+class TestJobStore:
+    """Test keeping finished jobs"""
+    
+    def test_jobs_survive_restart_with_directory(self, tmp_path):
+        job_id = new_job_id()
+        JobStore(max_jobs=10, directory=str(tmp_path)).save(job_id, [CleanedChunk(INTRO, "cleaned")])
+        
+        restarted = JobStore(max_jobs=10, directory=str(tmp_path))
+        assert job_id in restarted
+        assert restarted.load(job_id).chunk(INTRO) == "cleaned"
+    
+    def test_oldest_jobs_evicted_from_memory(self):
+        store = JobStore(max_jobs=1)
+        first, second = new_job_id(), new_job_id()
+        store.save(first, [])
+        store.save(second, [])
+        
+        assert first not in store
+        assert second in store
+    
+    def test_malformed_ids_rejected(self, tmp_path):
+        store = JobStore(max_jobs=10, directory=str(tmp_path))
+        assert "../config" not in store
+        assert store.load("../config") is None
+
+
+class TestIncrementalReconversion:
+    """Test re-cleaning only what changed between versions"""
+    
+    @pytest.mark.asyncio
+    async def test_only_changed_paragraph_is_cleaned(self, cleaning):
+        service = DocumentProcessingService()
+        first = await convert(service, [INTRO, SAFETY_V1])
+        job_id = first[0]["job_id"]
+        cleaning.reset_mock()
+        
+        events = await convert(service, [INTRO, SAFETY_V2], previous_job_id=job_id)
+        
+        chunks = [event for event in events if event["type"] == "chunk_done"]
+        assert chunks[0]["reused"] is True
+        assert chunks[0]["content"] == INTRO.upper()
+        assert chunks[1]["reused_paragraphs"] == 2
+        assert chunks[1]["content"] == SAFETY_V2.upper()
+        cleaning.assert_awaited_once_with("Disconnect power and water before service.")
+        
+        stats = next(event for event in events if event["type"] == "stats")
+        assert stats["reused_chunk_count"] == 1
+        assert stats["reused_paragraph_count"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_reconversion_is_itself_a_previous_job(self, cleaning):
+        service = DocumentProcessingService()
+        first = await convert(service, [SAFETY_V1])
+        second = await convert(service, [SAFETY_V2], previous_job_id=first[0]["job_id"])
+        cleaning.reset_mock()
+        
+        third = await convert(service, [SAFETY_V2], previous_job_id=second[0]["job_id"])
+        
+        assert next(e for e in third if e["type"] == "chunk_done")["reused"] is True
+        assert cleaning.await_count == 0
+    
+    @pytest.mark.asyncio
+    async def test_process_document_reports_reuse(self, cleaning):
+        service = DocumentProcessingService()
+        with patch('services.PDFConverterService.iter_pdf_pages', pages_of(INTRO)):
+            first = await service.process_document(b"pdf", "v1.pdf")
+            second = await service.process_document(b"pdf", "v2.pdf", previous_job_id=first["job_id"])
+        
+        assert second["job_id"] != first["job_id"]
+        assert second["cleaned_markdown"] == INTRO.upper()
+        assert second["metadata"]["previous_job_id"] == first["job_id"]
+        assert second["metadata"]["reused_chunk_count"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_unknown_previous_job_is_an_error(self, cleaning):
+        events = await convert(DocumentProcessingService(), [INTRO], previous_job_id=new_job_id())
+        assert [event["type"] for event in events] == ["metadata", "error", "done"]
+    
+    def test_upload_rejects_unknown_previous_job(self):
+        response = TestClient(app).post(
+            "/upload",
+            params={"previous_job_id": new_job_id()},
+            files={"file": ("manual.pdf", b"%PDF", "application/pdf")}
+        )
+        assert response.status_code == 404
+    
+    def test_upload_stream_requires_incremental_for_previous_job(self):
+        response = TestClient(app).post(
+            "/upload-stream",
+            params={"previous_job_id": new_job_id()},
+            files={"file": ("manual.pdf", b"%PDF", "application/pdf")}
+        )
+        assert response.status_code == 400
+        assert "incremental=true" in response.json()["detail"]
@@ -0,0 +1,235 @@
+"""
+Tests for putting an idle vLLM server to sleep and waking it for new work
+"""
+
+import asyncio
+import pytest
+from typing import Optional
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi.testclient import TestClient
+
+from lifecycle import VLLMLifecycle
+from main import app
+from tests.conftest import FakeClock
+from vllm_manager import VLLMManager
+
+
+def fake_manager(load: Optional[int] = 0) -> MagicMock:
+    manager = MagicMock()
+    manager.process = None
+    
+    async def spawn(model_name=None):
+        if manager.process is None:
+            manager.process = MagicMock()
+        return True
+    
+    manager._is_vllm_running = AsyncMock(return_value=True)
+    manager.get_request_load = AsyncMock(return_value=load)
+    manager.sleep_vllm_service = AsyncMock(return_value=True)
+    manager.wake_vllm_service = AsyncMock(return_value=True)
+    manager.start_vllm_service = AsyncMock(side_effect=spawn)
+    manager.stop_vllm_service = AsyncMock(return_value=True)
+    manager.abandon_startup = AsyncMock()
+    return manager
+
+
+@pytest.fixture
+def idle_sleep():
+    with patch('config.settings.vllm_idle_action', "sleep"), \
+         patch('config.settings.vllm_idle_timeout', 60):
+        yield
+
+
+async def running_lifecycle(manager: MagicMock) -> VLLMLifecycle:
+    lifecycle = VLLMLifecycle(manager, clock=FakeClock())
+    await lifecycle.start()
+    return lifecycle
+
+
+class TestIdleAction:
+    """Test sleeping and stopping after the idle timeout"""
+    
+    @pytest.mark.asyncio
+    async def test_sleeps_after_idle_timeout(self, idle_sleep):
+        manager = fake_manager()
+        lifecycle = await running_lifecycle(manager)
+        
+        lifecycle.clock.now = 59
+        assert await lifecycle.check_idle() is None
+        lifecycle.clock.now = 61
+        assert await lifecycle.check_idle() == "sleeping"
+        manager.sleep_vllm_service.assert_awaited_once_with(1)
+    
+    @pytest.mark.asyncio
+    async def test_busy_server_not_put_to_sleep(self, idle_sleep):
+        """A long streamed response counts as activity even without new requests"""
+        manager = fake_manager(load=2)
+        lifecycle = await running_lifecycle(manager)
+        lifecycle.clock.now = 120
+        
+        assert await lifecycle.check_idle() is None
+        assert lifecycle.state == "running"
+        manager.sleep_vllm_service.assert_not_awaited()
+    
+    @pytest.mark.asyncio
+    async def test_external_server_left_alone(self, idle_sleep):
+        manager = fake_manager()
+        # The server was already running, so nothing is spawned
+        manager.start_vllm_service = AsyncMock(return_value=True)
+        lifecycle = await running_lifecycle(manager)
+        lifecycle.clock.now = 120
+        
+        assert await lifecycle.check_idle() is None
+        manager.sleep_vllm_service.assert_not_awaited()
+    
+    @pytest.mark.asyncio
+    async def test_unknown_load_is_not_idle(self, idle_sleep):
+        """Unreadable metrics skip the idle action instead of counting as no requests"""
+        manager = fake_manager(load=None)
+        lifecycle = await running_lifecycle(manager)
+        lifecycle.clock.now = 120
+        
+        assert await lifecycle.check_idle() is None
+        assert lifecycle.state == "running"
+        manager.sleep_vllm_service.assert_not_awaited()
+        
+        manager.get_request_load.return_value = 0
+        assert await lifecycle.check_idle() == "sleeping"
+    
+    @pytest.mark.asyncio
+    async def test_stop_action_stops_server(self):
+        manager = fake_manager()
+        lifecycle = await running_lifecycle(manager)
+        lifecycle.clock.now = 120
+        
+        with patch('config.settings.vllm_idle_action', "stop"), \
+             patch('config.settings.vllm_idle_timeout', 60):
+            assert await lifecycle.check_idle() == "stopped"
+        manager.stop_vllm_service.assert_awaited_once()
+
+
+class TestWaking:
+    """Test waking vLLM for new work and recording cold starts"""
+    
+    @pytest.mark.asyncio
+    async def test_preflight_wakes_without_waiting(self, idle_sleep):
+        manager = fake_manager()
+        woken = asyncio.Event()
+        
+        async def slow_wake():
+            await woken.wait()
+            return True
+        
+        manager.wake_vllm_service.side_effect = slow_wake
+        lifecycle = await running_lifecycle(manager)
+        lifecycle.clock.now = 120
+        await lifecycle.check_idle()
+        
+        assert await lifecycle.preflight() is True
+        assert lifecycle.state == "waking"
+        
+        woken.set()
+        await lifecycle.ensure_ready()
+        assert lifecycle.state == "running"
+        manager.wake_vllm_service.assert_awaited_once()
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_share_one_wake(self, idle_sleep):
+        manager = fake_manager()
+        lifecycle = await running_lifecycle(manager)
+        lifecycle.clock.now = 120
+        await lifecycle.check_idle()
+        
+        await asyncio.gather(*(lifecycle.ensure_ready() for _ in range(5)))
+        
+        manager.wake_vllm_service.assert_awaited_once()
+        assert lifecycle.snapshot()["wakes"]["count"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_failed_wake_raises_and_stays_asleep(self, idle_sleep):
+        manager = fake_manager()
+        manager.wake_vllm_service.return_value = False
+        lifecycle = await running_lifecycle(manager)
+        lifecycle.clock.now = 120
+        await lifecycle.check_idle()
+        
+        with pytest.raises(Exception, match="failed to start"):
+            await lifecycle.ensure_ready()
+        assert lifecycle.state == "sleeping"
+        assert lifecycle.snapshot()["failed_wakes"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_cold_start_duration_recorded(self):
+        manager = fake_manager()
+        lifecycle = VLLMLifecycle(manager, clock=FakeClock())
+        
+        async def slow_start(model_name=None):
+            lifecycle.clock.now += 42.0
+            manager.process = MagicMock()
+            return True
+        
+        manager.start_vllm_service.side_effect = slow_start
+        await lifecycle.start()
+        
+        assert lifecycle.snapshot()["cold_starts"] == {
+            "count": 1, "last_seconds": 42.0, "mean_seconds": 42.0, "max_seconds": 42.0
+        }
+    
+    @pytest.mark.asyncio
+    async def test_start_of_running_server_is_not_a_cold_start(self):
+        manager = fake_manager()
+        lifecycle = await running_lifecycle(manager)
+        await lifecycle.start()
+        
+        assert lifecycle.state == "running"
+        assert lifecycle.snapshot()["cold_starts"]["count"] == 1
+        
+        async def respawn(model_name=None):
+            manager.process = MagicMock()
+            return True
+        
+        manager.restart_vllm_service = AsyncMock(side_effect=respawn)
+        await lifecycle.restart()
+        assert lifecycle.snapshot()["cold_starts"]["count"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_restart_abandons_hung_wake(self):
+        """A restart does not wait for a start that holds the transition lock"""
+        manager = VLLMManager()
+        lifecycle = VLLMLifecycle(manager, clock=FakeClock())
+        calls = []
+        
+        async def start(model_name):
+            calls.append(model_name)
+            if len(calls) == 1:
+                await asyncio.Event().wait()
+            return True
+        
+        with patch.object(manager, '_start_vllm_service', AsyncMock(side_effect=start)), \
+             patch('vllm_manager.asyncio.sleep', AsyncMock()):
+            lifecycle.state = "stopped"
+            wake = lifecycle.wake_in_background()
+            await asyncio.wait([wake], timeout=0.01)
+            assert await asyncio.wait_for(lifecycle.restart(), timeout=1) is True
+        
+        assert await wake is False
+        assert len(calls) == 2
+    
+    @pytest.mark.asyncio
+    async def test_preflight_without_auto_start_reports_unavailable(self):
+        manager = fake_manager()
+        manager._is_vllm_running.return_value = False
+        lifecycle = VLLMLifecycle(manager)
+        
+        with patch('config.settings.vllm_auto_start', False):
+            assert await lifecycle.preflight() is False
+        manager.start_vllm_service.assert_not_awaited()
+
+
+def test_metrics_report_lifecycle():
+    with patch('vllm_manager.vllm_manager.get_prefix_cache_metrics',
+               AsyncMock(return_value={"available": False})):
+        response = TestClient(app).get("/vllm/metrics")
+    
+    assert response.status_code == 200
+    assert response.json()["lifecycle"]["idle_action"] == "none"
@@ -0,0 +1,110 @@
+"""
+Tests for extracting PDFs page by page the way MarkItDown's PDF converter does
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import pytest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from services import PAGE_SEPARATOR, DocumentProcessingService, PDFConverterService
+from tests.conftest import pages_of
+
+
+TABLE_MARKDOWN = "| Part | Qty |\n| --- | --- |\n| Pump | 2 |"
+
+
+def fake_pdfplumber(page_count: int) -> SimpleNamespace:
+    pages = [MagicMock(page_number=number + 1) for number in range(page_count)]
+    pdf = MagicMock(pages=pages)
+    pdf.__enter__.return_value = pdf
+    return SimpleNamespace(open=MagicMock(return_value=pdf))
+
+
+class TestMarkItDownPages:
+    """Test per-page extraction with MarkItDown's table handling"""
+    
+    def test_table_pages_use_markitdown_tables(self):
+        service = PDFConverterService()
+        form_content = MagicMock(side_effect=[None, TABLE_MARKDOWN])
+        
+        with patch.dict(sys.modules, {"pdfplumber": fake_pdfplumber(2)}), \
+             patch('markitdown.converters._pdf_converter._extract_form_content_from_words', form_content), \
+             patch.object(service, '_extract_page_texts', return_value=iter(["Prose page\n", "Table page\n"])):
+            pages = list(service._extract_markitdown_pages("doc.pdf"))
+        
+        assert pages == ["Prose page\n", TABLE_MARKDOWN]
+    
+    def test_failed_table_extraction_keeps_page_text(self):
+        service = PDFConverterService()
+        
+        with patch.dict(sys.modules, {"pdfplumber": fake_pdfplumber(1)}), \
+             patch('markitdown.converters._pdf_converter._extract_form_content_from_words',
+                   MagicMock(side_effect=ValueError("bad layout"))), \
+             patch.object(service, '_extract_page_texts', return_value=iter(["Page text\n"])):
+            assert list(service._extract_markitdown_pages("doc.pdf")) == ["Page text\n"]
+    
+    def test_without_pdfplumber_pages_are_pdfminer_text(self):
+        with patch.dict(sys.modules, {"pdfplumber": None}):
+            assert PDFConverterService().conversion_method() == "pdfminer"
+
+
+class TestConsistentConversion:
+    """Test that every endpoint gets the same Markdown for a PDF"""
+    
+    @pytest.mark.asyncio
+    async def test_whole_document_conversion_joins_pages(self):
+        with patch('services.PDFConverterService.iter_pdf_pages', pages_of("Page one", TABLE_MARKDOWN)), \
+             patch('services.PDFConverterService.conversion_method', return_value="MarkItDown"):
+            markdown = await PDFConverterService().convert_pdf_to_markdown(b"pdf", "doc.pdf")
+        
+        assert markdown == PAGE_SEPARATOR.join(["Page one", TABLE_MARKDOWN])
+    
+    @pytest.mark.asyncio
+    async def test_metadata_reports_actual_method(self):
+        with patch('services.PDFConverterService.iter_pdf_pages', pages_of("Page one")), \
+             patch('services.PDFConverterService.conversion_method', return_value="pdfminer"):
+            result = await DocumentProcessingService().process_document(b"pdf", "doc.pdf", clean_with_llm=False)
+        
+        assert result["metadata"]["conversion_method"] == "pdfminer"
+
+
+class TestCancelledExtraction:
+    """Test cleaning up when the consumer goes away mid-extraction"""
+    
+    @pytest.mark.asyncio
+    async def test_cancel_mid_page_removes_temp_file(self):
+        service = PDFConverterService()
+        extracting = threading.Event()
+        release = threading.Event()
+        paths, extracted = [], []
+        
+        def slow_pages(file_path):
+            paths.append(file_path)
+            for number in range(1, 4):
+                if number == 2:
+                    extracting.set()
+                    release.wait(timeout=5)
+                extracted.append(number)
+                yield f"Page {number}\n"
+        
+        async def consume():
+            async for _ in service.iter_pdf_pages(b"%PDF-1.4", "doc.pdf"):
+                pass
+        
+        with patch.object(service, 'conversion_method', return_value="pdfminer"), \
+             patch.object(service, '_extract_page_texts', slow_pages):
+            task = asyncio.create_task(consume())
+            await asyncio.to_thread(extracting.wait, 5)
+            task.cancel()
+            await asyncio.sleep(0.05)
+            release.set()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        
+        assert not os.path.exists(paths[0])
+        assert extracted == [1, 2]
+
@@ -0,0 +1,227 @@
+"""
+Tests for the rule-based pre-cleaner that runs before LLM cleaning
+"""
+
+import pytest
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+
+from main import app
+from precleaner import (
+    HeaderFooterDetector, PreCleaner, is_page_number, join_hyphenated_words, join_wrapped_lines,
+    normalize_glyphs, preclean_markdown
+)
+from services import DocumentProcessingService
+from tests.conftest import pages_of
+
+
+BODIES = [
+    "Installation starts with unpacking the device.",
+    "Connect the power cable before switching it on.",
+    "Cleaning is done with a dry cloth only."
+]
+
+
+def make_page(number: int, body: str) -> str:
+    return f"ACME Corp Technical Manual\n{body}\nPage {number} of 3\n"
+
+
+class TestPreCleanerRules:
+    """Test the individual pre-cleaning rules"""
+    
+    def test_join_hyphenated_words(self):
+        """Words split across lines are rejoined, real hyphens are kept"""
+        text = "an extra-\nordinary result with a well-known\nmethod"
+        assert join_hyphenated_words(text) == "an extraordinary result with a well-known\nmethod"
+    
+    def test_join_wrapped_lines(self):
+        """Mid-sentence wraps are joined, Markdown structure is not"""
+        text = (
+            "# Heading\n"
+            "The first line wraps\n"
+            "into the second. A new sentence\n"
+            "continues here.\n"
+            "\n"
+            "- list item\n"
+            "- another item\n"
+            "```\n"
+            "code that\n"
+            "wraps\n"
+            "```"
+        )
+        assert join_wrapped_lines(text) == (
+            "# Heading\n"
+            "The first line wraps into the second. A new sentence continues here.\n"
+            "\n"
+            "- list item\n"
+            "- another item\n"
+            "```\n"
+            "code that\n"
+            "wraps\n"
+            "```"
+        )
+    
+    def test_normalize_glyphs(self):
+        """Ligatures become letters and bullet glyphs become list markers"""
+        assert normalize_glyphs("The ﬁrst ﬂoor ofﬁce") == "The first floor office"
+        assert normalize_glyphs("• one\n  ▪ two\n·three") == "- one\n  - two\n- three"
+    
+    @pytest.mark.parametrize("line, expected", [
+        ("12", True),
+        ("- 12 -", True),
+        ("Page 3 of 10", True),
+        ("3/10", True),
+        ("xiv", True),
+        ("XIV", True),
+        ("Xiv", False),
+        ("Civil", False),
+        ("Mid", False),
+        ("vivid", False),
+        ("Chapter 3", False),
+        ("12 apples", False),
+        ("", False),
+    ])
+    def test_is_page_number(self, line, expected):
+        assert is_page_number(line) is expected
+    
+    def test_repeated_headers_and_page_numbers_removed(self):
+        """Running headers and page number footers are removed from every page"""
+        cleaner = PreCleaner()
+        pages = [make_page(n, body) for n, body in enumerate(BODIES, start=1)]
+        for page in pages:
+            cleaner.add_page(page)
+        
+        assert [cleaner.clean_page(page) for page in pages] == [body + "\n" for body in BODIES]
+        assert cleaner.headers_footers.lines_removed == 6
+        assert cleaner.headers_footers.tokens_saved > 0
+    
+    def test_header_with_changing_numbers_matches(self):
+        """Headers that embed the page number still hash to the same key"""
+        detector = HeaderFooterDetector(min_pages=2)
+        for n in (4, 5):
+            detector.observe(f"Chapter 2 - Setup - {n}\n{BODIES[n - 4]}\nConfidential")
+        
+        assert detector.is_repeated("header", "Chapter 2 - Setup - 17")
+        assert detector.is_repeated("footer", "confidential ")
+        assert not detector.is_repeated("header", "Chapter 3 - Usage - 17")
+        assert detector.strip(["Chapter 2 - Setup - 6", BODIES[2], "Confidential"]) == [BODIES[2]]
+    
+    def test_bare_numbers_in_sequence_removed(self):
+        """Bare page numbers are removed when they continue a neighbouring page's numbering"""
+        detector = HeaderFooterDetector(min_pages=5)
+        pages = [f"{BODIES[0]}\nv", f"{BODIES[1]}\nvi", f"{BODIES[2]}\n12"]
+        for page in pages:
+            detector.observe(page)
+        
+        assert detector.strip(pages[0].split("\n"), 0) == [BODIES[0]]
+        assert detector.strip(pages[1].split("\n"), 1) == [BODIES[1]]
+        assert detector.strip(pages[2].split("\n"), 2) == [BODIES[2], "12"]
+    
+    @pytest.mark.parametrize("line", ["I", "2024", "DC", "Civil", "Mid", "Did", "vivid"])
+    def test_words_and_lone_numbers_at_edges_kept(self, line):
+        """Edge lines that only look like page numbers survive"""
+        cleaner = PreCleaner()
+        pages = [f"Manual\n{body}\n- {n} -" for n, body in enumerate(BODIES, start=1)]
+        pages[0] = f"Manual\n{line}\n{BODIES[0]}\n- 1 -"
+        pages[1] = f"Manual\n{BODIES[1]}\n{line}"
+        for page in pages:
+            cleaner.add_page(page)
+        
+        cleaned = [cleaner.clean_page(page, index) for index, page in enumerate(pages)]
+        assert cleaned[0] == f"{line}\n{BODIES[0]}"
+        assert cleaned[1] == f"{BODIES[1]}\n{line}"
+    
+    def test_preclean_markdown_single_document(self):
+        assert preclean_markdown("Some wrap-\nped text\nthat con-\ntinues.\n\n- 7 -") == "Some wrapped text that continues.\n"
+        assert preclean_markdown("Founded in\n\n2024") == "Founded in\n\n2024"
+
+
+class TestPreCleaningPipeline:
+    """Test the pre-cleaner inside document processing"""
+    
+    fake_pages = staticmethod(pages_of(
+        *(make_page(n, body.replace("with", "wi-\nth")) for n, body in enumerate(BODIES, start=1))
+    ))
+    
+    @pytest.mark.asyncio
+    async def test_llm_receives_precleaned_pages(self):
+        """vLLM is sent pre-cleaned text and the removed characters are reported"""
+        service = DocumentProcessingService()
+        mock_clean = AsyncMock(side_effect=lambda c: c)
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', self.fake_pages), \
+             patch('config.settings.skip_clean_enabled', False), \
+             patch('services.VLLMService.clean_markdown_content', mock_clean):
+            events = [event async for event in service.stream_document(b"pdf", "test.pdf")]
+        
+        prompt = mock_clean.call_args[0][0]
+        assert "wi-" not in prompt
+        assert "Page 2 of 3" not in prompt
+        assert "ACME Corp Technical Manual" not in prompt
+        
+        raw_pages = [e["content"] for e in events if e["type"] == "raw_page"]
+        assert all("Page" in page for page in raw_pages)
+        stats = next(e for e in events if e["type"] == "stats")
+        assert stats["precleaned_chars_removed"] > 0
+        assert stats["header_footer_lines_removed"] == 6
+        assert stats["header_footer_tokens_saved"] > 0
+    
+    @pytest.mark.asyncio
+    async def test_first_chunks_wait_for_header_detection(self):
+        """Chunks are held until enough pages were seen to recognize the running header"""
+        service = DocumentProcessingService()
+        mock_clean = AsyncMock(side_effect=lambda c: c)
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', self.fake_pages), \
+             patch('config.settings.skip_clean_enabled', False), \
+             patch('config.settings.cleaning_chunk_size', 1), \
+             patch('services.VLLMService.clean_markdown_content', mock_clean):
+            events = [event async for event in service.stream_document(b"pdf", "test.pdf")]
+        
+        prompts = [call.args[0] for call in mock_clean.call_args_list]
+        assert len(prompts) == 3
+        assert not any("ACME Corp Technical Manual" in prompt for prompt in prompts)
+        assert [e["pages"] for e in events if e["type"] == "chunk_done"] == [[0, 0], [1, 1], [2, 2]]
+    
+    @patch('vllm_manager.vllm_manager._is_vllm_running')
+    def test_upload_reports_precleaning(self, mock_vllm_running):
+        """/upload metadata carries the pre-cleaner counters of the stats event"""
+        mock_vllm_running.return_value = True
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', self.fake_pages), \
+             patch('config.settings.skip_clean_enabled', False), \
+             patch('services.VLLMService.clean_markdown_content', AsyncMock(side_effect=lambda c: c)):
+            response = TestClient(app).post(
+                "/upload",
+                files={"file": ("test.pdf", b"%PDF-1.4", "application/pdf")}
+            )
+        
+        metadata = response.json()["metadata"]
+        assert metadata["precleaned_chars_removed"] > 0
+        assert metadata["header_footer_lines_removed"] == 6
+        assert metadata["header_footer_tokens_saved"] > 0
+        assert metadata["resplit_chunk_count"] == 0
+    
+    @patch('vllm_manager.vllm_manager._is_vllm_running')
+    def test_convert_text_with_preclean(self, mock_vllm_running):
+        """/convert-text can run the pre-cleaner on its own, without vLLM"""
+        client = TestClient(app)
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', self.fake_pages), \
+             patch('services.VLLMService.clean_markdown_content') as mock_clean:
+            plain = client.post(
+                "/convert-text",
+                files={"file": ("test.pdf", b"%PDF-1.4", "application/pdf")}
+            ).json()
+            precleaned = client.post(
+                "/convert-text?preclean=true",
+                files={"file": ("test.pdf", b"%PDF-1.4", "application/pdf")}
+            ).json()
+        
+        mock_clean.assert_not_called()
+        mock_vllm_running.assert_not_called()
+        assert plain["cleaned_markdown"] == plain["raw_markdown"]
+        assert precleaned["raw_markdown"] == plain["raw_markdown"]
+        assert BODIES[1] in precleaned["cleaned_markdown"]
+        assert "Page 3 of 3" not in precleaned["cleaned_markdown"]
+        assert precleaned["cleaned_with_llm"] is False
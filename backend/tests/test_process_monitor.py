@@ -0,0 +1,102 @@
+"""
+Tests for sampling the vLLM process's resource usage in the background
+"""
+
+import os
+import subprocess
+import sys
+import time
+import psutil
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from main import app
+from process_monitor import ProcessSampler
+from vllm_manager import VLLMManager
+
+
+@pytest.fixture
+def child_process():
+    """A process that spawns a child of its own, like vLLM's engine"""
+    process = subprocess.Popen([
+        sys.executable, "-c",
+        "import subprocess, sys, time; "
+        "subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)']); time.sleep(30)"
+    ])
+    parent = psutil.Process(process.pid)
+    deadline = time.time() + 5
+    while not parent.children() and time.time() < deadline:
+        time.sleep(0.05)
+    yield process
+    for child in parent.children(recursive=True):
+        child.kill()
+    process.kill()
+    process.wait()
+
+
+class TestProcessSampler:
+    """Test recording samples into the ring buffer"""
+    
+    def test_samples_whole_process_tree(self, child_process):
+        sampler = ProcessSampler(lambda: child_process.pid)
+        parent = psutil.Process(child_process.pid)
+        
+        sample = sampler.sample()
+        
+        assert sample.pid == child_process.pid
+        assert sample.rss_mb > parent.memory_info().rss / 1024 / 1024
+        assert sample.threads >= 2
+        assert sample.open_fds is None or sample.open_fds > 0
+        assert sampler.latest() == sample
+    
+    def test_no_process_no_sample(self):
+        sampler = ProcessSampler(lambda: None)
+        assert sampler.sample() is None
+        assert sampler.latest() is None
+    
+    def test_ring_buffer_keeps_newest(self):
+        sampler = ProcessSampler(lambda: os.getpid(), max_samples=3)
+        for _ in range(5):
+            sampler.sample()
+        
+        series = sampler.series()
+        assert len(series) == 3
+        assert series[0]["timestamp"] <= series[-1]["timestamp"]
+    
+    def test_series_limited_to_recent_seconds(self):
+        sampler = ProcessSampler(lambda: os.getpid())
+        with patch('process_monitor.time.time', return_value=1000.0):
+            sampler.sample()
+        sampler.sample()
+        
+        assert len(sampler.series()) == 2
+        assert len(sampler.series(seconds=60)) == 1
+
+
+class TestCachedStatus:
+    """Test serving status from the latest sample"""
+    
+    def test_status_reads_latest_sample(self):
+        manager = VLLMManager()
+        manager.process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+        try:
+            assert "memory_usage_mb" not in manager.get_vllm_status()
+            
+            sample = manager.sampler.sample()
+            status = manager.get_vllm_status()
+            assert status["memory_usage_mb"] == sample.rss_mb
+            assert status["sampled_at"] == sample.timestamp
+        finally:
+            manager.process.kill()
+            manager.process.wait()
+    
+    def test_history_endpoint(self):
+        sample = {"timestamp": time.time(), "pid": 1, "status": "running", "rss_mb": 10.0,
+                  "cpu_percent": 0.0, "gpu_memory_mb": None, "open_fds": 8, "threads": 2}
+        with patch('vllm_manager.vllm_manager.sampler.series', return_value=[sample]) as mock_series:
+            response = TestClient(app).get("/vllm/status/history", params={"seconds": 60})
+        
+        assert response.status_code == 200
+        assert response.json()["samples"] == [sample]
+        mock_series.assert_called_once_with(60.0)
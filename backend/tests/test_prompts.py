@@ -0,0 +1,100 @@
+"""
+Tests for the shared cleaning prompt prefix and prefix cache metrics
+"""
+
+import httpx
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+from fastapi.testclient import TestClient
+
+from main import app
+from prompts import CLEANING_PREFIX, PROMPT_TEMPLATES, get_prompt, prompt_fingerprint
+from services import VLLMService
+from vllm_manager import VLLMManager, parse_prometheus_metrics
+
+
+V1_METRICS = """# HELP vllm:prefix_cache_queries_total Prefix cache queries, in terms of number of queried tokens.
+# TYPE vllm:prefix_cache_queries_total counter
+vllm:prefix_cache_queries_total{engine="0",model_name="Qwen/Qwen3-8B"} 1000.0
+vllm:prefix_cache_queries_total{engine="1",model_name="Qwen/Qwen3-8B"} 600.0
+vllm:prefix_cache_hits_total{engine="0",model_name="Qwen/Qwen3-8B"} 900.0
+vllm:prefix_cache_hits_total{engine="1",model_name="Qwen/Qwen3-8B"} 300.0
+"""
+
+
+def metrics_response(text: str) -> httpx.Response:
+    return httpx.Response(200, text=text, request=httpx.Request("GET", "http://vllm/metrics"))
+
+
+class TestPromptPrefix:
+    """Test that every cleaning request starts with the same prefix"""
+    
+    @pytest.mark.asyncio
+    async def test_all_cleaning_paths_share_prefix(self):
+        """Non-streaming, streaming and edit requests send an identical system message"""
+        service = VLLMService()
+        completion = Mock(choices=[Mock(message=Mock(content="NONE"), finish_reason="stop")])
+        create = AsyncMock(return_value=completion)
+        
+        with patch.object(service.async_client.chat.completions, 'create', create):
+            await service.clean_markdown_content("some text")
+            await service.clean_markdown_content_edits("other text")
+        stream_messages, _ = service._prepare_stream_request("third text")
+        
+        sent = [call.kwargs["messages"] for call in create.call_args_list] + [stream_messages]
+        assert all(messages[0] == {"role": "system", "content": CLEANING_PREFIX} for messages in sent)
+        assert all(messages[1]["role"] == "user" for messages in sent)
+    
+    def test_templates_never_format_the_prefix(self):
+        for template in PROMPT_TEMPLATES.values():
+            messages = template.build_messages("{content} with braces")
+            assert messages[0]["content"] == CLEANING_PREFIX
+            assert messages[1]["content"].endswith("{content} with braces")
+    
+    def test_unknown_template(self):
+        with pytest.raises(Exception, match="Unknown prompt template"):
+            get_prompt("missing")
+    
+    def test_fingerprint_is_stable(self):
+        assert prompt_fingerprint() == prompt_fingerprint()
+        assert prompt_fingerprint().startswith("clean-v")
+
+
+class TestPrefixCaching:
+    """Test launching vLLM with prefix caching and scraping its hit rate"""
+    
+    def test_command_enables_prefix_caching(self):
+        manager = VLLMManager()
+        with patch.object(manager, '_has_gpu', return_value=False):
+            assert "--enable-prefix-caching" in manager._build_vllm_command("model")
+            with patch('config.settings.vllm_enable_prefix_caching', False):
+                assert "--enable-prefix-caching" not in manager._build_vllm_command("model")
+    
+    def test_parse_prometheus_metrics_sums_labels(self):
+        metrics = parse_prometheus_metrics(V1_METRICS)
+        assert metrics["vllm:prefix_cache_queries_total"] == 1600.0
+        assert metrics["vllm:prefix_cache_hits_total"] == 1200.0
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("text, expected", [
+        (V1_METRICS, {"available": True, "queries": 1600, "hits": 1200, "hit_rate": 0.75}),
+        ("vllm:gpu_prefix_cache_hit_rate 0.42\n", {"available": True, "hit_rate": 0.42}),
+    ])
+    async def test_prefix_cache_metrics(self, text, expected):
+        with patch('httpx.AsyncClient.get', AsyncMock(return_value=metrics_response(text))):
+            assert await VLLMManager().get_prefix_cache_metrics() == expected
+    
+    @pytest.mark.asyncio
+    async def test_prefix_cache_metrics_unavailable(self):
+        with patch('httpx.AsyncClient.get', AsyncMock(side_effect=httpx.ConnectError("refused"))):
+            result = await VLLMManager().get_prefix_cache_metrics()
+        assert result["available"] is False
+    
+    def test_metrics_endpoint(self):
+        with patch('httpx.AsyncClient.get', AsyncMock(return_value=metrics_response(V1_METRICS))):
+            data = TestClient(app).get("/vllm/metrics").json()
+        
+        assert data["prompt_version"] == prompt_fingerprint()
+        assert data["prefix_caching_enabled"] is True
+        assert data["prefix_cache"]["hit_rate"] == 0.75
+        assert set(data["truncation"]) == {"truncated_responses", "continuations", "retries", "unrecovered"}
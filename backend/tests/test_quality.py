@@ -0,0 +1,112 @@
+"""
+Tests for the extraction quality scorer that decides which chunks need LLM cleaning
+"""
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from quality import needs_cleaning, score_markdown_quality
+from services import DocumentProcessingService
+from tests.conftest import pages_of
+
+
+CLEAN_MARKDOWN = """# Introduction
+
+This document was exported from a word processor. Every paragraph is on one line.
+
+| Name | Value |
+|------|-------|
+| a    | 1     |
+| b    | 2     |
+
+- First item
+- Second item
+"""
+
+WRAPPED_TEXT = """The quick brown fox jumps over the
+lazy dog while the extraction tool
+breaks every line at the page mar-
+gin instead of at the end of a
+sentence, which the model has to fix.
+"""
+
+
+class TestQualityScorer:
+    """Test the individual quality signals"""
+    
+    def test_clean_markdown_scores_low(self):
+        """Well-formed Markdown does not need cleaning"""
+        should_clean, scores = needs_cleaning(CLEAN_MARKDOWN)
+        assert should_clean is False
+        assert scores["score"] < 1.0
+    
+    def test_wrapped_text_needs_cleaning(self):
+        """Hard line wraps and broken hyphenation are detected"""
+        should_clean, scores = needs_cleaning(WRAPPED_TEXT)
+        assert should_clean is True
+        assert scores["hyphenation"] > 0
+        assert scores["line_wraps"] > 0.5
+    
+    @pytest.mark.parametrize("artifact, signal", [
+        ("The ﬁrst ﬂoor", "ligatures"),
+        ("Text (cid:12)(cid:34) here", "ligatures"),
+        ("Broken �� characters\x07", "garbage"),
+        ("Name     Value     Unit\nfoo     1     kg\n", "table_misalignment"),
+        ("| a | b |\n|---|---|\n| 1 | 2 | 3 |\n", "table_misalignment"),
+    ])
+    def test_artifacts_detected(self, artifact, signal):
+        """Each artifact type raises its own signal"""
+        scores = score_markdown_quality(artifact)
+        assert scores[signal] > 0
+        assert scores["score"] >= 1.0
+    
+    def test_empty_text(self):
+        """Empty input scores zero instead of dividing by zero"""
+        assert score_markdown_quality("")["score"] == 0
+
+
+class TestSkipCleaning:
+    """Test routing clean chunks around vLLM"""
+    
+    fake_pages = staticmethod(pages_of(CLEAN_MARKDOWN, WRAPPED_TEXT))
+    
+    @pytest.mark.asyncio
+    async def test_only_dirty_chunks_reach_vllm(self):
+        """Clean chunks are passed through and the skip ratio is reported"""
+        service = DocumentProcessingService()
+        mock_clean = AsyncMock(side_effect=lambda c: "CLEANED")
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', self.fake_pages), \
+             patch('config.settings.cleaning_chunk_size', 1), \
+             patch('config.settings.preclean_enabled', False), \
+             patch('config.settings.drift_guard_enabled', False), \
+             patch('services.VLLMService.clean_markdown_content', mock_clean):
+            events = [event async for event in service.stream_document(b"pdf", "test.pdf")]
+        
+        mock_clean.assert_called_once_with(WRAPPED_TEXT)
+        chunks = {e["chunk"]: e for e in events if e["type"] == "chunk_done"}
+        assert chunks[0]["skipped"] is True
+        assert chunks[0]["content"] == CLEAN_MARKDOWN
+        assert chunks[0]["quality"]["score"] < 1.0
+        assert chunks[1]["content"] == "CLEANED"
+        assert "skipped" not in chunks[1]
+        
+        stats = next(e for e in events if e["type"] == "stats")
+        assert stats["skipped_chunk_count"] == 1
+        assert stats["skip_ratio"] == 0.5
+    
+    @pytest.mark.asyncio
+    async def test_skip_disabled(self):
+        """With skipping disabled every chunk is cleaned"""
+        service = DocumentProcessingService()
+        mock_clean = AsyncMock(side_effect=lambda c: c)
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', self.fake_pages), \
+             patch('config.settings.cleaning_chunk_size', 1), \
+             patch('config.settings.skip_clean_enabled', False), \
+             patch('services.VLLMService.clean_markdown_content', mock_clean):
+            result = await service.process_document(b"pdf", "test.pdf")
+        
+        assert mock_clean.call_count == 2
+        assert result["metadata"]["skipped_chunk_count"] == 0
+        assert result["metadata"]["skip_ratio"] == 0.0
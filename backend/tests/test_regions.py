@@ -0,0 +1,150 @@
+"""
+Tests for table and equation region detection and repair
+"""
+
+import json
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from regions import (
+    EQUATION_PATTERN, TABLE_SCHEMA, Region, detect_regions, is_equation_line, is_table_line,
+    render_markdown_table, splice_regions
+)
+from services import DocumentProcessingService, VLLMService
+from tests.conftest import completion, pages_of
+
+
+CHUNK = """Results of the experiment are listed below.
+Model      Params    Accuracy
+Small      10M       81.2
+Large      300M      90.4
+The energy of the system follows
+E = mc^2 + ½ m v^2
+which is used throughout the paper."""
+
+TABLE_JSON = {"header": ["Model", "Params", "Accuracy"], "rows": [["Small", "10M", "81.2"], ["Large", "300M", "90.4"]]}
+
+
+class TestRegionDetection:
+    """Test finding table-like and formula-like regions"""
+    
+    def test_detect_table_and_equation(self):
+        assert detect_regions(CHUNK) == [Region("table", 1, 3), Region("equation", 5, 5)]
+    
+    def test_prose_and_markdown_are_not_regions(self):
+        text = (
+            "| Already | a table |\n|---|---|\n| 1 | 2 |\n"
+            "Where x = the number of pages in the document.\n"
+            "```\na    b    c\nd    e    f\n```"
+        )
+        assert detect_regions(text) == []
+    
+    def test_single_aligned_line_is_not_a_table(self):
+        assert detect_regions("Name    Value    Unit\nplain text") == []
+    
+    def test_prose_with_a_relation_is_not_an_equation(self):
+        assert not is_equation_line("Total = 5 items")
+        assert not is_equation_line("The cost = 5 dollars per item")
+        assert is_equation_line("a^2 + b^2 = c^2")
+        assert is_equation_line("f(x) = sin x + 1")
+    
+    def test_double_spaced_prose_is_not_a_table(self):
+        prose = (
+            "The results were good.  We then moved on.  Finally it ended.\n"
+            "Each run took an hour.  Nothing failed.  The logs are attached."
+        )
+        assert not is_table_line(prose.split("\n")[0])
+        assert detect_regions(prose) == []
+    
+    def test_rows_with_different_column_counts_are_not_a_table(self):
+        assert detect_regions("Name    Value    Unit\nsee  the  other  four\nplain text") == []
+    
+    def test_render_markdown_table(self):
+        table = {"header": ["a", "b"], "rows": [["1", "x|y", "extra"], ["2"]]}
+        assert render_markdown_table(table) == "| a | b |\n| --- | --- |\n| 1 | x\\|y |\n| 2 |  |"
+    
+    def test_splice_regions(self):
+        spliced = splice_regions("a\nb\nc\nd", [(Region("table", 1, 2), "X\nY\nZ"), (Region("equation", 3, 3), "Q")])
+        assert spliced == "a\nX\nY\nZ\nQ"
+
+
+class TestStructuredRepair:
+    """Test guided-decoding repairs and splicing them into chunks"""
+    
+    @pytest.mark.asyncio
+    async def test_repair_table_uses_guided_json(self):
+        service = VLLMService()
+        create = AsyncMock(return_value=completion(json.dumps(TABLE_JSON)))
+        
+        with patch.object(service.async_client.chat.completions, 'create', create):
+            result = await service.repair_table("Model      Params    Accuracy")
+        
+        assert result.startswith("| Model | Params | Accuracy |\n| --- | --- | --- |")
+        assert create.call_args.kwargs["extra_body"] == {"guided_json": TABLE_SCHEMA}
+    
+    @pytest.mark.asyncio
+    async def test_repair_equation_validates_output(self):
+        service = VLLMService()
+        create = AsyncMock(return_value=completion("The formula is E = mc^2"))
+        
+        with patch.object(service.async_client.chat.completions, 'create', create):
+            with pytest.raises(Exception, match="does not match"):
+                await service.repair_equation("E = mc^2")
+        
+        assert create.call_args.kwargs["extra_body"] == {"guided_regex": EQUATION_PATTERN}
+    
+    @pytest.mark.asyncio
+    async def test_regions_spliced_before_cleaning(self):
+        """Repaired regions replace the extracted lines and a failed repair keeps them"""
+        service = DocumentProcessingService()
+        
+        mock_clean = AsyncMock(side_effect=lambda c: c)
+        with patch('services.PDFConverterService.iter_pdf_pages', pages_of(CHUNK)), \
+             patch('config.settings.preclean_enabled', False), \
+             patch('config.settings.skip_clean_enabled', False), \
+             patch('services.VLLMService.repair_table', AsyncMock(return_value=render_markdown_table(TABLE_JSON))), \
+             patch('services.VLLMService.repair_equation', AsyncMock(side_effect=Exception("no match"))), \
+             patch('services.VLLMService.clean_markdown_content', mock_clean):
+            events = [e async for e in service.stream_document(b"pdf", "test.pdf")]
+        
+        prompt = mock_clean.call_args[0][0]
+        assert "| Large | 300M | 90.4 |" in prompt
+        assert "Large      300M" not in prompt
+        assert "E = mc^2 + ½ m v^2" in prompt
+        
+        chunk = next(e for e in events if e["type"] == "chunk_done")
+        assert chunk["regions_repaired"] == 1
+        assert chunk["cleaned_with_llm"] is True
+    
+    @pytest.mark.asyncio
+    async def test_invented_repair_falls_back_to_extracted_text(self):
+        """A repair that drifts from the extracted lines is dropped, even when the chunk then skips cleaning"""
+        service = DocumentProcessingService()
+        invented = {"header": ["Dataset", "Samples", "Recall", "Notes"], "rows": [["Imagined", "5k", "12.0", "no such row exists"]] * 4}
+        
+        mock_clean = AsyncMock(side_effect=lambda c: c)
+        with patch('services.PDFConverterService.iter_pdf_pages', pages_of(CHUNK)), \
+             patch('config.settings.preclean_enabled', False), \
+             patch('services.needs_cleaning', return_value=(False, {"score": 0.0})), \
+             patch('services.VLLMService.repair_table', AsyncMock(return_value=render_markdown_table(invented))), \
+             patch('services.VLLMService.repair_equation', AsyncMock(side_effect=Exception("no match"))), \
+             patch('services.VLLMService.clean_markdown_content', mock_clean):
+            events = [e async for e in service.stream_document(b"pdf", "test.pdf")]
+        
+        chunk = next(e for e in events if e["type"] == "chunk_done")
+        assert chunk["content"] == CHUNK
+        assert "regions_repaired" not in chunk
+        assert chunk["cleaned_with_llm"] is False
+        mock_clean.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_repair_disabled(self):
+        service = DocumentProcessingService()
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', pages_of(CHUNK)), \
+             patch('config.settings.structured_repair_enabled', False), \
+             patch('services.VLLMService.repair_table') as repair_table, \
+             patch('services.VLLMService.clean_markdown_content', AsyncMock(side_effect=lambda c: c)):
+            [e async for e in service.stream_document(b"pdf", "test.pdf")]
+        
+        repair_table.assert_not_called()
@@ -0,0 +1,238 @@
+"""
+Tests for retries, backoff and the circuit breaker around vLLM calls
+"""
+
+import httpx
+import openai
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+from fastapi.testclient import TestClient
+
+from main import app
+from resilience import CircuitBreaker, CircuitOpenError, backoff_delay, call_with_retry, is_retryable
+from services import DocumentProcessingService, VLLMService, document_service
+from tests.conftest import FakeClock, pages_of
+
+
+REQUEST = httpx.Request("POST", "http://vllm/v1/chat/completions")
+
+
+def connection_error() -> openai.APIConnectionError:
+    return openai.APIConnectionError(request=REQUEST)
+
+
+def status_error(status_code: int) -> openai.APIStatusError:
+    return openai.APIStatusError("error", response=httpx.Response(status_code, request=REQUEST), body=None)
+
+
+@pytest.fixture
+def no_backoff():
+    with patch('resilience.asyncio.sleep', AsyncMock()) as sleep:
+        yield sleep
+
+
+class TestCircuitBreaker:
+    """Test opening, failing fast and recovering"""
+    
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=FakeClock())
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.before_call()
+        
+        breaker.record_failure()
+        with pytest.raises(CircuitOpenError) as excinfo:
+            breaker.before_call()
+        assert excinfo.value.retry_after == 30
+    
+    def test_half_open_lets_one_trial_through(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+        breaker.trip()
+        
+        clock.now = 30
+        breaker.before_call()
+        assert breaker.state == "half_open"
+        with pytest.raises(CircuitOpenError) as excinfo:
+            breaker.before_call()
+        assert excinfo.value.retry_after == CircuitBreaker.HALF_OPEN_RETRY_AFTER
+        
+        breaker.record_success()
+        assert breaker.state == "closed"
+        breaker.before_call()
+    
+    def test_failed_trial_reopens(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30, clock=clock)
+        breaker.trip()
+        clock.now = 31
+        breaker.before_call()
+        breaker.record_failure()
+        
+        assert breaker.state == "open"
+        assert breaker.retry_after() == 30
+        assert breaker.snapshot()["times_opened"] == 2
+
+
+class TestRetry:
+    """Test retrying transient failures with backoff"""
+    
+    @pytest.mark.parametrize("error, retryable", [
+        (connection_error(), True),
+        (status_error(503), True),
+        (status_error(429), True),
+        (status_error(400), False),
+        (ValueError("bad output"), False),
+    ])
+    def test_is_retryable(self, error, retryable):
+        assert is_retryable(error) is retryable
+    
+    def test_backoff_is_jittered_and_capped(self):
+        delays = [backoff_delay(10, 0.5, 8.0) for _ in range(50)]
+        assert all(0 <= delay <= 8.0 for delay in delays)
+        assert len(set(delays)) > 1
+    
+    @pytest.mark.asyncio
+    async def test_transient_errors_retried(self, no_backoff):
+        call = AsyncMock(side_effect=[connection_error(), status_error(502), "ok"])
+        breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+        
+        assert await call_with_retry(call, breaker, 3, 0.5, 8.0) == "ok"
+        assert call.await_count == 3
+        assert no_backoff.await_count == 2
+        assert breaker.consecutive_failures == 0
+    
+    @pytest.mark.asyncio
+    async def test_client_errors_not_retried(self, no_backoff):
+        call = AsyncMock(side_effect=status_error(400))
+        
+        with pytest.raises(openai.APIStatusError):
+            await call_with_retry(call, None, 3, 0.5, 8.0)
+        assert call.await_count == 1
+    
+    @pytest.mark.asyncio
+    async def test_open_circuit_stops_retries(self, no_backoff):
+        """Retries stop as soon as the breaker opens instead of waiting out every attempt"""
+        call = AsyncMock(side_effect=connection_error())
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        
+        with pytest.raises(CircuitOpenError):
+            await call_with_retry(call, breaker, 5, 0.5, 8.0)
+        assert call.await_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_service_requests_use_retry_policy(self, no_backoff):
+        service = VLLMService()
+        completion = Mock(choices=[Mock(message=Mock(content="cleaned"), finish_reason="stop")])
+        create = AsyncMock(side_effect=[connection_error(), completion])
+        
+        with patch.object(service.async_client.chat.completions, 'create', create):
+            assert await service.clean_markdown_content("raw") == "cleaned"
+        assert create.await_count == 2
+
+
+    def test_sync_stream_closes_half_open_circuit(self):
+        """A successful plain-text stream is the trial call that closes the circuit"""
+        clock = FakeClock()
+        service = VLLMService()
+        service.circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+        service.circuit_breaker.trip()
+        clock.now = 30
+        stream = iter([
+            Mock(choices=[Mock(delta=Mock(content="cleaned"), finish_reason=None)]),
+            Mock(choices=[Mock(delta=Mock(content=None), finish_reason="stop")])
+        ])
+        
+        with patch.object(service.client.chat.completions, 'create', Mock(return_value=stream)):
+            assert list(service.clean_markdown_content_stream("raw")) == ["cleaned"]
+        assert service.circuit_breaker.state == "closed"
+    
+    def test_sync_stream_failures_open_circuit(self):
+        service = VLLMService()
+        service.circuit_breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=FakeClock())
+        
+        def broken_stream():
+            yield Mock(choices=[Mock(delta=Mock(content="clea"), finish_reason=None)])
+            raise connection_error()
+        
+        with patch.object(service.client.chat.completions, 'create', Mock(side_effect=lambda **kwargs: broken_stream())):
+            for _ in range(2):
+                with pytest.raises(openai.APIConnectionError):
+                    list(service.clean_markdown_content_stream("raw"))
+        
+        assert service.circuit_breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            list(service.clean_markdown_content_stream("raw"))
+
+
+class TestChunkRetry:
+    """Test retrying one chunk instead of the whole document"""
+    
+    fake_pages = staticmethod(pages_of("first page", "second page"))
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("error", [connection_error(), CircuitOpenError(0.01)])
+    async def test_failed_chunk_cleaned_again(self, error):
+        service = DocumentProcessingService()
+        failed = []
+        
+        async def clean(content):
+            if content == "first page" and not failed:
+                failed.append(content)
+                raise error
+            return content.upper()
+        
+        mock_clean = AsyncMock(side_effect=clean)
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', self.fake_pages), \
+             patch('config.settings.cleaning_chunk_size', 1), \
+             patch('config.settings.skip_clean_enabled', False), \
+             patch('config.settings.vllm_retry_base_delay', 0.01), \
+             patch('services.VLLMService.clean_markdown_content', mock_clean):
+            result = await service.process_document(b"pdf", "test.pdf")
+        
+        assert result["cleaned_markdown"] == "FIRST PAGE\nSECOND PAGE"
+        assert mock_clean.await_count == 3
+    
+    @pytest.mark.asyncio
+    async def test_chunk_falls_back_after_retries(self):
+        service = DocumentProcessingService()
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', self.fake_pages), \
+             patch('config.settings.cleaning_chunk_size', 1000), \
+             patch('config.settings.skip_clean_enabled', False), \
+             patch('config.settings.vllm_retry_base_delay', 0.01), \
+             patch('services.VLLMService.clean_markdown_content', AsyncMock(side_effect=connection_error())) as mock_clean:
+            events = [e async for e in service.stream_document(b"pdf", "test.pdf")]
+        
+        chunk = next(e for e in events if e["type"] == "chunk_done")
+        assert chunk["content"] == "first page\nsecond page"
+        assert chunk["retries"] == 1
+        assert chunk["cleaned_with_llm"] is False
+        assert mock_clean.await_count == 2
+
+
+class TestCircuitEndpoints:
+    """Test how an open circuit surfaces through the API"""
+    
+    def test_clean_markdown_returns_503_while_open(self):
+        with patch('vllm_manager.vllm_manager._is_vllm_running', AsyncMock(return_value=True)), \
+             patch.object(document_service.vllm_service, 'clean_markdown_content',
+                          AsyncMock(side_effect=CircuitOpenError(12.4))):
+            response = TestClient(app).post("/clean-markdown", json={"markdown_content": "# Test"})
+        
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "12"
+    
+    def test_stop_opens_circuit(self):
+        breaker = document_service.vllm_service.circuit_breaker
+        try:
+            with patch('vllm_manager.vllm_manager.stop_vllm_service', AsyncMock(return_value=True)):
+                TestClient(app).post("/vllm/stop")
+            assert breaker.state == "open"
+            assert TestClient(app).get("/vllm/metrics").json()["circuit_breaker"]["state"] == "open"
+        finally:
+            breaker.record_success()
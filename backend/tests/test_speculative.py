@@ -0,0 +1,61 @@
+"""
+Tests for speculative decoding options in the vLLM launch command
+"""
+
+import json
+import pytest
+from unittest.mock import patch
+
+from benchmark import split_into_chunks
+from vllm_manager import VLLMManager
+
+
+def speculative_config(command: list) -> dict:
+    return json.loads(command[command.index("--speculative-config") + 1])
+
+
+class TestSpeculativeDecoding:
+    """Test building --speculative-config from settings"""
+    
+    @pytest.fixture
+    def manager(self):
+        manager = VLLMManager()
+        with patch.object(manager, '_has_gpu', return_value=True):
+            yield manager
+    
+    def test_disabled_by_default(self, manager):
+        with patch('config.settings.vllm_speculative_method', ''):
+            assert "--speculative-config" not in manager._build_vllm_command("model")
+    
+    def test_ngram_prompt_lookup(self, manager):
+        with patch('config.settings.vllm_speculative_method', 'ngram'), \
+             patch('config.settings.vllm_num_speculative_tokens', 8):
+            config = speculative_config(manager._build_vllm_command("model"))
+        
+        assert config == {
+            "method": "ngram",
+            "num_speculative_tokens": 8,
+            "prompt_lookup_max": 4,
+            "prompt_lookup_min": 2
+        }
+    
+    def test_draft_model(self, manager):
+        with patch('config.settings.vllm_speculative_method', 'draft'), \
+             patch('config.settings.vllm_speculative_draft_model', 'Qwen/Qwen3-0.6B'):
+            config = speculative_config(manager._build_vllm_command("model"))
+        
+        assert config == {"model": "Qwen/Qwen3-0.6B", "num_speculative_tokens": 5}
+    
+    @pytest.mark.parametrize("method, draft_model, error", [
+        ("draft", "", "VLLM_SPECULATIVE_DRAFT_MODEL is required"),
+        ("medusa", "", "Unknown speculative decoding method"),
+    ])
+    def test_invalid_settings(self, manager, method, draft_model, error):
+        with patch('config.settings.vllm_speculative_method', method), \
+             patch('config.settings.vllm_speculative_draft_model', draft_model):
+            with pytest.raises(Exception, match=error):
+                manager._build_vllm_command("model")
+    
+    def test_benchmark_chunks_keep_paragraphs_whole(self):
+        text = "\n\n".join(["a" * 40, "b" * 40, "c" * 40])
+        assert split_into_chunks(text, 90) == ["a" * 40 + "\n\n" + "b" * 40, "c" * 40]
@@ -12,7 +12,12 @@ from fastapi.responses import StreamingResponse
 import httpx
 
 from main import app
-from services import VLLMService, DocumentProcessingService
+from services import VLLMService, DocumentProcessingService, ThinkingFilter
+from streaming import (
+    EventBuffer, StreamRegistry, TokenCoalescer, coalesce_text,
+    format_sse_event, stream_registry
+)
+from tests.conftest import pages_of
 
 
 class TestStreamingGenerators:
@@ -238,6 +243,24 @@ class TestStreamingEndpoints:
         assert "%" in x_filename  # Should be URL encoded
         assert chinese_filename not in x_filename  # Original should not be there
     
+    @patch('vllm_manager.vllm_manager._is_vllm_running')
+    @patch('services.VLLMService.clean_markdown_content_stream')
+    def test_clean_markdown_stream_flush_size(self, mock_stream, mock_vllm_running, client):
+        """Per-request flush settings control how tokens are batched into writes"""
+        mock_vllm_running.return_value = True
+        mock_stream.return_value = iter(["a", "b", "c", "d", "e"])
+        
+        with patch('main.coalesce_text', wraps=coalesce_text) as mock_coalesce:
+            response = client.post(
+                "/clean-markdown-stream?flush_size=2&flush_interval_ms=250",
+                json={"markdown_content": "Test content"}
+            )
+        
+        assert response.text == "abcde"
+        _, flush_interval, flush_size = mock_coalesce.call_args.args
+        assert flush_interval == 0.25
+        assert flush_size == 2
+    
     def test_clean_markdown_stream_empty_content(self, client):
         """Test streaming with empty content"""
         response = client.post(
@@ -259,6 +282,518 @@ class TestStreamingEndpoints:
         assert "PDF" in response.json()["detail"]
 
 
+def parse_sse(body):
+    """Parse an SSE body into (id, event, data) tuples, skipping comments"""
+    events = []
+    for block in body.split("\n\n"):
+        fields = {}
+        for line in block.split("\n"):
+            if line and not line.startswith(":"):
+                key, _, value = line.partition(": ")
+                fields[key] = value
+        if "event" in fields:
+            events.append((fields.get("id"), fields["event"], json.loads(fields["data"])))
+    return events
+
+
+class TestServerSentEvents:
+    """Test SSE framing, token coalescing and heartbeats"""
+    
+    @staticmethod
+    async def frames(events, flush_interval, heartbeat_interval):
+        """Produce events into a buffer and subscribe to it, as streams in the registry do"""
+        buffer = EventBuffer("test", max_events=1000)
+        producer = asyncio.create_task(buffer.produce(events, flush_interval))
+        async for frame in buffer.subscribe(heartbeat_interval=heartbeat_interval):
+            yield frame
+        await producer
+    
+    async def collect(self, events, **kwargs):
+        return "".join([frame async for frame in self.frames(events, **kwargs)])
+    
+    def test_format_sse_event(self):
+        """Events carry id, name and a single JSON data line"""
+        frame = format_sse_event("token", {"content": "a\nb", "text": "中文"}, 7)
+        assert frame == 'id: 7\nevent: token\ndata: {"content": "a\\nb", "text": "中文"}\n\n'
+    
+    @pytest.mark.asyncio
+    async def test_tokens_coalesced_within_flush_interval(self):
+        """Token deltas that arrive together are written as one frame per chunk"""
+        async def events():
+            for token in ["a", "b", "c"]:
+                yield {"type": "token", "chunk": 0, "content": token}
+            yield {"type": "token", "chunk": 1, "content": "x"}
+            yield {"type": "chunk_done", "chunk": 0, "content": "abc"}
+            yield {"type": "stats"}
+        
+        body = await self.collect(events(), flush_interval=10, heartbeat_interval=10)
+        parsed = parse_sse(body)
+        
+        assert [(name, data.get("content")) for _, name, data in parsed] == [
+            ("token", "abc"), ("token", "x"), ("chunk_done", "abc"), ("stats", None)
+        ]
+        assert parsed[-1][2]["token_deltas"] == 4
+        assert parsed[-1][2]["token_frames"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_tokens_flushed_after_interval(self):
+        """Buffered tokens are written once the flush interval elapses, even if the source is idle"""
+        async def events():
+            yield {"type": "token", "chunk": 0, "content": "early"}
+            await asyncio.sleep(0.2)
+            yield {"type": "done"}
+        
+        frames = []
+        async for frame in self.frames(events(), flush_interval=0.01, heartbeat_interval=10):
+            frames.append((time.monotonic(), frame))
+        
+        assert "early" in frames[0][1]
+        assert frames[1][0] - frames[0][0] > 0.1
+    
+    @pytest.mark.asyncio
+    async def test_heartbeat_when_idle(self):
+        """A heartbeat comment is sent while nothing else is being written"""
+        async def events():
+            yield {"type": "metadata"}
+            await asyncio.sleep(0.25)
+            yield {"type": "done"}
+        
+        body = await self.collect(events(), flush_interval=0.01, heartbeat_interval=0.1)
+        assert ": heartbeat\n\n" in body
+        assert [name for _, name, _ in parse_sse(body)] == ["metadata", "done"]
+    
+    def test_coalesce_text_by_size(self):
+        """Text batches are written as soon as they reach the flush size"""
+        batches = list(coalesce_text(["ab", "c", "de", "f", "g"], flush_interval=10, flush_size=3))
+        assert batches == ["abc", "def", "g"]
+    
+    def test_coalesce_text_by_time(self):
+        """A token that has waited past the flush interval is written with the next arrival"""
+        def slow_tokens():
+            yield "a"
+            time.sleep(0.05)
+            yield "b"
+            yield "c"
+        
+        batches = list(coalesce_text(slow_tokens(), flush_interval=0.02, flush_size=1000))
+        assert batches == ["ab", "c"]
+    
+    def test_token_coalescer_flush_size(self):
+        """Token events are due once enough characters are buffered"""
+        coalescer = TokenCoalescer(flush_interval=10, flush_size=4)
+        coalescer.add(0, "ab", now=0)
+        assert not coalescer.due(now=0)
+        coalescer.add(1, "cd", now=0)
+        assert coalescer.due(now=0)
+        assert coalescer.drain() == [
+            {"type": "token", "chunk": 0, "content": "ab"},
+            {"type": "token", "chunk": 1, "content": "cd"}
+        ]
+        assert not coalescer.due(now=100)
+    
+    def test_thinking_filter_split_tags(self):
+        """Thinking sections are removed even when tags span token deltas"""
+        thinking_filter = ThinkingFilter()
+        deltas = ["Hel", "lo <th", "ink>hidden", " text</thi", "nk> World <", "b>"]
+        output = "".join(thinking_filter.feed(delta) for delta in deltas) + thinking_filter.flush()
+        assert output == "Hello  World <b>"
+
+
+class TestResumableStreams:
+    """Test server-side event buffering and Last-Event-ID replay"""
+    
+    @pytest.fixture
+    def client(self):
+        return TestClient(app)
+    
+    @staticmethod
+    def finished_buffer(count):
+        buffer = EventBuffer("resumable-test", max_events=100)
+        for index in range(count):
+            buffer.append({"type": "raw_page", "page": index, "content": f"page {index}"})
+        buffer.finish()
+        return buffer
+    
+    @pytest.mark.asyncio
+    async def test_generation_continues_after_disconnect(self):
+        """A dropped client resumes from its last event while the producer keeps running"""
+        registry = StreamRegistry(max_streams=10, ttl_seconds=60, max_events=100)
+        
+        async def events():
+            yield {"type": "metadata"}
+            for page in range(3):
+                await asyncio.sleep(0.02)
+                yield {"type": "raw_page", "page": page, "content": f"page {page}"}
+            yield {"type": "done"}
+        
+        stream = registry.start(events(), flush_interval=0)
+        
+        # First connection drops after the metadata event
+        subscription = stream.subscribe(heartbeat_interval=10)
+        first = parse_sse(await subscription.__anext__())
+        await subscription.aclose()
+        assert [name for _, name, _ in first] == ["metadata"]
+        assert first[0][2]["stream_id"] == stream.stream_id
+        
+        await asyncio.wait_for(stream.task, timeout=1)
+        
+        resumed = registry.get(stream.stream_id)
+        frames = [frame async for frame in resumed.subscribe(int(first[-1][0]), heartbeat_interval=10)]
+        replayed = parse_sse("".join(frames))
+        assert [name for _, name, _ in replayed] == ["raw_page", "raw_page", "raw_page", "done"]
+        assert [int(event_id) for event_id, _, _ in replayed] == [2, 3, 4, 5]
+    
+    @pytest.mark.asyncio
+    async def test_replay_gap_reported(self):
+        """Clients older than the bounded buffer are told events were dropped"""
+        buffer = EventBuffer("gap-test", max_events=2)
+        for index in range(5):
+            buffer.append({"type": "raw_page", "page": index})
+        buffer.finish()
+        
+        replayed = parse_sse("".join([frame async for frame in buffer.subscribe(1)]))
+        assert replayed[0][1] == "error"
+        assert replayed[0][2]["first_available_id"] == 4
+        assert [event_id for event_id, _, _ in replayed[1:]] == ["4", "5"]
+    
+    def test_registry_prunes_expired_streams(self):
+        """Finished streams disappear after their TTL"""
+        registry = StreamRegistry(max_streams=10, ttl_seconds=60, max_events=100)
+        buffer = self.finished_buffer(1)
+        buffer.finished_at -= 120
+        registry._streams[buffer.stream_id] = buffer
+        
+        assert registry.get(buffer.stream_id) is None
+    
+    def test_resume_endpoint_replays_after_last_event_id(self, client):
+        """GET /upload-stream/{id} replays events after the Last-Event-ID header"""
+        buffer = self.finished_buffer(4)
+        
+        with patch.dict(stream_registry._streams, {buffer.stream_id: buffer}):
+            response = client.get(
+                f"/upload-stream/{buffer.stream_id}",
+                headers={"Last-Event-ID": "2"}
+            )
+        
+        assert response.status_code == 200
+        assert response.headers["x-stream-id"] == buffer.stream_id
+        assert [data["page"] for _, _, data in parse_sse(response.text)] == [2, 3]
+    
+    def test_resume_endpoint_unknown_stream(self, client):
+        """Unknown or expired streams return 404"""
+        response = client.get("/upload-stream/does-not-exist")
+        assert response.status_code == 404
+
+
+class TestIncrementalStreaming:
+    """Test page-by-page incremental document streaming"""
+
+    @pytest.fixture(autouse=True)
+    def always_clean(self):
+        """These tests exercise the vLLM path, so clean-looking chunks are not skipped"""
+        with patch('config.settings.skip_clean_enabled', False):
+            yield
+    
+    @pytest.fixture
+    def client(self):
+        return TestClient(app)
+    
+    fake_pages = staticmethod(pages_of("# Page one\n", "Page two text\n"))
+    
+    @staticmethod
+    async def fake_token_stream(self, content):
+        for token in ["Clean", "ed"]:
+            yield token
+    
+    @pytest.mark.asyncio
+    async def test_stream_document_event_order(self):
+        """Metadata comes first and every raw page precedes its cleaned replacement"""
+        service = DocumentProcessingService()
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', self.fake_pages), \
+             patch('config.settings.cleaning_chunk_size', 1), \
+             patch('services.VLLMService.clean_markdown_content', AsyncMock(side_effect=lambda c: c.upper())):
+            events = [event async for event in service.stream_document(b"pdf", "test.pdf")]
+        
+        types = [event["type"] for event in events]
+        assert types[0] == "metadata"
+        assert types[-1] == "done"
+        assert types.count("raw_page") == 2
+        assert types.count("chunk_done") == 2
+        
+        for chunk in (e for e in events if e["type"] == "chunk_done"):
+            raw_index = next(
+                i for i, e in enumerate(events)
+                if e["type"] == "raw_page" and e["page"] == chunk["pages"][0]
+            )
+            assert raw_index < events.index(chunk)
+            assert chunk["cleaned_with_llm"] is True
+            assert chunk["content"].isupper()
+    
+    @pytest.mark.asyncio
+    async def test_stream_document_cleaning_failure_falls_back_to_raw(self):
+        """A failed chunk is replaced with its raw text instead of aborting the stream"""
+        service = DocumentProcessingService()
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', self.fake_pages), \
+             patch('config.settings.cleaning_chunk_size', 1), \
+             patch('services.VLLMService.clean_markdown_content', AsyncMock(side_effect=Exception("boom"))):
+            events = [event async for event in service.stream_document(b"pdf", "test.pdf")]
+        
+        chunks = [e for e in events if e["type"] == "chunk_done"]
+        assert len(chunks) == 2
+        assert all(not chunk["cleaned_with_llm"] for chunk in chunks)
+        assert {chunk["content"] for chunk in chunks} == {"# Page one\n", "Page two text\n"}
+        assert events[-1]["type"] == "done"
+    
+    @pytest.mark.asyncio
+    async def test_process_document_cleans_before_extraction_ends(self):
+        """The first chunk is sent to vLLM while later pages are still being extracted"""
+        service = DocumentProcessingService()
+        cleaning_started = asyncio.Event()
+        
+        async def slow_pages(self, file_content, filename):
+            yield "First page\n"
+            # Only continues once the first chunk has reached vLLM
+            await asyncio.wait_for(cleaning_started.wait(), timeout=1)
+            yield "Second page\n"
+        
+        async def fake_clean(content):
+            cleaning_started.set()
+            return content.replace("page", "PAGE")
+        
+        # The pre-cleaner holds chunks until it has seen enough pages to detect headers
+        with patch('services.PDFConverterService.iter_pdf_pages', slow_pages), \
+             patch('config.settings.cleaning_chunk_size', 1), \
+             patch('config.settings.preclean_enabled', False), \
+             patch('services.VLLMService.clean_markdown_content', AsyncMock(side_effect=fake_clean)):
+            result = await service.process_document(b"pdf", "test.pdf")
+        
+        assert result["raw_markdown"] == "First page\n\nSecond page\n"
+        assert result["cleaned_markdown"] == "First PAGE\n\nSecond PAGE\n"
+        assert result["cleaned_with_llm"] is True
+        assert result["metadata"]["page_count"] == 2
+        assert result["metadata"]["chunk_count"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_process_document_groups_pages_into_chunks(self):
+        """Small pages are grouped into a single cleaning request"""
+        service = DocumentProcessingService()
+        mock_clean = AsyncMock(side_effect=lambda c: c)
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', self.fake_pages), \
+             patch('services.VLLMService.clean_markdown_content', mock_clean):
+            result = await service.process_document(b"pdf", "test.pdf")
+        
+        mock_clean.assert_called_once_with("# Page one\n\nPage two text\n")
+        assert result["metadata"]["chunk_count"] == 1
+        assert result["cleaned_with_llm"] is False
+    
+    @pytest.mark.asyncio
+    async def test_process_document_extraction_error(self):
+        """Extraction failures propagate instead of returning an empty document"""
+        service = DocumentProcessingService()
+        
+        async def failing_pages(self, file_content, filename):
+            raise Exception("Failed to extract content from PDF")
+            yield
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', failing_pages):
+            with pytest.raises(Exception, match="Failed to extract"):
+                await service.process_document(b"pdf", "test.pdf")
+    
+    @patch('vllm_manager.vllm_manager._is_vllm_running')
+    def test_upload_stream_incremental_endpoint(self, mock_vllm_running, client):
+        """Incremental mode sends typed SSE events, metadata first"""
+        mock_vllm_running.return_value = True
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', self.fake_pages), \
+             patch('services.VLLMService.clean_markdown_content_stream_async', self.fake_token_stream):
+            response = client.post(
+                "/upload-stream?incremental=true",
+                files={"file": ("test.pdf", b"fake pdf content", "application/pdf")}
+            )
+        
+        assert response.status_code == 200
+        assert "text/event-stream" in response.headers["content-type"]
+        
+        events = parse_sse(response.text)
+        names = [name for _, name, _ in events]
+        assert names[0] == "metadata"
+        assert names[-2:] == ["stats", "done"]
+        assert [int(event_id) for event_id, _, _ in events] == list(range(1, len(events) + 1))
+        
+        payloads = [data for _, _, data in events]
+        assert payloads[0]["filename"] == "test.pdf"
+        assert [p["content"] for p in payloads if p["type"] == "raw_page"] == ["# Page one\n", "Page two text\n"]
+        assert "".join(p["content"] for p in payloads if p["type"] == "token") == "Cleaned"
+        assert names.index("chunk_done") > max(i for i, name in enumerate(names) if name == "token")
+        assert payloads[-2]["page_count"] == 2
+
+
+
+def upload_frame(conversion_id: str, payload: bytes) -> bytes:
+    """Build a binary WebSocket upload frame"""
+    encoded = conversion_id.encode()
+    return bytes([len(encoded)]) + encoded + payload
+
+
+def receive_until(websocket, event_type: str, **fields) -> list:
+    """Collect WebSocket messages up to the first of the given type"""
+    messages = []
+    while True:
+        message = websocket.receive_json()
+        messages.append(message)
+        if message["type"] == event_type and all(message.get(k) == v for k, v in fields.items()):
+            return messages
+
+
+class TestWebSocketChannel:
+    """Test the bidirectional WebSocket conversion channel"""
+
+    @pytest.fixture(autouse=True)
+    def always_clean(self):
+        """These tests exercise the vLLM path, so clean-looking chunks are not skipped"""
+        with patch('config.settings.skip_clean_enabled', False):
+            yield
+    
+    @pytest.fixture
+    def client(self):
+        return TestClient(app)
+    
+    @patch('vllm_manager.vllm_manager._is_vllm_running')
+    def test_upload_convert_and_reclean(self, mock_vllm_running, client):
+        """A chunked binary upload is converted and one chunk can be re-cleaned"""
+        mock_vllm_running.return_value = True
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', TestIncrementalStreaming.fake_pages), \
+             patch('services.VLLMService.clean_markdown_content_stream_async', TestIncrementalStreaming.fake_token_stream), \
+             client.websocket_connect("/ws/convert") as websocket:
+            websocket.send_json({"type": "start", "conversion_id": "a", "filename": "test.pdf", "size": 8})
+            assert websocket.receive_json() == {"type": "upload_progress", "received": 0, "size": 8, "conversion_id": "a"}
+            
+            websocket.send_bytes(upload_frame("a", b"fake"))
+            websocket.send_bytes(upload_frame("a", b" pdf"))
+            messages = receive_until(websocket, "done")
+            
+            websocket.send_json({"type": "reclean", "conversion_id": "a", "chunk": 0})
+            reclean = receive_until(websocket, "chunk_done", reclean=True)
+        
+        assert all(m["conversion_id"] == "a" for m in messages + reclean)
+        types = [m["type"] for m in messages]
+        assert types[:2] == ["upload_progress", "upload_progress"]
+        assert messages[1]["received"] == 8
+        assert types[2] == "metadata"
+        assert [m["content"] for m in messages if m["type"] == "raw_page"] == ["# Page one\n", "Page two text\n"]
+        assert next(m for m in messages if m["type"] == "chunk_done")["content"] == "Cleaned"
+        
+        assert reclean[-1]["pages"] == [0, 1]
+        assert reclean[-1]["content"] == "Cleaned"
+        assert "".join(m["content"] for m in reclean if m["type"] == "token") == "Cleaned"
+    
+    @patch('vllm_manager.vllm_manager._is_vllm_running')
+    def test_reclean_uses_chunk_as_sent_for_cleaning(self, mock_vllm_running, client):
+        """Re-cleaning starts from the pre-cleaned chunk, not the raw pages"""
+        mock_vllm_running.return_value = True
+        sources = []
+        
+        pages = pages_of(*(
+            f"ACME Manual\n{body}\n- {n} -\n"
+            for n, body in enumerate(["Unpack the device.", "Connect the cable.", "Switch it on."], start=1)
+        ))
+        
+        async def reclean(self, chunk_index, pages, raw_content, run_gate=None):
+            sources.append(raw_content)
+            yield {"type": "chunk_done", "chunk": chunk_index, "pages": pages, "content": raw_content}
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', pages), \
+             patch('services.VLLMService.clean_markdown_content_stream_async', TestIncrementalStreaming.fake_token_stream), \
+             patch('services.DocumentProcessingService.reclean_chunk', reclean), \
+             client.websocket_connect("/ws/convert") as websocket:
+            websocket.send_json({"type": "start", "conversion_id": "a", "filename": "test.pdf", "size": 3})
+            websocket.send_bytes(upload_frame("a", b"pdf"))
+            receive_until(websocket, "done")
+            
+            websocket.send_json({"type": "reclean", "conversion_id": "a", "chunk": 0})
+            receive_until(websocket, "chunk_done", reclean=True)
+        
+        assert len(sources) == 1
+        assert "Unpack the device." in sources[0]
+        assert "ACME Manual" not in sources[0]
+        assert "- 2 -" not in sources[0]
+    
+    def test_cancel_running_conversion(self, client):
+        """Cancelling stops extraction and is acknowledged"""
+        extraction_cancelled = asyncio.Event()
+        
+        async def endless_pages(self, file_content, filename):
+            yield "First page\n"
+            try:
+                await asyncio.sleep(3600)
+            except asyncio.CancelledError:
+                extraction_cancelled.set()
+                raise
+            yield "Never sent\n"
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', endless_pages), \
+             client.websocket_connect("/ws/convert") as websocket:
+            websocket.send_json({
+                "type": "start", "conversion_id": "b", "filename": "test.pdf",
+                "size": 3, "clean_with_llm": False
+            })
+            websocket.send_bytes(upload_frame("b", b"pdf"))
+            receive_until(websocket, "raw_page")
+            
+            websocket.send_json({"type": "cancel", "conversion_id": "b"})
+            receive_until(websocket, "cancelled")
+            
+            websocket.send_json({"type": "pause", "conversion_id": "b"})
+            error = websocket.receive_json()
+        
+        assert extraction_cancelled.is_set()
+        assert error == {"type": "error", "message": "Unknown conversion", "conversion_id": "b"}
+    
+    def test_finished_conversions_free_their_slot(self, client):
+        """A long-lived connection can run more conversions than the limit, one after another"""
+        with patch('services.PDFConverterService.iter_pdf_pages', TestIncrementalStreaming.fake_pages), \
+             patch('config.settings.websocket_max_conversions', 1), \
+             client.websocket_connect("/ws/convert") as websocket:
+            for conversion_id in ["d1", "d2", "d3"]:
+                websocket.send_json({
+                    "type": "start", "conversion_id": conversion_id, "filename": "test.pdf",
+                    "size": 3, "clean_with_llm": False
+                })
+                websocket.send_bytes(upload_frame(conversion_id, b"pdf"))
+                messages = receive_until(websocket, "done", conversion_id=conversion_id)
+                assert not any(m["type"] == "error" for m in messages)
+    
+    def test_sleeping_vllm_woken_like_upload(self, client):
+        """A conversion goes through the lifecycle preflight, which wakes a sleeping vLLM"""
+        with patch('lifecycle.vllm_lifecycle.state', "sleeping"), \
+             patch('lifecycle.vllm_lifecycle.wake_in_background') as mock_wake, \
+             patch('vllm_manager.vllm_manager._is_vllm_running', AsyncMock(return_value=False)), \
+             patch('services.PDFConverterService.iter_pdf_pages', TestIncrementalStreaming.fake_pages), \
+             patch('services.VLLMService.clean_markdown_content_stream_async', TestIncrementalStreaming.fake_token_stream), \
+             client.websocket_connect("/ws/convert") as websocket:
+            websocket.send_json({"type": "start", "conversion_id": "s", "filename": "test.pdf", "size": 3})
+            websocket.send_bytes(upload_frame("s", b"pdf"))
+            messages = receive_until(websocket, "done")
+        
+        mock_wake.assert_called_once()
+        assert not any(m["type"] == "error" for m in messages)
+    
+    def test_start_validation(self, client):
+        """Non-PDF files and oversized uploads are rejected before any data is sent"""
+        with client.websocket_connect("/ws/convert") as websocket:
+            websocket.send_json({"type": "start", "conversion_id": "c", "filename": "notes.txt", "size": 10})
+            assert websocket.receive_json()["message"] == "Only PDF files are supported"
+            
+            websocket.send_json({"type": "start", "conversion_id": "c", "filename": "big.pdf", "size": 10 ** 12})
+            assert "File size too large" in websocket.receive_json()["message"]
+            
+            websocket.send_text("not json")
+            assert websocket.receive_json()["conversion_id"] is None
+
 class TestStreamingPerformance:
     """Test streaming performance characteristics"""
     
@@ -0,0 +1,171 @@
+"""
+Tests for sizing max_tokens to each request's content and recovering truncated output
+"""
+
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+
+from services import DocumentProcessingService, TruncatedOutputError, VLLMService, split_in_half
+from tests.conftest import completion, pages_of
+
+
+async def stream_chunks(deltas: list, finish_reason: str):
+    for delta in deltas:
+        yield Mock(choices=[Mock(delta=Mock(content=delta), finish_reason=None)])
+    yield Mock(choices=[Mock(delta=Mock(content=None), finish_reason=finish_reason)])
+
+
+class TestAdaptiveTokenBudget:
+    """Test proportional budgets and retries on truncated responses"""
+    
+    @pytest.mark.asyncio
+    async def test_budget_proportional_to_content(self):
+        service = VLLMService()
+        create = AsyncMock(return_value=completion("cleaned"))
+        content = "x" * 4000  # ~1000 tokens
+        
+        with patch.object(service.async_client.chat.completions, 'create', create):
+            await service.clean_markdown_content(content)
+        
+        assert create.call_args.kwargs["max_tokens"] == 1000 * 1.2 + 128
+    
+    @pytest.mark.asyncio
+    async def test_truncated_response_continued(self):
+        """A truncated response is extended from where it stopped and stitched"""
+        service = VLLMService()
+        create = AsyncMock(side_effect=[completion("clea", "length"), completion("ned")])
+        
+        with patch.object(service.async_client.chat.completions, 'create', create):
+            result = await service.clean_markdown_content("x" * 4000)
+        
+        assert result == "cleaned"
+        first, second = create.call_args_list
+        assert [first.kwargs["max_tokens"], second.kwargs["max_tokens"]] == [1328, 1328]
+        assert second.kwargs["messages"][-1] == {"role": "assistant", "content": "clea"}
+        assert second.kwargs["extra_body"]["continue_final_message"] is True
+        assert service.truncation_stats["continuations"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_truncated_at_context_limit_raises(self):
+        service = VLLMService()
+        create = AsyncMock(return_value=completion("clea", "length"))
+        
+        with patch.object(service.async_client.chat.completions, 'create', create), \
+             patch('config.settings.vllm_max_tokens', 3000):
+            with pytest.raises(TruncatedOutputError) as excinfo:
+                await service.clean_markdown_content("x" * 4000)
+        
+        budgets = [call.kwargs["max_tokens"] for call in create.call_args_list]
+        assert budgets == [1328, 1328, 344]
+        assert excinfo.value.partial == "clea" * 3
+        assert service.truncation_stats["unrecovered"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_guided_output_regenerated_instead_of_continued(self):
+        service = VLLMService()
+        table = '{"header": ["a"], "rows": []}'
+        create = AsyncMock(side_effect=[completion('{"header": ["a', "length"), completion(table)])
+        
+        with patch.object(service.async_client.chat.completions, 'create', create):
+            assert await service.repair_table("a    b    c") == "| a |\n| --- |"
+        
+        assert create.call_args.kwargs["max_tokens"] == 2 * create.call_args_list[0].kwargs["max_tokens"]
+        assert service.truncation_stats["retries"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_stream_continued_after_truncation(self):
+        service = VLLMService()
+        streams = [
+            stream_chunks(["Hello ", "wor"], "length"),
+            stream_chunks(["ld"], "stop"),
+        ]
+        create = AsyncMock(side_effect=streams)
+        
+        with patch.object(service.async_client.chat.completions, 'create', create):
+            tokens = [t async for t in service.clean_markdown_content_stream_async("x" * 400)]
+        
+        assert "".join(tokens) == "Hello world"
+        assert create.call_args.kwargs["messages"][-1] == {"role": "assistant", "content": "Hello wor"}
+    
+    def test_sync_stream_continued_after_truncation(self):
+        """The plain-text streaming endpoints use the adaptive budget and continue cut-off output"""
+        service = VLLMService()
+        streams = [
+            iter([
+                Mock(choices=[Mock(delta=Mock(content="Hello wor"), finish_reason=None)]),
+                Mock(choices=[Mock(delta=Mock(content=None), finish_reason="length")])
+            ]),
+            iter([
+                Mock(choices=[Mock(delta=Mock(content="ld"), finish_reason=None)]),
+                Mock(choices=[Mock(delta=Mock(content=None), finish_reason="stop")])
+            ]),
+        ]
+        create = Mock(side_effect=streams)
+        
+        with patch.object(service.client.chat.completions, 'create', create):
+            tokens = list(service.clean_markdown_content_stream("x" * 4000))
+        
+        assert "".join(tokens) == "Hello world"
+        first, second = create.call_args_list
+        assert [first.kwargs["max_tokens"], second.kwargs["max_tokens"]] == [1328, 1328]
+        assert second.kwargs["messages"][-1] == {"role": "assistant", "content": "Hello wor"}
+        assert service.truncation_stats["continuations"] == 1
+        assert service.truncation_stats["unrecovered"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_disabled_uses_full_budget(self):
+        service = VLLMService()
+        create = AsyncMock(return_value=completion("cleaned"))
+        
+        with patch.object(service.async_client.chat.completions, 'create', create), \
+             patch('config.settings.adaptive_max_tokens_enabled', False):
+            await service.clean_markdown_content("short")
+        
+        assert create.call_args.kwargs["max_tokens"] == 16384
+
+
+class TestTruncatedChunks:
+    """Test recovering chunks whose responses stay truncated"""
+    
+    def test_split_in_half_prefers_paragraph_breaks(self):
+        assert split_in_half("a\nb\n\nc\nd\ne") == ("a\nb", "\nc\nd\ne")
+        assert split_in_half("a\nb\nc") == ("a", "b\nc")
+        assert split_in_half("one line") is None
+    
+    @pytest.mark.asyncio
+    async def test_truncated_chunk_is_resplit(self):
+        service = DocumentProcessingService()
+        
+        async def clean(content):
+            if "\n\n" in content:
+                raise TruncatedOutputError("truncated", content[:5])
+            return content.upper()
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', pages_of("first paragraph\n\nsecond paragraph")), \
+             patch('config.settings.skip_clean_enabled', False), \
+             patch('services.VLLMService.clean_markdown_content', AsyncMock(side_effect=clean)):
+            result = await service.process_document(b"pdf", "test.pdf")
+        
+        assert result["cleaned_markdown"] == "FIRST PARAGRAPH\n\nSECOND PARAGRAPH"
+        assert result["cleaned_with_llm"] is True
+        assert result["metadata"]["truncated_chunk_count"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_truncated_stream_falls_back_to_raw(self):
+        """A cut-off streamed chunk is replaced by its raw text and not reported as cleaned"""
+        service = DocumentProcessingService()
+        
+        async def truncated_stream(self, content):
+            yield "the wh"
+            raise TruncatedOutputError("truncated", "the wh")
+        
+        with patch('services.PDFConverterService.iter_pdf_pages', pages_of("the whole page")), \
+             patch('config.settings.skip_clean_enabled', False), \
+             patch('services.VLLMService.clean_markdown_content_stream_async', truncated_stream):
+            events = [e async for e in service.stream_document(b"pdf", "test.pdf", stream_tokens=True)]
+        
+        chunk = next(e for e in events if e["type"] == "chunk_done")
+        assert chunk["content"] == "the whole page"
+        assert chunk["truncated"] is True
+        assert chunk["cleaned_with_llm"] is False
+        assert next(e for e in events if e["type"] == "stats")["truncated_chunk_count"] == 1
@@ -0,0 +1,168 @@
+"""
+Tests for starting vLLM: single-flight startup, readiness from its output, port and GPU checks
+"""
+
+import asyncio
+import socket
+import subprocess
+import sys
+import threading
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from vllm_manager import VLLMManager
+
+
+def fake_vllm(script: str) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-c", script],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+
+
+@pytest.fixture
+def manager():
+    manager = VLLMManager()
+    # Readiness must come from vLLM's output, not from the fallback poll
+    manager.health_check_interval = 60
+    yield manager
+    if manager.process and manager.process.poll() is None:
+        manager.process.kill()
+        manager.process.wait()
+
+
+class TestSingleFlightStartup:
+    """Test that concurrent starts share one vLLM server"""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_starts_spawn_once(self, manager):
+        release = asyncio.Event()
+        
+        async def slow_start(model_name):
+            await release.wait()
+            return True
+        
+        with patch.object(manager, '_start_vllm_service', AsyncMock(side_effect=slow_start)) as mock_start:
+            waiters = [asyncio.create_task(manager.start_vllm_service()) for _ in range(10)]
+            await asyncio.sleep(0)
+            release.set()
+            results = await asyncio.gather(*waiters)
+        
+        assert results == [True] * 10
+        mock_start.assert_awaited_once()
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_abort_startup(self, manager):
+        release = asyncio.Event()
+        
+        async def slow_start(model_name):
+            await release.wait()
+            return True
+        
+        with patch.object(manager, '_start_vllm_service', AsyncMock(side_effect=slow_start)):
+            first = asyncio.create_task(manager.start_vllm_service())
+            second = asyncio.create_task(manager.start_vllm_service())
+            await asyncio.sleep(0)
+            first.cancel()
+            release.set()
+            
+            assert await second is True
+    
+    @pytest.mark.asyncio
+    async def test_next_start_after_failure_tries_again(self, manager):
+        with patch.object(manager, '_start_vllm_service', AsyncMock(side_effect=[False, True])):
+            assert await manager.start_vllm_service() is False
+            assert await manager.start_vllm_service() is True
+
+
+    @pytest.mark.asyncio
+    async def test_restart_during_startup_starts_again(self, manager):
+        """A restart abandons the hung start instead of joining it"""
+        calls = []
+        
+        async def start(model_name):
+            calls.append(model_name)
+            if len(calls) == 1:
+                # The first server never becomes ready
+                await asyncio.Event().wait()
+            return True
+        
+        with patch.object(manager, '_start_vllm_service', AsyncMock(side_effect=start)):
+            first = asyncio.create_task(manager.start_vllm_service())
+            await asyncio.sleep(0)
+            with patch('vllm_manager.asyncio.sleep', AsyncMock()):
+                assert await asyncio.wait_for(manager.restart_vllm_service(), timeout=1) is True
+            
+            assert await first is False
+        assert len(calls) == 2
+
+
+class TestReadiness:
+    """Test waking startup waiters from vLLM's output"""
+    
+    @pytest.mark.asyncio
+    async def test_ready_as_soon_as_startup_is_logged(self, manager):
+        manager.process = fake_vllm(
+            "import time; time.sleep(0.2); "
+            "print('INFO:     Application startup complete.', flush=True); time.sleep(30)"
+        )
+        ready = asyncio.Event()
+        manager._watch_output(manager.process, ready)
+        
+        async def health():
+            return any("startup complete" in line for line in manager.output_tail)
+        
+        with patch.object(manager, '_is_vllm_running', health):
+            assert await asyncio.wait_for(manager._wait_for_vllm_ready(ready), timeout=5) is True
+    
+    @pytest.mark.asyncio
+    async def test_exit_reported_without_waiting_for_timeout(self, manager):
+        manager.process = fake_vllm("import sys; print('CUDA out of memory', file=sys.stderr); sys.exit(1)")
+        ready = asyncio.Event()
+        manager._watch_output(manager.process, ready)
+        
+        with patch.object(manager, '_is_vllm_running', AsyncMock(return_value=False)):
+            assert await asyncio.wait_for(manager._wait_for_vllm_ready(ready), timeout=5) is False
+        assert "CUDA out of memory" in manager.output_tail
+
+
+class TestHostChecks:
+    """Test the port check and cached GPU detection"""
+    
+    def test_listening_port_is_in_use(self, manager):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+            server.bind(("127.0.0.1", 0))
+            server.listen()
+            port = server.getsockname()[1]
+            assert manager._is_port_in_use(port) is True
+        assert manager._is_port_in_use(port) is False
+    
+    def test_gpu_detected_once_per_ttl(self, manager):
+        with patch.object(manager, '_detect_gpu', MagicMock(return_value=True)) as mock_detect:
+            assert manager._has_gpu() is True
+            assert manager._has_gpu() is True
+            assert mock_detect.call_count == 1
+            
+            with patch('config.settings.gpu_probe_ttl', 0):
+                manager._has_gpu()
+            assert mock_detect.call_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_gpu_probed_off_the_event_loop(self, manager):
+        threads = []
+        
+        def detect():
+            threads.append(threading.current_thread())
+            return False
+        
+        with patch.object(manager, '_detect_gpu', detect):
+            assert await manager.probe_gpu() is False
+        assert len(threads) == 1 and threads[0] is not threading.main_thread()
+    
+    @pytest.mark.asyncio
+    async def test_status_reports_gpu_without_detecting(self, manager):
+        with patch.object(manager, '_detect_gpu', MagicMock(return_value=True)):
+            assert manager.get_vllm_status()["gpu_available"] is None
+            await manager._gpu_refresh
+            assert manager.get_vllm_status()["gpu_available"] is True
@@ -1,18 +1,51 @@
 import asyncio
+import json
 import logging
 import os
 import signal
+import socket
 import subprocess
+import threading
 import time
-import psutil
-from typing import Optional
+from collections import deque
+from typing import Dict, IO, Optional
 import httpx
 
 from config import settings
+from process_monitor import ProcessSampler
 
 logger = logging.getLogger(__name__)
 
 
+def parse_prometheus_metrics(text: str) -> Dict[str, float]:
+    """
+    Parse Prometheus text exposition into metric totals
+    
+    Samples of the same metric with different labels are summed.
+    
+    Args:
+        text: Body of a ``/metrics`` response
+        
+    Returns:
+        Mapping of metric name to summed value
+    """
+    totals: Dict[str, float] = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        try:
+            name_and_labels, value = line.rsplit(" ", 1)
+            name = name_and_labels.split("{", 1)[0].strip()
+            totals[name] = totals.get(name, 0.0) + float(value)
+        except ValueError:
+            continue
+    return totals
+
+
+# Lines vLLM's API server logs once it accepts requests
+READY_LOG_MARKERS = ("Application startup complete", "Uvicorn running on")
+
+
 class VLLMManager:
     """Manager for vLLM service lifecycle"""
     
@@ -20,7 +53,14 @@ class VLLMManager:
         self.process: Optional[subprocess.Popen] = None
         self.vllm_port = self._extract_port_from_url(settings.vllm_base_url)
         self.startup_timeout = settings.vllm_startup_timeout
-        self.health_check_interval = 5  # seconds
+        self.health_check_interval = 5  # seconds, fallback when vLLM's log shows nothing
+        self.output_tail = deque(maxlen=50)  # Last lines vLLM printed, for startup errors
+        self._startup: Optional[asyncio.Task] = None
+        self._startup_model: Optional[str] = None
+        self._gpu_available: Optional[bool] = None
+        self._gpu_checked_at = 0.0
+        self._gpu_refresh: Optional[asyncio.Task] = None
+        self.sampler = ProcessSampler(lambda: self.process.pid if self.process else None)
         
     def _extract_port_from_url(self, url: str) -> int:
         """Extract port from vLLM base URL"""
@@ -35,19 +75,46 @@ class VLLMManager:
         """
         Start vLLM service if not already running
         
+        Startup is single-flight: while one start is in progress, further
+        calls wait for its result instead of spawning another server. A stop
+        abandons the start in progress, so the next call starts afresh.
+        
         Args:
             model_name: Model to load (defaults to settings.vllm_model_name)
             
         Returns:
-            True if started successfully or already running
+            True if started successfully or already running, False if it
+            failed or was abandoned by a stop
         """
         model_name = model_name or settings.vllm_model_name
+        if self._startup is None or self._startup.done():
+            self._startup_model = model_name
+            self._startup = asyncio.create_task(self._start_vllm_service(model_name))
+        else:
+            if model_name != self._startup_model:
+                logger.warning(f"vLLM is already starting with {self._startup_model}, not {model_name}")
+            logger.info("vLLM service is already starting, waiting for it...")
+        startup = self._startup
+        try:
+            # Shielded so a cancelled caller does not abort a start others wait for
+            return await asyncio.shield(startup)
+        except asyncio.CancelledError:
+            if startup.cancelled() and not asyncio.current_task().cancelling():
+                logger.warning("vLLM startup was abandoned because the service was stopped")
+                return False
+            raise
+    
+    async def _start_vllm_service(self, model_name: str) -> bool:
+        """Start a vLLM server and wait until it is ready"""
         
         # Check if vLLM is already running
         if await self._is_vllm_running():
             logger.info("vLLM service is already running")
             return True
         
+        # Detect the GPU off the event loop; building the command then uses the result
+        await self.probe_gpu()
+        
         # Check if port is available
         if self._is_port_in_use(self.vllm_port):
             logger.error(f"Port {self.vllm_port} is already in use")
@@ -70,6 +137,9 @@ class VLLMManager:
                 'HF_HOME': settings.model_cache_dir,
                 'CUDA_VISIBLE_DEVICES': '0' if self._has_gpu() else '',
             })
+            if settings.vllm_idle_action == "sleep":
+                # vLLM only serves /sleep and /wake_up in development mode
+                env['VLLM_SERVER_DEV_MODE'] = '1'
             
             # Start vLLM process
             self.process = subprocess.Popen(
@@ -83,7 +153,9 @@ class VLLMManager:
             logger.info(f"vLLM process started with PID: {self.process.pid}")
             
             # Wait for vLLM to be ready
-            if await self._wait_for_vllm_ready():
+            ready = asyncio.Event()
+            self._watch_output(self.process, ready)
+            if await self._wait_for_vllm_ready(ready):
                 logger.info("vLLM service started successfully")
                 return True
             else:
@@ -108,6 +180,22 @@ class VLLMManager:
             "--trust-remote-code"
         ]
         
+        if settings.vllm_enable_prefix_caching:
+            # Cleaning prompts share a fixed prefix (see prompts.py), so its KV cache is reused
+            cmd.append("--enable-prefix-caching")
+        
+        if settings.hedging_enabled and not settings.hedging_replica_urls:
+            # Hedges to the same server are sent with a higher priority, which needs priority scheduling
+            cmd.extend(["--scheduling-policy", "priority"])
+        
+        if settings.vllm_idle_action == "sleep":
+            # Lets an idle server release GPU memory without exiting (see lifecycle.py)
+            cmd.append("--enable-sleep-mode")
+        
+        speculative_config = self._speculative_config()
+        if speculative_config:
+            cmd.extend(["--speculative-config", json.dumps(speculative_config)])
+        
         # Add GPU configuration if available
         if self._has_gpu():
             cmd.extend([
@@ -125,33 +213,152 @@ class VLLMManager:
         
         return cmd
     
-    def _has_gpu(self) -> bool:
-        """Check if GPU is available"""
+    def _speculative_config(self) -> Optional[dict]:
+        """
+        Build vLLM's speculative decoding config from settings
+        
+        Cleaning output is mostly a copy of the input, so n-gram prompt lookup
+        can propose long runs of tokens without a draft model.
+        
+        Returns:
+            Config for ``--speculative-config``, or None when speculation is off
+            
+        Raises:
+            Exception: If the method is unknown or a draft model is missing
+        """
+        method = settings.vllm_speculative_method.strip().lower()
+        if not method:
+            return None
+        
+        if method == "ngram":
+            return {
+                "method": "ngram",
+                "num_speculative_tokens": settings.vllm_num_speculative_tokens,
+                "prompt_lookup_max": settings.vllm_ngram_prompt_lookup_max,
+                "prompt_lookup_min": settings.vllm_ngram_prompt_lookup_min
+            }
+        if method == "draft":
+            if not settings.vllm_speculative_draft_model:
+                raise Exception("VLLM_SPECULATIVE_DRAFT_MODEL is required for draft model speculation")
+            return {
+                "model": settings.vllm_speculative_draft_model,
+                "num_speculative_tokens": settings.vllm_num_speculative_tokens
+            }
+        raise Exception(f"Unknown speculative decoding method: {settings.vllm_speculative_method}")
+    
+    def _detect_gpu(self) -> bool:
+        """Check if GPU is available (slow: imports torch and initializes CUDA)"""
         try:
             import torch
             return torch.cuda.is_available() and torch.cuda.device_count() > 0
         except ImportError:
             return False
     
+    def _gpu_is_stale(self) -> bool:
+        return self._gpu_available is None or time.monotonic() - self._gpu_checked_at >= settings.gpu_probe_ttl
+    
+    async def probe_gpu(self) -> bool:
+        """Detect the GPU in a worker thread unless the last result is younger than gpu_probe_ttl"""
+        if self._gpu_is_stale():
+            self._gpu_available = await asyncio.to_thread(self._detect_gpu)
+            self._gpu_checked_at = time.monotonic()
+        return self._gpu_available
+    
+    def _has_gpu(self) -> bool:
+        """Check if GPU is available, reusing the result for gpu_probe_ttl seconds"""
+        if self._gpu_is_stale():
+            self._gpu_available = self._detect_gpu()
+            self._gpu_checked_at = time.monotonic()
+        return self._gpu_available
+    
+    def _cached_gpu(self) -> Optional[bool]:
+        """
+        Last GPU detection result, without detecting on the caller's thread
+        
+        A stale or missing result is refreshed in the background, so status
+        endpoints never wait for torch.
+        
+        Returns:
+            Whether a GPU was detected, or None if detection has not finished yet
+        """
+        if self._gpu_is_stale() and (self._gpu_refresh is None or self._gpu_refresh.done()):
+            try:
+                self._gpu_refresh = asyncio.get_running_loop().create_task(self.probe_gpu())
+            except RuntimeError:
+                pass  # No running event loop to refresh from
+        return self._gpu_available
+    
     def _is_port_in_use(self, port: int) -> bool:
-        """Check if port is already in use"""
-        for conn in psutil.net_connections():
-            if conn.laddr.port == port:
+        """
+        Check if port is already in use
+        
+        Binds the port the way vLLM will, which fails if any socket on this
+        host listens on it, without listing every connection on the host.
+        """
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                sock.bind(("0.0.0.0", port))
+            except OSError:
                 return True
         return False
     
-    async def _wait_for_vllm_ready(self) -> bool:
-        """Wait for vLLM service to be ready"""
+    def _watch_output(self, process: subprocess.Popen, ready: asyncio.Event) -> None:
+        """
+        Drain vLLM's output in background threads, setting ``ready`` when it reports startup or exits
+        
+        Reading the pipes also keeps a chatty vLLM from blocking on a full pipe buffer.
+        """
+        loop = asyncio.get_running_loop()
+        self.output_tail.clear()
+        for pipe in (process.stdout, process.stderr):
+            if pipe is not None:
+                threading.Thread(
+                    target=self._drain_output, args=(process, pipe, loop, ready), daemon=True
+                ).start()
+    
+    def _drain_output(self, process: subprocess.Popen, pipe: IO[bytes],
+                      loop: asyncio.AbstractEventLoop, ready: asyncio.Event) -> None:
+        def notify():
+            try:
+                loop.call_soon_threadsafe(ready.set)
+            except RuntimeError:
+                pass  # Event loop already closed
+        
+        for raw_line in iter(pipe.readline, b""):
+            line = raw_line.decode(errors="replace").rstrip()
+            self.output_tail.append(line)
+            if any(marker in line for marker in READY_LOG_MARKERS):
+                notify()
+        # End of output: the process is exiting; reap it so the waiter sees its exit code
+        process.wait()
+        notify()
+    
+    async def _wait_for_vllm_ready(self, ready: Optional[asyncio.Event] = None) -> bool:
+        """
+        Wait for vLLM service to be ready
+        
+        Readiness is checked as soon as ``ready`` is set (vLLM logged its
+        startup or exited), and every ``health_check_interval`` seconds in
+        case its log format differs.
+        
+        Args:
+            ready: Event set by the output watcher, if any
+            
+        Returns:
+            True once vLLM answers health checks, False if it exited or timed out
+        """
+        ready = ready or asyncio.Event()
         start_time = time.time()
+        last_progress_log = start_time
         logger.info(f"Waiting for vLLM to be ready (timeout: {self.startup_timeout}s)...")
         
         while time.time() - start_time < self.startup_timeout:
             if self.process and self.process.poll() is not None:
                 # Process has terminated
-                stdout, stderr = self.process.communicate()
-                logger.error(f"vLLM process terminated unexpectedly")
-                logger.error(f"STDOUT: {stdout.decode()}")
-                logger.error(f"STDERR: {stderr.decode()}")
+                logger.error(f"vLLM process terminated unexpectedly (exit code {self.process.returncode})")
+                if self.output_tail:
+                    logger.error("vLLM output:\n" + "\n".join(self.output_tail))
                 return False
             
             if await self._is_vllm_running():
@@ -160,11 +367,16 @@ class VLLMManager:
                 return True
             
             # Log progress every 30 seconds
-            elapsed = time.time() - start_time
-            if int(elapsed) % 30 == 0:
-                logger.info(f"Still waiting for vLLM... ({elapsed:.0f}s elapsed)")
+            if time.time() - last_progress_log >= 30:
+                last_progress_log = time.time()
+                logger.info(f"Still waiting for vLLM... ({last_progress_log - start_time:.0f}s elapsed)")
             
-            await asyncio.sleep(self.health_check_interval)
+            remaining = self.startup_timeout - (time.time() - start_time)
+            try:
+                await asyncio.wait_for(ready.wait(), timeout=max(0.0, min(self.health_check_interval, remaining)))
+            except asyncio.TimeoutError:
+                pass
+            ready.clear()
         
         logger.error(f"vLLM failed to start within {self.startup_timeout} seconds")
         return False
@@ -178,8 +390,104 @@ class VLLMManager:
         except Exception:
             return False
     
+    async def get_prefix_cache_metrics(self) -> dict:
+        """
+        Scrape vLLM's Prometheus metrics for prefix cache usage
+        
+        Newer vLLM versions export query and hit counters (in tokens); older
+        ones export a hit rate gauge. Whichever is available is reported.
+        
+        Returns:
+            Dictionary with ``hit_rate`` and, when available, ``queries`` and ``hits``
+        """
+        try:
+            async with httpx.AsyncClient(timeout=5.0) as client:
+                response = await client.get(f"{settings.vllm_base_url}/metrics")
+                response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"Could not scrape vLLM metrics: {e}")
+            return {"available": False, "error": str(e)}
+        
+        metrics = parse_prometheus_metrics(response.text)
+        queries = metrics.get("vllm:prefix_cache_queries_total", metrics.get("vllm:gpu_prefix_cache_queries_total"))
+        hits = metrics.get("vllm:prefix_cache_hits_total", metrics.get("vllm:gpu_prefix_cache_hits_total"))
+        
+        if queries is not None and hits is not None:
+            return {
+                "available": True,
+                "queries": int(queries),
+                "hits": int(hits),
+                "hit_rate": round(hits / queries, 4) if queries else 0.0
+            }
+        if "vllm:gpu_prefix_cache_hit_rate" in metrics:
+            return {"available": True, "hit_rate": round(metrics["vllm:gpu_prefix_cache_hit_rate"], 4)}
+        return {"available": False, "error": "vLLM does not export prefix cache metrics"}
+    
+    async def get_request_load(self) -> Optional[int]:
+        """
+        Scrape vLLM's Prometheus metrics for the number of running and waiting requests
+        
+        Returns:
+            Running plus waiting requests, or None if the metrics are unavailable
+        """
+        try:
+            async with httpx.AsyncClient(timeout=5.0) as client:
+                response = await client.get(f"{settings.vllm_base_url}/metrics")
+                response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"Could not scrape vLLM metrics: {e}")
+            return None
+        
+        metrics = parse_prometheus_metrics(response.text)
+        return int(metrics.get("vllm:num_requests_running", 0) + metrics.get("vllm:num_requests_waiting", 0))
+    
+    async def sleep_vllm_service(self, level: int = 1) -> bool:
+        """
+        Put vLLM to sleep, releasing GPU memory while the process keeps running
+        
+        Needs a server started with ``--enable-sleep-mode``.
+        
+        Args:
+            level: 1 offloads model weights to CPU memory, 2 discards them
+            
+        Returns:
+            True if vLLM went to sleep
+        """
+        logger.info(f"Putting vLLM service to sleep (level {level})...")
+        try:
+            async with httpx.AsyncClient(timeout=60.0) as client:
+                response = await client.post(f"{settings.vllm_base_url}/sleep", params={"level": level})
+                response.raise_for_status()
+                return True
+        except Exception as e:
+            logger.error(f"Failed to put vLLM service to sleep: {e}")
+            return False
+    
+    async def wake_vllm_service(self) -> bool:
+        """Wake vLLM from sleep, reloading weights and KV cache to GPU memory"""
+        logger.info("Waking vLLM service...")
+        try:
+            async with httpx.AsyncClient(timeout=float(self.startup_timeout)) as client:
+                response = await client.post(f"{settings.vllm_base_url}/wake_up")
+                response.raise_for_status()
+                return True
+        except Exception as e:
+            logger.error(f"Failed to wake vLLM service: {e}")
+            return False
+    
+    async def abandon_startup(self) -> None:
+        """Cancel a start that is still in progress, so the next start does not join it"""
+        startup = self._startup
+        if startup is not None and not startup.done() and startup is not asyncio.current_task():
+            # Otherwise the next start would wait out the startup timeout of the old one
+            startup.cancel()
+            await asyncio.wait([startup])
+        self._startup = None
+    
     async def stop_vllm_service(self) -> bool:
-        """Stop vLLM service gracefully"""
+        """Stop vLLM service gracefully, abandoning a start that is still in progress"""
+        await self.abandon_startup()
+        
         if not self.process:
             logger.info("No vLLM process to stop")
             return True
@@ -217,27 +525,29 @@ class VLLMManager:
         return await self.start_vllm_service(model_name)
     
     def get_vllm_status(self) -> dict:
-        """Get current status of vLLM service"""
+        """Get current status of vLLM service, with resource usage from the latest sample"""
         status = {
             "process_running": self.process is not None and self.process.poll() is None,
             "process_pid": self.process.pid if self.process else None,
             "port": self.vllm_port,
             "model": settings.vllm_model_name,
             "auto_start_enabled": settings.vllm_auto_start,
-            "gpu_available": self._has_gpu()
+            "speculative_method": settings.vllm_speculative_method or None,
+            "gpu_available": self._cached_gpu()
         }
         
-        if self.process:
-            try:
-                proc = psutil.Process(self.process.pid)
-                status.update({
-                    "memory_usage_mb": round(proc.memory_info().rss / 1024 / 1024, 1),
-                    "cpu_percent": round(proc.cpu_percent(), 1),
-                    "create_time": proc.create_time(),
-                    "status": proc.status()
-                })
-            except psutil.NoSuchProcess:
-                status["process_running"] = False
+        # Resource usage comes from the background sampler, not from querying the process here
+        sample = self.sampler.latest()
+        if sample is not None:
+            status.update({
+                "memory_usage_mb": sample.rss_mb,
+                "cpu_percent": sample.cpu_percent,
+                "gpu_memory_mb": sample.gpu_memory_mb,
+                "open_fds": sample.open_fds,
+                "threads": sample.threads,
+                "status": sample.status,
+                "sampled_at": sample.timestamp
+            })
         
         return status
     
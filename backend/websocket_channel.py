@@ -0,0 +1,258 @@
+import asyncio
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+from fastapi import WebSocket
+
+from config import settings
+from lifecycle import vllm_lifecycle
+from services import DocumentProcessingService
+from streaming import coalesce_events
+
+logger = logging.getLogger(__name__)
+
+
+class Conversion:
+    """State of one conversion multiplexed over a WebSocket connection"""
+    
+    def __init__(self, conversion_id: str, filename: str, size: int, clean_with_llm: bool):
+        self.conversion_id = conversion_id
+        self.filename = filename
+        self.size = size
+        self.clean_with_llm = clean_with_llm
+        self.data = bytearray()
+        self.task: Optional[asyncio.Task] = None
+        self.chunk_pages: Dict[int, list] = {}
+        # Text of every chunk as it was sent for cleaning, i.e. after pre-cleaning
+        self.chunk_sources: Dict[int, str] = {}
+        self.reclean_tasks: Dict[int, asyncio.Task] = {}
+        # Cleared while the conversion is paused
+        self.run_gate = asyncio.Event()
+        self.run_gate.set()
+    
+    @property
+    def upload_complete(self) -> bool:
+        return len(self.data) >= self.size
+    
+    @property
+    def active(self) -> bool:
+        """Whether the conversion is still uploading, converting or re-cleaning"""
+        return self.task is None or any(not task.done() for task in self.tasks)
+    
+    @property
+    def tasks(self) -> List[asyncio.Task]:
+        return [task for task in [self.task, *self.reclean_tasks.values()] if task is not None]
+    
+    def cancel(self) -> None:
+        """Cancel the conversion and any re-cleaning in progress"""
+        for task in self.tasks:
+            if not task.done():
+                task.cancel()
+
+
+class ConversionChannel:
+    """
+    One WebSocket connection carrying several conversions at once
+    
+    Control messages are JSON text frames with a ``type`` and a client-chosen
+    ``conversion_id``:
+    
+    - ``start``: ``filename``, ``size`` (bytes) and optional ``clean_with_llm``;
+      at most ``websocket_max_conversions`` may be uploading or running at once
+    - ``pause`` / ``resume``: stop or continue extraction and generation
+    - ``cancel``: abort the conversion
+    - ``reclean``: clean one finished chunk again (``chunk``)
+    
+    File data is sent in binary frames: one byte with the length of the
+    conversion id, the UTF-8 conversion id, then the payload. Processing starts
+    once ``size`` bytes have arrived. Every server message is a JSON text frame
+    carrying the ``conversion_id`` plus the same event types as the incremental
+    upload stream, along with ``upload_progress``, ``paused``, ``resumed`` and
+    ``cancelled`` acknowledgements.
+    """
+    
+    def __init__(self, websocket: WebSocket, service: DocumentProcessingService):
+        self.websocket = websocket
+        self.service = service
+        self.conversions: Dict[str, Conversion] = {}
+        self._send_lock = asyncio.Lock()
+    
+    async def run(self) -> None:
+        """Serve the connection until the client disconnects"""
+        await self.websocket.accept()
+        
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                
+                if message.get("bytes") is not None:
+                    await self._handle_upload_frame(message["bytes"])
+                elif message.get("text") is not None:
+                    await self._handle_control_message(message["text"])
+        finally:
+            for conversion in self.conversions.values():
+                conversion.cancel()
+            logger.info(f"WebSocket channel closed ({len(self.conversions)} conversions)")
+    
+    async def send(self, conversion_id: Optional[str], event: Dict[str, Any]) -> None:
+        """Send one event to the client, tagged with its conversion id"""
+        async with self._send_lock:
+            await self.websocket.send_text(
+                json.dumps({**event, "conversion_id": conversion_id}, ensure_ascii=False)
+            )
+    
+    async def _send_error(self, conversion_id: Optional[str], message: str) -> None:
+        await self.send(conversion_id, {"type": "error", "message": message})
+    
+    async def _handle_control_message(self, text: str) -> None:
+        """Dispatch a JSON control message"""
+        try:
+            message = json.loads(text)
+            message_type = message["type"]
+            conversion_id = str(message["conversion_id"])
+        except (ValueError, KeyError, TypeError):
+            await self._send_error(None, "Control messages must be JSON with type and conversion_id")
+            return
+        
+        if message_type == "start":
+            await self._start_upload(conversion_id, message)
+            return
+        
+        conversion = self.conversions.get(conversion_id)
+        if conversion is None:
+            await self._send_error(conversion_id, "Unknown conversion")
+            return
+        
+        if message_type == "pause":
+            conversion.run_gate.clear()
+            await self.send(conversion_id, {"type": "paused"})
+        elif message_type == "resume":
+            conversion.run_gate.set()
+            await self.send(conversion_id, {"type": "resumed"})
+        elif message_type == "cancel":
+            conversion.cancel()
+            del self.conversions[conversion_id]
+            # Acknowledge only once nothing more will be sent for this conversion
+            await asyncio.gather(*conversion.tasks, return_exceptions=True)
+            await self.send(conversion_id, {"type": "cancelled"})
+        elif message_type == "reclean":
+            await self._start_reclean(conversion, message.get("chunk"))
+        else:
+            await self._send_error(conversion_id, f"Unknown message type: {message_type}")
+    
+    async def _start_upload(self, conversion_id: str, message: Dict[str, Any]) -> None:
+        """Validate a ``start`` message and register the conversion"""
+        filename = str(message.get("filename", ""))
+        size = message.get("size")
+        max_size = settings.max_file_size_mb * 1024 * 1024
+        
+        if conversion_id in self.conversions:
+            await self._send_error(conversion_id, "Conversion id is already in use")
+        elif sum(conversion.active for conversion in self.conversions.values()) >= settings.websocket_max_conversions:
+            await self._send_error(
+                conversion_id,
+                f"Too many conversions on this connection (max {settings.websocket_max_conversions})"
+            )
+        elif not filename.lower().endswith('.pdf'):
+            await self._send_error(conversion_id, "Only PDF files are supported")
+        elif not isinstance(size, int) or size <= 0:
+            await self._send_error(conversion_id, "size must be a positive number of bytes")
+        elif size > max_size:
+            await self._send_error(
+                conversion_id,
+                f"File size too large. Maximum size is {settings.max_file_size_mb}MB"
+            )
+        else:
+            self.conversions[conversion_id] = Conversion(
+                conversion_id, filename, size, bool(message.get("clean_with_llm", True))
+            )
+            await self.send(conversion_id, {"type": "upload_progress", "received": 0, "size": size})
+    
+    async def _handle_upload_frame(self, frame: bytes) -> None:
+        """Append a binary upload frame to its conversion"""
+        id_length = frame[0] if frame else 0
+        conversion_id = frame[1:1 + id_length].decode('utf-8', errors='replace')
+        conversion = self.conversions.get(conversion_id)
+        
+        if conversion is None or conversion.task is not None:
+            await self._send_error(conversion_id, "No upload in progress for this conversion")
+            return
+        
+        conversion.data.extend(frame[1 + id_length:])
+        if len(conversion.data) > conversion.size:
+            conversion.cancel()
+            del self.conversions[conversion_id]
+            await self._send_error(conversion_id, "Received more data than the declared size")
+            return
+        
+        await self.send(conversion_id, {
+            "type": "upload_progress",
+            "received": len(conversion.data),
+            "size": conversion.size
+        })
+        
+        if conversion.upload_complete:
+            conversion.task = asyncio.create_task(self._run_conversion(conversion))
+    
+    async def _run_conversion(self, conversion: Conversion) -> None:
+        """Process an uploaded document and forward its events"""
+        conversion_id = conversion.conversion_id
+        try:
+            # Wakes or starts vLLM in the background like /upload; chunks wait for it when sent
+            if conversion.clean_with_llm and not await vllm_lifecycle.preflight():
+                await self._send_error(conversion_id, "vLLM service is not available")
+                return
+            
+            logger.info(f"Processing WebSocket upload: {conversion.filename} ({conversion.size} bytes)")
+            events = self.service.stream_document(
+                bytes(conversion.data),
+                conversion.filename,
+                conversion.clean_with_llm,
+                stream_tokens=True,
+                run_gate=conversion.run_gate,
+                chunk_sources=conversion.chunk_sources
+            )
+            async for event in coalesce_events(events, settings.stream_flush_interval_ms / 1000, settings.stream_flush_size):
+                if event["type"] == "chunk_done":
+                    conversion.chunk_pages[event["chunk"]] = event["pages"]
+                await self.send(conversion_id, event)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"WebSocket conversion {conversion_id} failed: {e}")
+            await self._send_error(conversion_id, str(e))
+        finally:
+            # Only the chunk maps are needed for re-cleaning
+            conversion.data = bytearray()
+    
+    async def _start_reclean(self, conversion: Conversion, chunk: Any) -> None:
+        """Start re-cleaning one finished chunk of a conversion"""
+        conversion_id = conversion.conversion_id
+        pages = conversion.chunk_pages.get(chunk) if isinstance(chunk, int) else None
+        
+        if pages is None:
+            await self._send_error(conversion_id, f"Chunk {chunk} has not been cleaned yet")
+            return
+        if chunk in conversion.reclean_tasks and not conversion.reclean_tasks[chunk].done():
+            await self._send_error(conversion_id, f"Chunk {chunk} is already being re-cleaned")
+            return
+        
+        conversion.reclean_tasks[chunk] = asyncio.create_task(
+            self._run_reclean(conversion, chunk, pages, conversion.chunk_sources[chunk])
+        )
+    
+    async def _run_reclean(self, conversion: Conversion, chunk: int, pages: list, raw_content: str) -> None:
+        """Forward the events of a single-chunk re-clean"""
+        events = self.service.reclean_chunk(chunk, pages, raw_content, conversion.run_gate)
+        try:
+            async for event in coalesce_events(events, settings.stream_flush_interval_ms / 1000, settings.stream_flush_size):
+                await self.send(conversion.conversion_id, {**event, "reclean": True})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Re-cleaning chunk {chunk} of {conversion.conversion_id} failed: {e}")
+            await self._send_error(conversion.conversion_id, str(e))
+    
\ No newline at end of file